@@ -26,6 +26,8 @@ class EmailBackEnd(ModelBackend):
     def get_user(self, user_id):
         UserModel = get_user_model()
         try:
-            return UserModel.objects.get(pk=user_id)
+            user = UserModel.objects.get(pk=user_id)
         except UserModel.DoesNotExist:
             return None
+        # Loaded fresh on every request, so a deactivated user is logged out at once
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,64 @@
+"""
+Role-based access to the module URLs. ROLE_POLICY names the user types
+allowed under each URL prefix; route_roles() walks the URL configuration
+once into a table of full route -> allowed user types, so AccessMiddleware
+decides every request with one dictionary lookup on
+request.resolver_match.route. Every view under a prefix is covered,
+including the AJAX endpoints that carry no decorator of their own.
+
+Denials are counted per route in Django's cache, like the dashboard
+statistics counters, so with a shared cache they cover every worker.
+"""
+from django.core.cache import cache
+from django.urls import URLResolver, get_resolver
+
+HOD, STAFF, STUDENT, ACCOUNTANT, MANAGEMENT = 1, 2, 3, 4, 5
+
+# URL prefix -> user types allowed on every route under it
+ROLE_POLICY = {
+    'hod/': frozenset({HOD}),
+    'staff/': frozenset({STAFF}),
+    'student/': frozenset({STUDENT}),
+    'accountant/': frozenset({HOD, ACCOUNTANT}),
+    'management/': frozenset({MANAGEMENT}),
+}
+
+DENIED_KEY = 'access_denied:{route}'
+
+
+def _routes(patterns, prefix=''):
+    """(full route, pattern) for every URL pattern below patterns"""
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _routes(pattern.url_patterns, route)
+        else:
+            yield route, pattern
+
+
+def route_roles(urlconf=None):
+    """Full route -> allowed user types for every route ROLE_POLICY covers"""
+    table = {}
+    for route, pattern in _routes(get_resolver(urlconf).url_patterns):
+        for prefix, roles in ROLE_POLICY.items():
+            if route.startswith(prefix):
+                table[route] = roles
+                break
+    return table
+
+
+def count_denial(route):
+    # add() is a no-op if the counter exists; incr() is atomic on shared caches
+    key = DENIED_KEY.format(route=route)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def denial_counts(routes):
+    """{ route: denials } for the routes that have been denied at least once"""
+    keys = {DENIED_KEY.format(route=route): route for route in routes}
+    counts = cache.get_many(keys)
+    return {keys[key]: count for key, count in sorted(counts.items()) if count}
@@ -4,7 +4,7 @@ from .models import (
     CustomUser, Course, Staff, Subject, Student,
     Attendance, Attendance_Report, Student_Result, Student_Notification,
     Staff_Notification, Student_leave, Staff_leave, Student_Feedback,
-    Staff_Feedback, Enquiry, News, BusStop
+    Staff_Feedback, Enquiry, News, BusStop, AttendanceSummary, PdfJob, ImportJob
 )
 
 
@@ -64,6 +64,12 @@ class AttendanceReportAdmin(admin.ModelAdmin):
     search_fields = ('student__admin__first_name', 'student__admin__last_name')
 
 
+class AttendanceSummaryAdmin(admin.ModelAdmin):
+    list_display = ('student', 'course', 'month', 'present_count', 'absent_count', 'informed_leave_count')
+    list_filter = ('course', 'month')
+    search_fields = ('student__admin__first_name', 'student__admin__last_name')
+
+
 class StudentResultAdmin(admin.ModelAdmin):
     list_display = ('student', 'subject', 'ce_marks', 'te_marks', 'get_total')
     list_filter = ('subject__course',)
@@ -85,6 +91,20 @@ class NewsAdmin(admin.ModelAdmin):
     search_fields = ('title', 'content')
 
 
+class PdfJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'kind', 'status', 'requested_by', 'created_at', 'render_seconds')
+    list_filter = ('kind', 'status')
+    search_fields = ('filename', 'token')
+    readonly_fields = ('token', 'created_at', 'started_at', 'finished_at', 'render_seconds')
+
+
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('filename', 'kind', 'status', 'total_rows', 'created_rows', 'failed_rows', 'requested_by', 'created_at')
+    list_filter = ('kind', 'status')
+    search_fields = ('filename', 'token')
+    readonly_fields = ('token', 'created_at', 'started_at', 'finished_at')
+
+
 # Register models
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Course, CourseAdmin)
@@ -95,6 +115,7 @@ admin.site.register(Student, StudentAdmin)
 admin.site.register(BusStop)
 admin.site.register(Attendance, AttendanceAdmin)
 admin.site.register(Attendance_Report, AttendanceReportAdmin)
+admin.site.register(AttendanceSummary, AttendanceSummaryAdmin)
 admin.site.register(Student_Result, StudentResultAdmin)
 admin.site.register(Student_Notification)
 admin.site.register(Staff_Notification)
@@ -104,3 +125,5 @@ admin.site.register(Student_Feedback)
 admin.site.register(Staff_Feedback)
 admin.site.register(Enquiry, EnquiryAdmin)
 admin.site.register(News, NewsAdmin)
+admin.site.register(PdfJob, PdfJobAdmin)
+admin.site.register(ImportJob, ImportJobAdmin)
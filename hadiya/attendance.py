@@ -0,0 +1,411 @@
+"""
+Attendance helpers shared by the HOD, Staff and Student views: saving roll
+calls, keeping the monthly AttendanceSummary rollup in step, building the
+attendance reports from it, and the values() rows the AJAX pages list.
+"""
+import calendar
+import datetime
+
+from django.db import transaction
+from django.db.models import Case, Count, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat, TruncMonth
+from django.utils import timezone
+
+from hadiya.models import Attendance, Attendance_Report, AttendanceSummary, CustomUser, Student
+
+
+def _as_date(value):
+    """Accept a date or a YYYY-MM-DD string as posted by the forms"""
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def _next_month(value):
+    """First day of the month after value"""
+    return value.replace(day=1) + datetime.timedelta(days=calendar.monthrange(value.year, value.month)[1])
+
+
+def period_bounds(filter_type, start_date=None, end_date=None, month=None, year=None):
+    """
+    Turn the report filters into an inclusive (start, end) date range.
+    Either bound is None when the period is open on that side.
+    """
+    if filter_type == "day":
+        day = _as_date(start_date)
+        return day, day
+    elif filter_type == "weekly":
+        date_obj = _as_date(start_date)
+        week_start = date_obj - datetime.timedelta(days=date_obj.weekday())
+        return week_start, week_start + datetime.timedelta(days=6)
+    elif filter_type == "month":
+        month_start = datetime.date(int(year), int(month), 1)
+        return month_start, _next_month(month_start) - datetime.timedelta(days=1)
+    elif filter_type == "year":
+        return datetime.date(int(year), 1, 1), datetime.date(int(year), 12, 31)
+    elif filter_type == "range":
+        return _as_date(start_date), _as_date(end_date)
+    elif filter_type == "till_today":
+        return None, datetime.date.today()
+    return None, None
+
+
+def _date_filter(start, end, field='attendance_date'):
+    """Q object for an inclusive, possibly open-ended date range"""
+    q = Q()
+    if start is not None:
+        q &= Q(**{f'{field}__gte': start})
+    if end is not None:
+        q &= Q(**{f'{field}__lte': end})
+    return q
+
+
+def _split_period(start, end):
+    """
+    Split [start, end] into whole months, returned as a half-open
+    [first, stop) range of month starts, and the partial-month date ranges
+    left over at either edge. Returns (None, [...]) when no month is whole.
+    """
+    first = stop = None
+    if start is not None:
+        first = start if start.day == 1 else _next_month(start)
+    if end is not None:
+        stop = _next_month(end)
+        if stop - datetime.timedelta(days=1) != end:
+            stop = end.replace(day=1)
+    if first is not None and stop is not None and first >= stop:
+        return None, [(start, end)]
+
+    partial = []
+    if start is not None and start < first:
+        partial.append((start, first - datetime.timedelta(days=1)))
+    if end is not None and stop <= end:
+        partial.append((stop, end))
+    return (first, stop), partial
+
+
+def _report_counts(reports, *group_by):
+    """Group Attendance_Report rows per student and course, counting each status"""
+    return reports.values('student', 'attendance__course', *group_by).annotate(
+        present=Count('id', filter=Q(is_present=True)),
+        absent=Count('id', filter=Q(is_present=False)),
+        informed_leave=Count('id', filter=Q(is_present=False, leave_status='Informed')),
+    ).order_by()
+
+
+def attendance_counts(courses, start=None, end=None):
+    """
+    Present/absent/informed-leave counts per (student id, course id) between
+    start and end. Whole months are read from AttendanceSummary; only the
+    partial months at the edges of the period touch Attendance_Report.
+    """
+    counts = {}
+
+    def add(key, present, absent, informed_leave):
+        row = counts.setdefault(key, {'present': 0, 'absent': 0, 'informed_leave': 0})
+        row['present'] += present or 0
+        row['absent'] += absent or 0
+        row['informed_leave'] += informed_leave or 0
+
+    months, partial = _split_period(start, end)
+
+    if months is not None:
+        first, stop = months
+        summary = AttendanceSummary.objects.filter(course__in=courses)
+        if first is not None:
+            summary = summary.filter(month__gte=first)
+        if stop is not None:
+            summary = summary.filter(month__lt=stop)
+        for row in summary.values('student', 'course').annotate(
+            present=Sum('present_count'),
+            absent=Sum('absent_count'),
+            informed_leave=Sum('informed_leave_count'),
+        ).order_by():
+            add((row['student'], row['course']), row['present'], row['absent'], row['informed_leave'])
+
+    if partial:
+        edges = Q()
+        for edge_start, edge_end in partial:
+            edges |= _date_filter(edge_start, edge_end)
+        reports = Attendance_Report.objects.filter(
+            attendance__in=Attendance.objects.filter(edges, course__in=courses)
+        )
+        for row in _report_counts(reports):
+            add((row['student'], row['attendance__course']), row['present'], row['absent'], row['informed_leave'])
+
+    return counts
+
+
+def working_days(courses, start=None, end=None):
+    """Number of attendance days per course id between start and end"""
+    attendance_query = Attendance.objects.filter(_date_filter(start, end), course__in=courses)
+    return dict(
+        attendance_query.order_by().values('course').annotate(days=Count('id')).values_list('course', 'days')
+    )
+
+
+def _students_by_course(courses):
+    students_by_course = {}
+    for student in Student.objects.filter(course_id__in=courses).select_related('admin').order_by('id'):
+        students_by_course.setdefault(student.course_id_id, []).append(student)
+    return students_by_course
+
+
+def get_attendance_report(courses, filter_type=None, start_date=None, end_date=None, month=None, year=None):
+    """
+    Present/absent/percentage for every student of the given courses.
+
+    Returns a list of { course_name: "", data: [] } in course order, the shape
+    the attendance report pages expect.
+    """
+    start, end = period_bounds(filter_type, start_date, end_date, month, year)
+    total_days_map = working_days(courses, start, end)
+    counts_map = attendance_counts(courses, start, end)
+    students_by_course = _students_by_course(courses)
+
+    final_data = []
+    for course in courses:
+        total_days = total_days_map.get(course.id, 0)
+
+        course_student_data = []
+        for student in students_by_course.get(course.id, []):
+            counts = counts_map.get((student.id, course.id), {})
+            present_count = counts.get('present', 0)
+            absent_count = counts.get('absent', 0)
+            percentage = (present_count / total_days * 100) if total_days > 0 else 0
+
+            course_student_data.append({
+                "name": f"{student.admin.first_name} {student.admin.last_name}",
+                "total_days": total_days,
+                "present": present_count,
+                "absent": absent_count,
+                "percentage": round(percentage, 2)
+            })
+
+        final_data.append({
+            "course_name": course.name,
+            "data": course_student_data
+        })
+
+    return final_data
+
+
+def get_attendance_analysis(courses, analysis_type, threshold, status_labels, start_date=None, end_date=None):
+    """
+    Students whose attendance percentage is below (or at/above) threshold.
+
+    status_labels maps 'below'/'above' to the status text shown for a match.
+    Results are sorted worst first for 'below' and best first for 'above'.
+    """
+    if start_date and end_date:
+        start, end = _as_date(start_date), _as_date(end_date)
+    else:
+        start = end = None
+    total_days_map = working_days(courses, start, end)
+    counts_map = attendance_counts(courses, start, end)
+    students_by_course = _students_by_course(courses)
+
+    final_data = []
+    for course in courses:
+        total_days = total_days_map.get(course.id, 0)
+
+        course_list_data = []
+        if total_days > 0:
+            for student in students_by_course.get(course.id, []):
+                present_count = counts_map.get((student.id, course.id), {}).get('present', 0)
+                percentage = round(present_count / total_days * 100, 2)
+
+                if analysis_type == 'below' and percentage < threshold:
+                    status = status_labels['below']
+                elif analysis_type == 'above' and percentage >= threshold:
+                    status = status_labels['above']
+                else:
+                    continue
+
+                course_list_data.append({
+                    "name": f"{student.admin.first_name} {student.admin.last_name}",
+                    "total_days": total_days,
+                    "present": present_count,
+                    "percentage": percentage,
+                    "status": status
+                })
+
+            if analysis_type == 'below':
+                course_list_data.sort(key=lambda x: x['percentage'])
+            else:
+                course_list_data.sort(key=lambda x: x['percentage'], reverse=True)
+
+        final_data.append({
+            "course_name": course.name,
+            "data": course_list_data
+        })
+
+    return final_data
+
+
+def refresh_attendance_summary(course_id, month):
+    """Recount one course-month of AttendanceSummary from its Attendance_Report rows"""
+    month = month.replace(day=1)
+    rows = _report_counts(Attendance_Report.objects.filter(
+        attendance__course_id=course_id,
+        attendance__attendance_date__gte=month,
+        attendance__attendance_date__lt=_next_month(month),
+    ))
+
+    with transaction.atomic():
+        AttendanceSummary.objects.filter(course_id=course_id, month=month).delete()
+        AttendanceSummary.objects.bulk_create([
+            AttendanceSummary(
+                student_id=row['student'],
+                course_id=course_id,
+                month=month,
+                present_count=row['present'],
+                absent_count=row['absent'],
+                informed_leave_count=row['informed_leave']
+            )
+            for row in rows
+        ])
+
+
+def rebuild_attendance_summary(batch_size=1000):
+    """Recompute the whole AttendanceSummary table with one grouped query"""
+    rows = _report_counts(
+        Attendance_Report.objects.annotate(
+            month=TruncMonth('attendance__attendance_date')
+        ),
+        'month'
+    )
+
+    with transaction.atomic():
+        AttendanceSummary.objects.all().delete()
+        created = AttendanceSummary.objects.bulk_create(
+            (
+                AttendanceSummary(
+                    student_id=row['student'],
+                    course_id=row['attendance__course'],
+                    month=row['month'],
+                    present_count=row['present'],
+                    absent_count=row['absent'],
+                    informed_leave_count=row['informed_leave']
+                )
+                for row in rows
+            ),
+            batch_size=batch_size
+        )
+    return len(created)
+
+
+def course_student_rows(course):
+    """{ id, name } of every student of a course, id being the user id"""
+    return CustomUser.objects.filter(student__course_id=course).order_by('student__id').values(
+        'id', name=Concat('first_name', Value(' '), 'last_name')
+    )
+
+
+def attendance_dates(course):
+    """{ id, attendance_date } of every roll call taken for a course"""
+    return Attendance.objects.filter(course=course).values('id', 'attendance_date')
+
+
+def attendance_sheet_rows(attendance):
+    """
+    { id, name, status, leave_status } of every student on a roll call, as
+    the update-attendance page posts them back to update_attendance_sheet.
+    """
+    # The annotations reuse the report join made by the filter
+    return CustomUser.objects.filter(student__attendance_report__attendance=attendance).order_by(
+        'student__attendance_report__id'
+    ).values(
+        'id',
+        name=Concat('first_name', Value(' '), 'last_name'),
+        status=Case(When(student__attendance_report__is_present=True, then=Value(1)), default=Value(0)),
+        leave_status=Coalesce('student__attendance_report__leave_status', Value('')),
+    )
+
+
+def _resolve_students(student_rows):
+    """Map the posted user ids to Student ids with a single query"""
+    admin_ids = {int(row['id']) for row in student_rows}
+    student_map = dict(
+        Student.objects.filter(admin_id__in=admin_ids).values_list('admin_id', 'id')
+    )
+    if len(student_map) != len(admin_ids):
+        raise Student.DoesNotExist("Student matching query does not exist.")
+    return student_map
+
+
+def _write_reports(attendance, student_rows, student_map):
+    """Insert missing Attendance_Report rows and update the rest in bulk"""
+    existing = {
+        report.student_id: report
+        for report in Attendance_Report.objects.filter(attendance=attendance)
+    }
+    now = timezone.now()
+
+    to_create = []
+    to_update = []
+    for row in student_rows:
+        student_id = student_map[int(row['id'])]
+        is_present = bool(row['status'])
+        leave_status = row.get('leave_status', '')
+
+        report = existing.get(student_id)
+        if report is None:
+            to_create.append(Attendance_Report(
+                student_id=student_id,
+                attendance=attendance,
+                is_present=is_present,
+                leave_status=leave_status
+            ))
+        else:
+            report.is_present = is_present
+            report.leave_status = leave_status
+            report.updated_at = now
+            to_update.append(report)
+
+    Attendance_Report.objects.bulk_create(to_create)
+    Attendance_Report.objects.bulk_update(to_update, ['is_present', 'leave_status', 'updated_at'])
+
+
+def save_attendance_sheet(course, attendance_date, student_rows):
+    """
+    Save a class roll call in one transaction.
+
+    student_rows is the list posted by the take-attendance page:
+    [{ id: <user id>, status: 1/0, leave_status: "" }]. There is one
+    Attendance per course and date, so saving a day again (double-click,
+    retry, correction) updates that sheet instead of adding a second one.
+    """
+    attendance_date = _as_date(attendance_date)
+    student_map = _resolve_students(student_rows)
+
+    with transaction.atomic():
+        attendance, created = Attendance.objects.get_or_create(course=course, attendance_date=attendance_date)
+        if not created:
+            attendance.save(update_fields=['updated_at'])
+        _write_reports(attendance, student_rows, student_map)
+        refresh_attendance_summary(attendance.course_id, attendance.attendance_date)
+
+    return attendance
+
+
+def update_attendance_sheet(attendance, attendance_date, student_rows):
+    """Save edits to an existing roll call in one transaction"""
+    attendance_date = _as_date(attendance_date)
+    student_map = _resolve_students(student_rows)
+
+    if attendance_date != attendance.attendance_date and Attendance.objects.filter(
+        course_id=attendance.course_id, attendance_date=attendance_date
+    ).exists():
+        raise ValueError(f"Attendance already taken for {attendance_date}. Please update that date instead.")
+
+    with transaction.atomic():
+        previous_date = attendance.attendance_date
+        attendance.attendance_date = attendance_date
+        attendance.save()
+        _write_reports(attendance, student_rows, student_map)
+        refresh_attendance_summary(attendance.course_id, attendance_date)
+        if previous_date.replace(day=1) != attendance_date.replace(day=1):
+            refresh_attendance_summary(attendance.course_id, previous_date)
+
+    return attendance
@@ -0,0 +1,184 @@
+"""
+Fee billing helpers: which fee heads of a course's fee structure a student
+is charged and how much, shared by the invoice signal, the bulk imports and
+the accountant's invoice generation, and the monthly billing runs for
+structures billed in installments or every month.
+"""
+import datetime
+import time
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import transaction
+from django.db.models import Count
+
+from hadiya.models import BillingRun, FeeStructure, Student, StudentInvoice
+
+# Days from invoicing to the due date
+DEFAULT_DUE_DAYS = 30
+
+# FeeStructure.billing_cycle values billed by run_billing()
+RECURRING_CYCLES = ('installments', 'monthly')
+
+
+def invoice_amount(structure, student):
+    """
+    Amount to charge a student for one FeeStructure, None if the head does
+    not apply: hostel heads need uses_hostel, transport and bus heads need
+    uses_transport and are charged at the bus stop's monthly fee if it has one.
+    """
+    head_name = structure.fee_head.name.lower()
+    amount = structure.amount
+
+    if 'hostel' in head_name and not student.uses_hostel:
+        return None
+
+    if 'transport' in head_name or 'bus' in head_name:
+        if not student.uses_transport:
+            return None
+        if student.bus_stop and student.bus_stop.monthly_fee > 0:
+            amount = student.bus_stop.monthly_fee
+
+    return amount
+
+
+def build_student_invoices(student, structures, due_date=None):
+    """
+    Unsaved StudentInvoice rows for a new student from their course's fee
+    structures. Structures on a recurring cycle are left to the billing runs.
+    """
+    if due_date is None:
+        due_date = datetime.date.today() + datetime.timedelta(days=DEFAULT_DUE_DAYS)
+
+    invoices = []
+    for structure in structures:
+        if structure.billing_cycle != 'once':
+            continue
+        amount = invoice_amount(structure, student)
+        if amount is None:
+            continue
+        invoices.append(StudentInvoice(
+            student=student,
+            fee_head=structure.fee_head,
+            amount=amount,
+            due_date=due_date
+        ))
+    return invoices
+
+
+def generate_invoices(courses=None, batch_size=1000):
+    """
+    Invoice every student of the courses (every course if None) for each
+    one-time fee head of their fee structure they are not invoiced for yet.
+
+    Structures, heads, bus stops and the (student, fee head) pairs already
+    invoiced are loaded once, the charging rules applied in memory and the
+    missing invoices inserted with bulk_create. Returns { course_id: number
+    of invoices created }.
+    """
+    students = Student.objects.select_related('bus_stop').order_by('id')
+    structures = FeeStructure.objects.filter(billing_cycle='once').select_related('fee_head').order_by('id')
+    invoiced = StudentInvoice.objects.all()
+    if courses is not None:
+        course_ids = [getattr(course, 'id', course) for course in courses]
+        students = students.filter(course_id__in=course_ids)
+        structures = structures.filter(course_id__in=course_ids)
+        invoiced = invoiced.filter(student__course_id__in=course_ids)
+
+    by_course = {}
+    for structure in structures:
+        by_course.setdefault(structure.course_id, []).append(structure)
+    invoiced = set(invoiced.values_list('student_id', 'fee_head_id'))
+
+    created = {course_id: 0 for course_id in by_course}
+    invoices = []
+    for student in students:
+        for structure in by_course.get(student.course_id_id, []):
+            if (student.id, structure.fee_head_id) in invoiced:
+                continue
+            amount = invoice_amount(structure, student)
+            if amount is None:
+                continue
+            invoices.append(StudentInvoice(student=student, fee_head=structure.fee_head, amount=amount))
+            invoiced.add((student.id, structure.fee_head_id))
+            created[student.course_id_id] += 1
+
+    with transaction.atomic():
+        StudentInvoice.objects.bulk_create(invoices, batch_size=batch_size)
+    return created
+
+
+def installment_amount(amount, installments, number):
+    """
+    Amount of installment number (1-based) of installments equal parts,
+    rounded down to the paisa; the last one takes the remainder so the
+    parts add up to amount.
+    """
+    part = (Decimal(amount) / installments).quantize(Decimal('0.01'), rounding=ROUND_DOWN)
+    if number < installments:
+        return part
+    return Decimal(amount) - part * (installments - 1)
+
+
+def run_billing(period, force=False, batch_size=1000):
+    """
+    Bill the month containing period for the whole school: every monthly
+    structure in full and the next installment of every installment
+    structure, for each student it applies to.
+
+    The run is recorded in BillingRun, so billing a month again is a no-op
+    returning None. With force=True the month is billed again for students
+    it missed, e.g. admitted since; invoices already raised for the month
+    are never duplicated. Returns the BillingRun.
+    """
+    period = period.replace(day=1)
+    if not force and BillingRun.objects.filter(period=period).exists():
+        return None
+
+    started = time.perf_counter()
+    with transaction.atomic():
+        run, created = BillingRun.objects.select_for_update().get_or_create(period=period)
+        if not created and not force:
+            return None
+
+        by_course = {}
+        head_ids = set()
+        for structure in FeeStructure.objects.filter(billing_cycle__in=RECURRING_CYCLES).select_related('fee_head').order_by('id'):
+            by_course.setdefault(structure.course_id, []).append(structure)
+            head_ids.add(structure.fee_head_id)
+
+        recurring = StudentInvoice.objects.filter(billing_period__isnull=False, fee_head_id__in=head_ids)
+        billed = set(recurring.filter(billing_period=period).values_list('student_id', 'fee_head_id'))
+        installments_billed = {
+            (row['student_id'], row['fee_head_id']): row['count']
+            for row in recurring.values('student_id', 'fee_head_id').annotate(count=Count('id')).order_by()
+        }
+
+        due_date = period + datetime.timedelta(days=DEFAULT_DUE_DAYS)
+        invoices = []
+        for student in Student.objects.filter(course_id__in=by_course).select_related('bus_stop').order_by('id'):
+            for structure in by_course[student.course_id_id]:
+                key = (student.id, structure.fee_head_id)
+                if key in billed:
+                    continue
+                amount = invoice_amount(structure, student)
+                if amount is None:
+                    continue
+                if structure.billing_cycle == 'installments':
+                    number = installments_billed.get(key, 0) + 1
+                    if number > structure.installments:
+                        continue
+                    amount = installment_amount(amount, structure.installments, number)
+
+                invoices.append(StudentInvoice(
+                    student=student,
+                    fee_head=structure.fee_head,
+                    amount=amount,
+                    due_date=due_date,
+                    billing_period=period
+                ))
+
+        StudentInvoice.objects.bulk_create(invoices, batch_size=batch_size)
+        run.invoices_created += len(invoices)
+        run.run_seconds = time.perf_counter() - started
+        run.save()
+    return run
@@ -0,0 +1,353 @@
+"""
+Bulk student, staff and subject import from Excel sheets.
+
+The sheet is streamed with openpyxl in read-only mode and every row is
+checked against the existing emails, usernames, courses and staff, loaded
+once up front, before anything is written. The valid rows are then inserted
+in chunks, each in its own transaction: users and their profiles (and a
+student's fee invoices) with one bulk_create each, after the chunk's
+passwords are hashed in a process pool shared by the whole import.
+"""
+import openpyxl
+from django.db import transaction
+
+from hadiya import dashboard_stats
+from hadiya.billing import build_student_invoices
+from hadiya.models import Course, CustomUser, FeeStructure, Staff, Student, StudentInvoice, Subject
+from hadiya.passwords import hash_passwords, hash_pool
+from hadiya.search import set_search_tokens, student_search_text
+
+DEFAULT_PASSWORD = '123456'
+
+CHUNK_SIZE = 500
+
+# Sheet header -> field. Columns are matched by header, so the sample
+# templates and older sheets with session columns both import.
+STAFF_COLUMNS = {
+    'first name': 'first_name',
+    'last name': 'last_name',
+    'username': 'username',
+    'email': 'email',
+    'password': 'password',
+    'gender': 'gender',
+    'address': 'address',
+}
+STUDENT_COLUMNS = {
+    **STAFF_COLUMNS,
+    'course': 'course',
+    'course name': 'course',
+    'admission type': 'admission_type',
+}
+SUBJECT_COLUMNS = {
+    'subject name': 'name',
+    'name': 'name',
+    'course': 'course',
+    'course name': 'course',
+    'staff email': 'staff_email',
+}
+
+GENDERS = {'male': 'Male', 'female': 'Female', 'other': 'Other'}
+ADMISSION_TYPES = {value.lower(): value for value, _ in Student.ADMISSION_TYPE_CHOICES}
+
+
+def _cell_text(value):
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def read_rows(excel_file, columns):
+    """
+    Yield (row number, { field: text }) for every non-empty row of the
+    sheet, streaming it without loading the whole workbook. columns maps
+    lower-case headers to fields; other columns are ignored.
+    """
+    workbook = openpyxl.load_workbook(excel_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        fields = [columns.get(_cell_text(title).lower()) for title in header]
+
+        for row_number, row in enumerate(rows, start=2):
+            values = {}
+            for field, value in zip(fields, row):
+                if field and field not in values:
+                    values[field] = _cell_text(value)
+            if any(values.values()):
+                yield row_number, values
+    finally:
+        workbook.close()
+
+
+def _error(row_number, values, message):
+    # The row as uploaded, less the password, for the error log
+    values = {field: value for field, value in values.items() if field != 'password'}
+    return {"row": row_number, "values": values, "message": message}
+
+
+def _course_ids():
+    """Lower-case course name -> id; the oldest course wins a duplicate name"""
+    courses = {}
+    for course_id, name in Course.objects.order_by('-id').values_list('id', 'name'):
+        courses[name.strip().lower()] = course_id
+    return courses
+
+
+def _validate_rows(rows, required, check=None):
+    """
+    Common checks for new users: required fields, emails and usernames
+    against the database and against the rows above them in the sheet, and
+    the gender. check(values) returns an error message for the checks
+    particular to the sheet.
+
+    Returns (valid, errors): valid is a list of (row number, values), errors
+    a list of { row, values, message }.
+    """
+    emails = set(CustomUser.objects.values_list('email', flat=True))
+    usernames = set(CustomUser.objects.values_list('username', flat=True))
+
+    valid = []
+    errors = []
+    for row_number, values in rows:
+        email = values.get('email', '')
+        username = values.get('username', '')
+
+        message = None
+        if not all(values.get(field) for field in required):
+            message = "Missing required fields"
+        elif email in emails:
+            message = f"Email {email} already exists"
+        elif username in usernames:
+            message = f"Username {username} already exists"
+        elif values.get('gender') and values['gender'].lower() not in GENDERS:
+            message = f"Unknown gender '{values['gender']}'"
+        elif check is not None:
+            message = check(values)
+
+        if message:
+            errors.append(_error(row_number, values, message))
+            continue
+
+        emails.add(email)
+        usernames.add(username)
+        values['gender'] = GENDERS.get(values.get('gender', '').lower(), 'Male')
+        valid.append((row_number, values))
+
+    return valid, errors
+
+
+def validate_student_rows(rows):
+    """Check every student row before anything is written, see _validate_rows()"""
+    courses = _course_ids()
+
+    def check(values):
+        if values['course'].lower() not in courses:
+            return f"Course '{values['course']}' not found"
+        if values.get('admission_type') and values['admission_type'].lower() not in ADMISSION_TYPES:
+            return f"Unknown admission type '{values['admission_type']}'"
+        values['course_id'] = courses[values['course'].lower()]
+        values['admission_type'] = ADMISSION_TYPES.get(values.get('admission_type', '').lower(), 'Day Scholar')
+        return None
+
+    return _validate_rows(rows, ('first_name', 'username', 'email', 'course'), check)
+
+
+def validate_staff_rows(rows):
+    """Check every staff row before anything is written, see _validate_rows()"""
+    return _validate_rows(rows, ('first_name', 'username', 'email'))
+
+
+def validate_subject_rows(rows):
+    """
+    Check every subject row before anything is written: the course must
+    exist, and so must the staff member if a staff email is given.
+    Returns (valid, errors) like _validate_rows().
+    """
+    courses = _course_ids()
+    staff = {
+        email.lower(): staff_id
+        for staff_id, email in Staff.objects.values_list('id', 'admin__email')
+    }
+
+    valid = []
+    errors = []
+    for row_number, values in rows:
+        staff_email = values.get('staff_email', '')
+
+        message = None
+        if not values.get('name') or not values.get('course'):
+            message = "Missing Name or Course"
+        elif values['course'].lower() not in courses:
+            message = f"Course '{values['course']}' not found"
+        elif staff_email and staff_email.lower() not in staff:
+            message = f"Staff email '{staff_email}' not found"
+
+        if message:
+            errors.append(_error(row_number, values, message))
+            continue
+
+        values['course_id'] = courses[values['course'].lower()]
+        values['staff_id'] = staff.get(staff_email.lower())
+        valid.append((row_number, values))
+
+    return valid, errors
+
+
+def _create_users(chunk, passwords, user_type):
+    """bulk_create the users of a chunk and return them with their ids set"""
+    users = [
+        CustomUser(
+            username=values['username'],
+            email=values['email'],
+            password=password,
+            first_name=values['first_name'],
+            last_name=values.get('last_name', ''),
+            user_type=user_type
+        )
+        for (_, values), password in zip(chunk, passwords)
+    ]
+    CustomUser.objects.bulk_create(users)
+    if any(user.pk is None for user in users):
+        ids = dict(CustomUser.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+        for user in users:
+            user.pk = ids[user.email]
+    return users
+
+
+def _insert_students(chunk, passwords, structures):
+    with transaction.atomic():
+        # bulk_create sends no signals: the student profile and invoices the
+        # signals would add are created here
+        users = _create_users(chunk, passwords, 3)
+        students = [
+            Student(
+                admin=user,
+                address=values.get('address', ''),
+                gender=values['gender'],
+                course_id_id=values['course_id'],
+                admission_type=values['admission_type'],
+                uses_hostel=(values['admission_type'] == 'Hostel')
+            )
+            for user, (_, values) in zip(users, chunk)
+        ]
+        for student in students:
+            student.search_text = student_search_text(student)
+        Student.objects.bulk_create(students)
+        if any(student.pk is None for student in students):
+            ids = dict(Student.objects.filter(admin__in=users).values_list('admin_id', 'id'))
+            for student in students:
+                student.pk = ids[student.admin_id]
+        set_search_tokens(students)
+
+        invoices = []
+        for student in students:
+            invoices += build_student_invoices(student, structures.get(student.course_id_id, []))
+        StudentInvoice.objects.bulk_create(invoices)
+
+    return len(students)
+
+
+def _insert_staff(chunk, passwords):
+    with transaction.atomic():
+        users = _create_users(chunk, passwords, 2)
+        Staff.objects.bulk_create([
+            Staff(admin=user, address=values.get('address', ''), gender=values['gender'])
+            for user, (_, values) in zip(users, chunk)
+        ])
+    return len(users)
+
+
+def _insert_subjects(chunk):
+    with transaction.atomic():
+        Subject.objects.bulk_create([
+            Subject(name=values['name'], course_id=values['course_id'], staff_id=values['staff_id'])
+            for _, values in chunk
+        ])
+    return len(chunk)
+
+
+def _hash_rows(chunk, pool=None):
+    return hash_passwords([values.get('password') or DEFAULT_PASSWORD for _, values in chunk], pool=pool)
+
+
+def _import_chunks(valid_rows, insert, chunk_size, on_chunk):
+    """
+    insert() the rows chunk by chunk. A chunk the database rejects, e.g. for
+    an email taken since the sheet was validated, is rolled back and its
+    rows reported as errors; the other chunks are still saved.
+    on_chunk(created, errors) is called after every chunk.
+    """
+    created = 0
+    errors = []
+    for start in range(0, len(valid_rows), chunk_size):
+        chunk = valid_rows[start:start + chunk_size]
+        try:
+            count, chunk_errors = insert(chunk), []
+        except Exception as e:
+            count = 0
+            chunk_errors = [_error(row_number, values, f"Could not save: {e}") for row_number, values in chunk]
+        created += count
+        errors += chunk_errors
+        # bulk_create sends no signals
+        dashboard_stats.invalidate()
+        if on_chunk is not None:
+            on_chunk(count, chunk_errors)
+    return created, errors
+
+
+def import_students(valid_rows, chunk_size=CHUNK_SIZE, workers=None, on_chunk=None):
+    """
+    Create the validated student rows in chunks of chunk_size, hashing each
+    chunk's passwords in one pool of workers processes opened for the whole
+    import. Returns (created, errors).
+    """
+    structures = {}
+    for structure in FeeStructure.objects.select_related('fee_head'):
+        structures.setdefault(structure.course_id, []).append(structure)
+
+    with hash_pool(workers, len(valid_rows)) as pool:
+        def insert(chunk):
+            return _insert_students(chunk, _hash_rows(chunk, pool), structures)
+
+        return _import_chunks(valid_rows, insert, chunk_size, on_chunk)
+
+
+def import_staff(valid_rows, chunk_size=CHUNK_SIZE, workers=None, on_chunk=None):
+    """Create the validated staff rows, as import_students() does. Returns (created, errors)."""
+    with hash_pool(workers, len(valid_rows)) as pool:
+        def insert(chunk):
+            return _insert_staff(chunk, _hash_rows(chunk, pool))
+
+        return _import_chunks(valid_rows, insert, chunk_size, on_chunk)
+
+
+def import_subjects(valid_rows, chunk_size=CHUNK_SIZE, on_chunk=None):
+    """Create the validated subject rows in chunks. Returns (created, errors)."""
+    return _import_chunks(valid_rows, _insert_subjects, chunk_size, on_chunk)
+
+
+# kind -> (sheet columns, validate, import)
+IMPORTERS = {
+    'student': (STUDENT_COLUMNS, validate_student_rows, import_students),
+    'staff': (STAFF_COLUMNS, validate_staff_rows, import_staff),
+    'subject': (SUBJECT_COLUMNS, validate_subject_rows, import_subjects),
+}
+
+
+def error_report(kind, errors):
+    """
+    Workbook listing every rejected row as it was uploaded with the reason,
+    for the HOD to fix and upload again. Passwords are left out.
+    """
+    columns, _, _ = IMPORTERS[kind]
+    fields = [field for field in dict.fromkeys(columns.values()) if field != 'password']
+
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Errors')
+    sheet.append(['Row'] + [field.replace('_', ' ').title() for field in fields] + ['Error'])
+    for error in errors:
+        values = error['values']
+        sheet.append([error['row']] + [values.get(field, '') for field in fields] + [error['message']])
+    return workbook
@@ -0,0 +1,180 @@
+"""
+Daily cashbook: money in and out of the school per day, kept as a rollup so
+the collection and cash-flow reports read a few rows per day instead of
+adding up every payment. DailyFeeCollection splits each day's fees by
+payment mode, course and fee head; DailyCashbook holds the day's totals of
+fees, other income and expenses.
+
+A day is recounted from its FeePayment, InvoiceAllocation, Income and
+Expense rows by whatever writes one of them: the FeePayment/Income/Expense
+signals in hadiya.models, inside the same transaction, and collect_payment,
+once its transaction commits.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from hadiya.models import DailyCashbook, DailyFeeCollection, Expense, FeePayment, Income, InvoiceAllocation
+
+ZERO = Decimal('0')
+
+
+def _in_range(queryset, field, start=None, end=None):
+    """Filter queryset to an inclusive, possibly open-ended date range"""
+    if start is not None:
+        queryset = queryset.filter(**{f'{field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{field}__lte': end})
+    return queryset
+
+
+def _fee_rows(payments, allocations):
+    """
+    Unsaved DailyFeeCollection rows from payments and their allocations.
+    What a (day, mode, course) took in beyond its allocations went to
+    advance balances, or came from them when negative; it is kept under
+    fee_head None so a day's rows add up to the cash received.
+    """
+    totals = {}
+    for row in payments.values('payment_date', 'payment_mode', 'student__course_id').annotate(
+        total=Sum('amount')
+    ).order_by():
+        totals[(row['payment_date'], row['payment_mode'], row['student__course_id'], None)] = row['total']
+
+    for row in allocations.values(
+        'payment__payment_date', 'payment__payment_mode', 'payment__student__course_id', 'invoice__fee_head'
+    ).annotate(total=Sum('amount')).order_by():
+        day = (row['payment__payment_date'], row['payment__payment_mode'], row['payment__student__course_id'])
+        head = day + (row['invoice__fee_head'],)
+        totals[head] = totals.get(head, ZERO) + row['total']
+        totals[day + (None,)] = totals.get(day + (None,), ZERO) - row['total']
+
+    return [
+        DailyFeeCollection(date=date, payment_mode=mode, course_id=course_id, fee_head_id=fee_head_id, amount=amount)
+        for (date, mode, course_id, fee_head_id), amount in totals.items()
+        if amount
+    ]
+
+
+def _day_totals(payments, incomes, expenses):
+    """{ date: DailyCashbook } for every day with a payment, income or expense"""
+    days = {}
+
+    def day(date):
+        return days.setdefault(date, DailyCashbook(date=date))
+
+    for row in payments.values('payment_date').annotate(total=Sum('amount'), count=Count('id')).order_by():
+        day(row['payment_date']).fee_collection = row['total']
+        day(row['payment_date']).payment_count = row['count']
+    for row in incomes.values('date').annotate(total=Sum('amount')).order_by():
+        day(row['date']).other_income = row['total']
+    for row in expenses.values('date').annotate(total=Sum('amount')).order_by():
+        day(row['date']).expenses = row['total']
+    return days
+
+
+def refresh_cashbook(date):
+    """Recount one day of the cashbook from its payments, incomes and expenses"""
+    # Views create incomes and expenses with the posted YYYY-MM-DD string
+    date = DailyCashbook._meta.get_field('date').to_python(date)
+    with transaction.atomic():
+        # Lock the day first, so two writers recounting it are serialised and
+        # the second one sees the first one's rows
+        day, _ = DailyCashbook.objects.select_for_update().get_or_create(date=date)
+
+        payments = FeePayment.objects.filter(payment_date=date)
+        fee_rows = _fee_rows(payments, InvoiceAllocation.objects.filter(payment__payment_date=date))
+        totals = _day_totals(payments, Income.objects.filter(date=date), Expense.objects.filter(date=date))
+
+        DailyFeeCollection.objects.filter(date=date).delete()
+        DailyFeeCollection.objects.bulk_create(fee_rows)
+
+        if date not in totals:
+            day.delete()
+            return None
+        fresh = totals[date]
+        day.fee_collection = fresh.fee_collection
+        day.payment_count = fresh.payment_count
+        day.other_income = fresh.other_income
+        day.expenses = fresh.expenses
+        day.save()
+        return day
+
+
+def rebuild_cashbook(start=None, end=None, batch_size=1000):
+    """
+    Recompute the cashbook between start and end (inclusive; the whole
+    history when both are None) with a few grouped queries. Returns the
+    number of days written.
+    """
+    payments = _in_range(FeePayment.objects.all(), 'payment_date', start, end)
+    allocations = _in_range(InvoiceAllocation.objects.all(), 'payment__payment_date', start, end)
+    incomes = _in_range(Income.objects.all(), 'date', start, end)
+    expenses = _in_range(Expense.objects.all(), 'date', start, end)
+
+    with transaction.atomic():
+        _in_range(DailyFeeCollection.objects.all(), 'date', start, end).delete()
+        _in_range(DailyCashbook.objects.all(), 'date', start, end).delete()
+        DailyFeeCollection.objects.bulk_create(_fee_rows(payments, allocations), batch_size=batch_size)
+        days = DailyCashbook.objects.bulk_create(
+            _day_totals(payments, incomes, expenses).values(), batch_size=batch_size
+        )
+    return len(days)
+
+
+def collection_summary(start=None, end=None):
+    """
+    Fee collection between start and end from the rollup: the total, the
+    number of payments and the totals by payment mode, course and fee head
+    (fee head None being the net amount added to advance balances).
+    """
+    rows = _in_range(DailyFeeCollection.objects.all(), 'date', start, end)
+
+    def by(field):
+        return list(rows.values(field).annotate(total=Sum('amount')).exclude(total=0).order_by(field))
+
+    days = _in_range(DailyCashbook.objects.all(), 'date', start, end).aggregate(
+        total=Sum('fee_collection'), payments=Sum('payment_count')
+    )
+    return {
+        'total': days['total'] or ZERO,
+        'payment_count': days['payments'] or 0,
+        'by_mode': by('payment_mode'),
+        'by_course': by('course__name'),
+        'by_fee_head': by('fee_head__name'),
+    }
+
+
+def cash_flow(start, end, by_month=False):
+    """
+    Money in and out per day (or per month) between start and end, with the
+    running balance carried from everything booked before start. Returns
+    (opening_balance, rows).
+    """
+    before = DailyCashbook.objects.filter(date__lt=start).aggregate(
+        fees=Sum('fee_collection'), income=Sum('other_income'), expenses=Sum('expenses')
+    )
+    balance = (before['fees'] or ZERO) + (before['income'] or ZERO) - (before['expenses'] or ZERO)
+    opening = balance
+
+    days = _in_range(DailyCashbook.objects.all(), 'date', start, end)
+    period = TruncMonth('date') if by_month else F('date')
+    totals = days.values(period=period).annotate(
+        fees=Sum('fee_collection'), income=Sum('other_income'), expenses=Sum('expenses')
+    ).order_by('period')
+
+    rows = []
+    for row in totals:
+        net = row['fees'] + row['income'] - row['expenses']
+        balance += net
+        rows.append({
+            'period': row['period'],
+            'fee_collection': row['fees'],
+            'other_income': row['income'],
+            'expenses': row['expenses'],
+            'net': net,
+            'balance': balance,
+        })
+    return opening, rows
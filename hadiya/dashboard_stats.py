@@ -0,0 +1,94 @@
+"""
+HOD dashboard statistics. The counters are taken in one query of scalar
+subqueries and the recent lists in one query each; the result is kept in
+Django's cache (the CACHES setting: local memory unless e.g. Redis is
+configured) until a post_save/post_delete signal on one of the models it is
+built from deletes it. Hits and misses are counted in the cache as well, so
+with a shared cache they cover every worker.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from hadiya.models import (
+    Course, Enquiry, News, Staff, Staff_Feedback, Staff_leave, Student, Student_Feedback, Student_leave, Subject,
+)
+
+CACHE_KEY = 'hod_dashboard_stats'
+HITS_KEY = 'hod_dashboard_stats:hits'
+MISSES_KEY = 'hod_dashboard_stats:misses'
+
+
+def _counters():
+    """Name -> queryset for every counter on the dashboard"""
+    return {
+        'students_count': Student.objects.all(),
+        'staff_count': Staff.objects.all(),
+        'courses_count': Course.objects.all(),
+        'subjects_count': Subject.objects.all(),
+        'pending_student_leaves': Student_leave.objects.filter(status=0),
+        'pending_staff_leaves': Staff_leave.objects.filter(status=0),
+        'unread_student_feedbacks': Student_Feedback.objects.filter(feedback_reply__isnull=True),
+        'unread_staff_feedbacks': Staff_Feedback.objects.filter(feedback_reply__isnull=True),
+    }
+
+
+def count_all(querysets):
+    """Count several querysets with a single SELECT of one scalar subquery each"""
+    parts = []
+    params = []
+    for i, queryset in enumerate(querysets.values()):
+        sql, query_params = queryset.order_by().values('pk').query.sql_with_params()
+        parts.append(f'(SELECT COUNT(*) FROM ({sql}) counted_{i})')
+        params.extend(query_params)
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ' + ', '.join(parts), params)
+        return dict(zip(querysets, cursor.fetchone()))
+
+
+def compute_stats():
+    """The dashboard statistics, straight from the database"""
+    stats = count_all(_counters())
+    stats['recent_students'] = list(Student.objects.select_related('admin', 'course_id').order_by('-created_at')[:5])
+    stats['recent_enquiries'] = list(Enquiry.objects.select_related('course').order_by('-created_at')[:5])
+    stats['recent_news'] = list(News.objects.order_by('-created_at')[:3])
+    return stats
+
+
+def _count(key):
+    # add() is a no-op if the counter exists; incr() is atomic on shared caches
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def dashboard_stats():
+    """The dashboard statistics from the cache, computing and caching them on a miss"""
+    stats = cache.get(CACHE_KEY)
+    if stats is not None:
+        _count(HITS_KEY)
+        return stats
+
+    _count(MISSES_KEY)
+    stats = compute_stats()
+    cache.set(CACHE_KEY, stats, getattr(settings, 'DASHBOARD_STATS_TIMEOUT', 3600))
+    return stats
+
+
+def invalidate():
+    """Drop the cached statistics; the next dashboard load recomputes them"""
+    cache.delete(CACHE_KEY)
+
+
+def cache_counters():
+    """{ hits, misses, hit_rate } of the cached statistics since the cache was last cleared"""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total * 100, 1) if total else 0,
+    }
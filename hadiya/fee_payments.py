@@ -0,0 +1,97 @@
+"""
+Fee collection: recording a payment and allocating it to the student's open
+invoices, oldest dues first.
+
+Everything happens in one transaction that first locks the student row, so
+two cashiers taking a payment from the same student at the same time are
+serialised instead of both allocating against the same dues. Amounts are
+Decimal throughout, invoices are updated with one bulk_update and the
+allocations written with one bulk_create, and the day's cashbook is
+recounted once, after the transaction commits.
+"""
+import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from hadiya.cashbook import refresh_cashbook
+from hadiya.models import FeePayment, InvoiceAllocation, Student, StudentInvoice
+
+CENT = Decimal('0.01')
+
+
+def parse_amount(value):
+    """Posted amount as a positive Decimal rounded to the paisa, ValueError otherwise"""
+    try:
+        amount = Decimal(str(value).strip()).quantize(CENT)
+    except (InvalidOperation, ValueError):
+        raise ValueError("Enter a valid amount")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError("Amount must be greater than zero")
+    return amount
+
+
+def collect_payment(student_id, amount, payment_mode='Cash', remark='', today=None):
+    """
+    Record a payment from a student and allocate it to their unpaid
+    invoices, oldest first. The student's advance balance is spent first,
+    so dues are settled from earlier overpayments before new money; what is
+    left of the payment goes to the advance balance.
+
+    student_id is the Student pk. Returns (payment, allocations,
+    advance_used), advance_used being the part of the allocations paid from
+    the advance balance.
+    """
+    amount = parse_amount(amount)
+    today = today or datetime.date.today()
+
+    with transaction.atomic():
+        student = Student.objects.select_for_update().get(id=student_id)
+        invoices = list(
+            StudentInvoice.objects.select_for_update()
+            .filter(student=student, is_paid=False)
+            .order_by('created_at', 'id')
+        )
+
+        payment = FeePayment(
+            student=student,
+            amount=amount,
+            payment_mode=payment_mode,
+            remark=remark
+        )
+        # Recounted below once the allocations are written, not by the signal
+        payment.skip_cashbook = True
+        payment.save()
+
+        now = timezone.now()
+        advance = student.advance_balance
+        available = advance + amount
+        allocations = []
+        for invoice in invoices:
+            if available <= 0:
+                break
+            due = invoice.amount - invoice.paid_amount
+            if due <= 0:
+                continue
+
+            allocated = min(available, due)
+            invoice.paid_amount += allocated
+            invoice.updated_at = now # bulk_update skips auto_now
+            if invoice.paid_amount >= invoice.amount:
+                invoice.is_paid = True
+                invoice.payment_date = today
+            allocations.append(InvoiceAllocation(payment=payment, invoice=invoice, amount=allocated))
+            available -= allocated
+
+        changed = [allocation.invoice for allocation in allocations]
+        StudentInvoice.objects.bulk_update(changed, ['paid_amount', 'is_paid', 'payment_date', 'updated_at'])
+        InvoiceAllocation.objects.bulk_create(allocations)
+
+        advance_used = min(advance, advance + amount - available)
+        student.advance_balance = available
+        student.save(update_fields=['advance_balance', 'updated_at'])
+        # After the commit, so the day row is not locked for the whole payment
+        transaction.on_commit(lambda: refresh_cashbook(payment.payment_date))
+
+    return payment, allocations, advance_used
@@ -0,0 +1,115 @@
+"""
+Background Excel imports. The HOD's student, staff and subject uploads are
+saved as ImportJob rows and processed by the run_import_worker command in
+chunks, so a large admission sheet does not tie up a web worker or run into
+proxy timeouts. The job records its progress and a heartbeat after every
+chunk and keeps every rejected row for the downloadable error log.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+
+from hadiya.bulk_import import IMPORTERS, read_rows
+from hadiya.models import ImportJob
+
+
+def enqueue_import(kind, uploaded_file, user=None):
+    """
+    Save an uploaded sheet as a queued ImportJob and return it. With
+    IMPORT_JOBS_ASYNC off the sheet is imported straight away in this
+    process, which keeps development servers working without a worker.
+    """
+    if kind not in IMPORTERS:
+        raise ValueError(f"Unknown import kind: {kind}")
+
+    job = ImportJob(kind=kind, filename=uploaded_file.name, requested_by=user)
+    job.file.save(uploaded_file.name, uploaded_file, save=False)
+    job.save()
+
+    if not getattr(settings, 'IMPORT_JOBS_ASYNC', True):
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.status = 'running'
+        job.save(update_fields=['started_at', 'heartbeat_at', 'status'])
+        process_import(job.id)
+        job.refresh_from_db()
+    return job
+
+
+def process_import(job_id):
+    """Validate and import one claimed job, recording progress on it as it goes"""
+    job = ImportJob.objects.get(id=job_id)
+    columns, validate, import_rows = IMPORTERS[job.kind]
+
+    try:
+        with job.file.open('rb') as excel_file:
+            valid_rows, errors = validate(read_rows(excel_file, columns))
+
+        job.total_rows = len(valid_rows) + len(errors)
+        job.failed_rows = len(errors)
+        job.errors = errors
+        job.heartbeat_at = timezone.now()
+        job.save(update_fields=['total_rows', 'failed_rows', 'errors', 'heartbeat_at'])
+
+        def on_chunk(created, chunk_errors):
+            update = {'created_rows': F('created_rows') + created, 'heartbeat_at': timezone.now()}
+            if chunk_errors:
+                job.errors += chunk_errors
+                update.update(failed_rows=F('failed_rows') + len(chunk_errors), errors=job.errors)
+            ImportJob.objects.filter(id=job.id).update(**update)
+
+        import_rows(valid_rows, on_chunk=on_chunk)
+        job.status = 'done'
+        job.error = ''
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job_id
+
+
+def claim_job():
+    """Mark the oldest queued job as running and return its id, None if the queue is empty"""
+    for job_id in ImportJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:5]:
+        # Conditional update so two workers never take the same job
+        now = timezone.now()
+        if ImportJob.objects.filter(id=job_id, status='queued').update(status='running', started_at=now, heartbeat_at=now):
+            return job_id
+    return None
+
+
+def requeue_stale_jobs(older_than):
+    """
+    Put jobs left running by a worker that died back on the queue: those
+    whose heartbeat is older than older_than seconds. A job still being
+    imported beats after every chunk, however long it has been running, so
+    it is left to its worker. Chunks the dead worker already saved are
+    rejected as existing rows when the job runs again.
+    """
+    cutoff = timezone.now() - datetime.timedelta(seconds=older_than)
+    return ImportJob.objects.filter(status='running', heartbeat_at__lt=cutoff).update(
+        status='queued', started_at=None, heartbeat_at=None, created_rows=0, failed_rows=0, errors=[]
+    )
+
+
+def run_worker(poll_interval=1.0, once=False, log=print):
+    """
+    Process queued jobs one at a time until interrupted. With once=True
+    return as soon as the queue is empty.
+    """
+    while True:
+        job_id = claim_job()
+        if job_id is None:
+            if once:
+                break
+            time.sleep(poll_interval)
+            continue
+
+        process_import(job_id)
+        job = ImportJob.objects.get(id=job_id)
+        log(f"{job.filename}: {job.status}, {job.created_rows} created, "
+            f"{job.failed_rows} failed of {job.total_rows} rows")
@@ -0,0 +1,120 @@
+"""
+Key figures for the Accountant and Management dashboards: collections for
+today, the month and the year, income against expenses, the fee-head split
+of the year's collection, outstanding dues and attendance health.
+
+Money in and out is read from the cashbook rollup and attendance from the
+monthly AttendanceSummary, so only the outstanding dues touch
+StudentInvoice; the whole set is computed at most once per
+KPI_CACHE_TIMEOUT and shared by every dashboard load in between.
+"""
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast
+
+from hadiya.models import AttendanceSummary, DailyCashbook, DailyFeeCollection
+from hadiya.outstanding import outstanding_invoices
+
+CACHE_KEY = 'dashboard_kpis'
+# Students below this attendance percentage in the month are flagged
+ATTENDANCE_THRESHOLD = 75
+
+ZERO = Decimal('0')
+
+
+def collection_kpis(today):
+    """Fee collection, other income and expenses for today, this month and this year"""
+    month_start = today.replace(day=1)
+    year_start = today.replace(month=1, day=1)
+    totals = DailyCashbook.objects.filter(date__gte=year_start, date__lte=today).aggregate(
+        fees_today=Sum('fee_collection', filter=Q(date=today)),
+        payments_today=Sum('payment_count', filter=Q(date=today)),
+        expenses_today=Sum('expenses', filter=Q(date=today)),
+        fees_month=Sum('fee_collection', filter=Q(date__gte=month_start)),
+        income_month=Sum('other_income', filter=Q(date__gte=month_start)),
+        expenses_month=Sum('expenses', filter=Q(date__gte=month_start)),
+        fees_year=Sum('fee_collection'),
+        income_year=Sum('other_income'),
+        expenses_year=Sum('expenses'),
+    )
+    totals = {key: value or (0 if key == 'payments_today' else ZERO) for key, value in totals.items()}
+    for period in ('month', 'year'):
+        totals[f'net_{period}'] = totals[f'fees_{period}'] + totals[f'income_{period}'] - totals[f'expenses_{period}']
+    return totals
+
+
+def fee_head_kpis(start, end):
+    """Collection per fee head between start and end, largest first"""
+    return list(
+        DailyFeeCollection.objects.filter(date__gte=start, date__lte=end, fee_head__isnull=False)
+        .values('fee_head__name').annotate(total=Sum('amount')).order_by('-total')
+    )
+
+
+def outstanding_kpis(today):
+    """Open balance, open invoices and the overdue part of the balance"""
+    totals = outstanding_invoices(as_of=today).aggregate(
+        total=Sum('balance'),
+        count=Count('id'),
+        overdue=Sum('balance', filter=~Q(bucket='not_due')),
+        overdue_90=Sum('balance', filter=Q(bucket='90_plus')),
+    )
+    return {
+        'total': totals['total'] or ZERO,
+        'count': totals['count'],
+        'overdue': totals['overdue'] or ZERO,
+        'overdue_90': totals['overdue_90'] or ZERO,
+    }
+
+
+def attendance_kpis(month, threshold=ATTENDANCE_THRESHOLD):
+    """
+    Attendance of the month from AttendanceSummary: the overall percentage,
+    the percentage per course and the number of students below threshold.
+    """
+    summary = AttendanceSummary.objects.filter(month=month.replace(day=1))
+    percentage = Cast(Sum('present_count'), FloatField()) * 100 / (Sum('present_count') + Sum('absent_count'))
+
+    overall = summary.aggregate(present=Sum('present_count'), absent=Sum('absent_count'))
+    marked = (overall['present'] or 0) + (overall['absent'] or 0)
+    by_course = list(
+        summary.values('course__name').annotate(
+            marked=Sum(F('present_count') + F('absent_count')), percentage=percentage
+        ).filter(marked__gt=0).order_by('course__name')
+    )
+    below = summary.values('student').annotate(
+        marked=Sum(F('present_count') + F('absent_count')), percentage=percentage
+    ).filter(marked__gt=0, percentage__lt=threshold).order_by().count()
+    return {
+        'percentage': round(overall['present'] * 100 / marked, 1) if marked else None,
+        'by_course': [
+            {'course': row['course__name'], 'percentage': round(row['percentage'], 1)} for row in by_course
+        ],
+        'students_below': below,
+        'threshold': threshold,
+    }
+
+
+def compute_kpis(today=None):
+    """Every dashboard figure, straight from the rollups"""
+    today = today or datetime.date.today()
+    return {
+        'as_of': today,
+        'collection': collection_kpis(today),
+        'fee_heads': fee_head_kpis(today.replace(month=1, day=1), today),
+        'outstanding': outstanding_kpis(today),
+        'attendance': attendance_kpis(today),
+    }
+
+
+def dashboard_kpis():
+    """compute_kpis() through the cache, recomputed at most every KPI_CACHE_TIMEOUT seconds"""
+    kpis = cache.get(CACHE_KEY)
+    if kpis is None or kpis['as_of'] != datetime.date.today():
+        kpis = compute_kpis()
+        cache.set(CACHE_KEY, kpis, getattr(settings, 'KPI_CACHE_TIMEOUT', 300))
+    return kpis
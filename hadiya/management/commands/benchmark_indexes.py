@@ -0,0 +1,222 @@
+import datetime
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from hadiya.models import (
+    Attendance, Attendance_Report, Course, CustomUser, Examination, Expense,
+    ExpenseHead, FeeHead, FeePayment, Student, Student_Result, StudentInvoice,
+    Subject,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a school-sized dataset in a throwaway test database and report '
+        'query plans and timings for the hot attendance, result and fee '
+        'lookups, with and without the composite indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=20, help='Number of classes to seed')
+        parser.add_argument('--students', type=int, default=40, help='Students per class')
+        parser.add_argument('--days', type=int, default=180, help='Attendance days per class')
+        parser.add_argument('--subjects', type=int, default=6, help='Subjects per class')
+        parser.add_argument('--exams', type=int, default=3, help='Examinations to seed')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query when timing')
+
+    def handle(self, *args, **options):
+        random.seed(1)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            started = time.perf_counter()
+            with transaction.atomic():
+                sample = self.seed(options)
+            if connection.vendor in ('sqlite', 'postgresql'):
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s\n')
+
+            for title, model, index_name, queryset in self.cases(sample):
+                self.benchmark(title, model, index_name, queryset, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+        self.stdout.write(self.style.SUCCESS('Done, test database removed'))
+
+    def seed(self, options):
+        """Insert the dataset with bulk_create and return ids to query for"""
+        today = datetime.date.today()
+        stamp = int(time.time())
+
+        courses = Course.objects.bulk_create([
+            Course(name=f'Bench Class {i}') for i in range(options['courses'])
+        ])
+        exams = Examination.objects.bulk_create([
+            Examination(name=f'Bench Exam {i}') for i in range(options['exams'])
+        ])
+        fee_heads = FeeHead.objects.bulk_create([
+            FeeHead(name=name) for name in ('Tuition', 'Transport', 'Hostel', 'Books')
+        ])
+        expense_head = ExpenseHead.objects.create(name='Bench Expenses')
+
+        users = CustomUser.objects.bulk_create([
+            CustomUser(
+                username=f'bench_{stamp}_{i}',
+                email=f'bench_{stamp}_{i}@example.com',
+                first_name='Bench',
+                last_name=str(i),
+                user_type=3,
+                password='!',
+            )
+            for i in range(options['courses'] * options['students'])
+        ])
+        students = Student.objects.bulk_create([
+            Student(admin=user, address='', gender='Male', course_id=courses[i % len(courses)])
+            for i, user in enumerate(users)
+        ])
+        students_by_course = {}
+        for student in students:
+            students_by_course.setdefault(student.course_id_id, []).append(student)
+
+        days = [today - datetime.timedelta(days=d) for d in range(options['days'])]
+        attendances = Attendance.objects.bulk_create([
+            Attendance(course=course, attendance_date=day)
+            for course in courses for day in days
+        ], batch_size=2000)
+        Attendance_Report.objects.bulk_create((
+            Attendance_Report(student=student, attendance=attendance, is_present=random.random() < 0.9)
+            for attendance in attendances
+            for student in students_by_course[attendance.course_id]
+        ), batch_size=5000)
+
+        subjects = Subject.objects.bulk_create([
+            Subject(name=f'Bench Subject {i}', course=course)
+            for course in courses for i in range(options['subjects'])
+        ])
+        Student_Result.objects.bulk_create((
+            Student_Result(
+                student=student,
+                subject=subject,
+                exam=exam,
+                ce_marks=random.randint(0, 100),
+                te_marks=random.randint(0, 100),
+            )
+            for subject in subjects
+            for student in students_by_course[subject.course_id]
+            for exam in exams
+        ), batch_size=5000)
+
+        invoices = StudentInvoice.objects.bulk_create((
+            StudentInvoice(
+                student=student,
+                fee_head=fee_head,
+                amount=Decimal('1500.00'),
+                is_paid=random.random() < 0.7,
+            )
+            for student in students for fee_head in fee_heads
+        ), batch_size=5000)
+        payments = FeePayment.objects.bulk_create((
+            FeePayment(student=invoice.student, invoice=invoice, amount=invoice.amount)
+            for invoice in invoices if invoice.is_paid
+        ), batch_size=5000)
+        # payment_date is auto_now_add, spread it over the term afterwards
+        for payment in payments:
+            payment.payment_date = random.choice(days)
+        FeePayment.objects.bulk_update(payments, ['payment_date'], batch_size=5000)
+        Expense.objects.bulk_create((
+            Expense(
+                head=expense_head,
+                amount=Decimal(random.randint(100, 5000)),
+                date=random.choice(days),
+                description='Bench',
+            )
+            for _ in range(options['days'] * 10)
+        ), batch_size=5000)
+
+        return {
+            'student': random.choice(students),
+            'subject': random.choice(subjects),
+            'exam': random.choice(exams),
+            'start': days[len(days) // 2],
+            'end': days[0],
+        }
+
+    def cases(self, sample):
+        """(title, model, index name, queryset) mirroring what the views run"""
+        student, start, end = sample['student'], sample['start'], sample['end']
+        return [
+            (
+                'Attendance sheet of a class on a day (take/update attendance)',
+                Attendance,
+                None,
+                Attendance.objects.filter(course_id=student.course_id_id, attendance_date=end),
+            ),
+            (
+                'Attendance history of a student (get_student_attendance_data)',
+                Attendance_Report,
+                'hadiya_atte_student_12ca0f_idx',
+                Attendance_Report.objects.filter(
+                    student=student, attendance__attendance_date__range=[start, end]
+                ).order_by('-attendance__attendance_date').values_list(
+                    'attendance__attendance_date', 'is_present', 'leave_status'
+                ),
+            ),
+            (
+                'Marks of a subject in an exam (analyze_result)',
+                Student_Result,
+                'hadiya_stud_subject_c3b2a7_idx',
+                Student_Result.objects.filter(subject=sample['subject'], exam=sample['exam']),
+            ),
+            (
+                'Open dues of a student (fee_collection)',
+                StudentInvoice,
+                'invoice_open_dues_idx',
+                StudentInvoice.objects.filter(student=student, is_paid=False).order_by('created_at', 'id'),
+            ),
+            (
+                'Payments of a day (daily_collection_report)',
+                FeePayment,
+                'hadiya_feep_payment_a79ced_idx',
+                FeePayment.objects.filter(payment_date=end),
+            ),
+            (
+                'Expenses in a range (expense_reports)',
+                Expense,
+                'hadiya_expe_date_04dabd_idx',
+                Expense.objects.filter(date__range=[start, end]).values('head').annotate(total=Sum('amount')),
+            ),
+        ]
+
+    def benchmark(self, title, model, index_name, queryset, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+
+        index = next((i for i in model._meta.indexes if i.name == index_name), None)
+        if index is None:
+            # Backed by a unique constraint, which cannot be dropped to compare
+            results = [('covered by constraint', self.measure(queryset, repeat))]
+        else:
+            with connection.schema_editor() as editor:
+                editor.remove_index(model, index)
+            before = self.measure(queryset, repeat)
+            with connection.schema_editor() as editor:
+                editor.add_index(model, index)
+            results = [('without index', before), ('with index', self.measure(queryset, repeat))]
+
+        for label, (plan, elapsed) in results:
+            self.stdout.write(f'  {label}: {elapsed * 1000:.2f} ms')
+            for line in plan.splitlines():
+                self.stdout.write(f'    {line}')
+        self.stdout.write('')
+
+    def measure(self, queryset, repeat):
+        """Query plan and mean wall time of the queryset"""
+        plan = queryset.explain()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            list(queryset.all())
+        return plan, (time.perf_counter() - started) / repeat
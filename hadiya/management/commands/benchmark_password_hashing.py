@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand
+
+from hadiya.passwords import hash_passwords, hash_workers
+
+
+class Command(BaseCommand):
+    help = (
+        'Hash a batch of passwords the way the bulk student and staff imports '
+        'do and report rows per second for 1, 2, 4 and every core worker '
+        'processes, pool start-up included.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200, help='Passwords to hash per run')
+        parser.add_argument(
+            '--workers', type=int, nargs='+',
+            help='Pool sizes to try (default: 1 2 4 and the number of cores)'
+        )
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        cores = os.cpu_count() or 1
+        pool_sizes = options['workers'] or sorted({1, 2, 4, cores})
+        passwords = [f'bench-{i}' for i in range(rows)]
+
+        hasher = get_hasher()
+        self.stdout.write(
+            f'{rows} passwords with {hasher.algorithm} ({cores} cores, '
+            f'PASSWORD_HASH_WORKERS resolves to {hash_workers()})'
+        )
+        self.stdout.write(f"{'Workers':>8} {'Seconds':>9} {'Rows/s':>9} {'Speed-up':>9}")
+
+        baseline = None
+        for workers in pool_sizes:
+            started = time.perf_counter()
+            hashed = hash_passwords(passwords, workers)
+            elapsed = time.perf_counter() - started
+            assert len(hashed) == rows and hasher.verify(passwords[-1], hashed[-1])
+
+            baseline = baseline or elapsed
+            self.stdout.write(f'{workers:>8} {elapsed:>9.2f} {rows / elapsed:>9.1f} {baseline / elapsed:>8.2f}x')
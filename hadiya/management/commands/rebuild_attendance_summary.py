@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from hadiya.attendance import rebuild_attendance_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly AttendanceSummary rollup from Attendance_Report'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        count = rebuild_attendance_summary(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} attendance summary rows'))
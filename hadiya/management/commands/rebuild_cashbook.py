@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hadiya.cashbook import rebuild_cashbook
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily cashbook rollup (DailyCashbook, DailyFeeCollection) from payments, incomes and expenses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild, YYYY-MM-DD (default: the beginning)')
+        parser.add_argument('--end', help='Last day to rebuild, YYYY-MM-DD (default: the end)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            start, end = [
+                datetime.datetime.strptime(options[name], '%Y-%m-%d').date() if options[name] else None
+                for name in ('start', 'end')
+            ]
+        except ValueError:
+            raise CommandError('--start and --end must be dates in YYYY-MM-DD format')
+
+        count = rebuild_cashbook(start, end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} cashbook days'))
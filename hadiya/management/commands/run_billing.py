@@ -0,0 +1,35 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from hadiya.billing import run_billing
+
+
+class Command(BaseCommand):
+    help = (
+        'Raise the monthly and installment invoices of a month for the whole '
+        'school. Schedule it for the first of every month; billing a month '
+        'that was already billed does nothing.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--period', help='Month to bill as YYYY-MM (default: the current month)')
+        parser.add_argument('--force', action='store_true', help='Bill the month again for students it missed')
+
+    def handle(self, *args, **options):
+        if options['period']:
+            try:
+                period = datetime.datetime.strptime(options['period'], '%Y-%m').date()
+            except ValueError:
+                raise CommandError('--period must look like 2025-06')
+        else:
+            period = timezone.localdate().replace(day=1)
+
+        run = run_billing(period, force=options['force'])
+        if run is None:
+            self.stdout.write(self.style.WARNING(f'{period:%B %Y} is already billed, nothing to do'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Billed {period:%B %Y}: {run.invoices_created} invoices in {run.run_seconds:.2f}s'
+        ))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from hadiya.pdf_jobs import requeue_stale_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = 'Render queued PdfJob rows in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: settings.PDF_WORKERS)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between queue checks')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue jobs running longer than this many seconds')
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_after'])
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale jobs'))
+
+        try:
+            run_worker(
+                workers=options['workers'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+                log=self.stdout.write
+            )
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS('PDF worker stopped'))
@@ -0,0 +1,132 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+
+from hadiya.fee_payments import collect_payment
+from hadiya.models import (
+    Course, CustomUser, DailyCashbook, DailyFeeCollection, FeeHead, FeePayment, InvoiceAllocation, Student,
+    StudentInvoice,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Take payments for the same few students from many threads at once '
+        'in a throwaway test database, then check that no due was allocated '
+        'twice and every rupee is accounted for, in the cashbook too.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Cashier threads')
+        parser.add_argument('--payments', type=int, default=25, help='Payments per thread')
+        parser.add_argument('--students', type=int, default=3, help='Students the threads compete for')
+        parser.add_argument('--invoices', type=int, default=12, help='Open invoices per student')
+
+    def handle(self, *args, **options):
+        random.seed(1)
+        old_name = connection.settings_dict['NAME']
+        tmp_dir = None
+        if connection.vendor == 'sqlite':
+            # The default in-memory SQLite test database is not shared by threads
+            tmp_dir = tempfile.mkdtemp()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(tmp_dir, 'stress.sqlite3')
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            student_ids, opening = self.seed(options)
+            elapsed, errors = self.hammer(student_ids, options)
+            problems = self.reconcile(student_ids, opening)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            if tmp_dir:
+                os.rmdir(tmp_dir)
+
+        done = options['threads'] * options['payments'] - len(errors)
+        self.stdout.write(f'{done} payments in {elapsed:.2f}s ({done / elapsed:.1f}/s), {len(errors)} failed')
+        for error in errors[:5]:
+            self.stdout.write(self.style.ERROR(f'  {error}'))
+        for problem in problems:
+            self.stdout.write(self.style.ERROR(problem))
+        if problems or errors:
+            raise CommandError('Fee collection is not consistent under concurrent load')
+        self.stdout.write(self.style.SUCCESS('All invoices, allocations and advance balances reconcile'))
+
+    def seed(self, options):
+        """Students with open invoices and some advance; returns their ids and opening advance"""
+        course = Course.objects.create(name='Stress Class')
+        head = FeeHead.objects.create(name='Tuition')
+        opening = {}
+        for i in range(options['students']):
+            user = CustomUser.objects.create_user(
+                username=f'stress_{i}', email=f'stress_{i}@example.com', password=None, user_type=3
+            )
+            advance = Decimal(random.randint(0, 500))
+            student = Student.objects.create(admin=user, address='', gender='Male', course_id=course, advance_balance=advance)
+            StudentInvoice.objects.bulk_create([
+                StudentInvoice(student=student, fee_head=head, amount=Decimal(random.randint(500, 3000)))
+                for _ in range(options['invoices'])
+            ])
+            opening[student.id] = advance
+        return list(opening), opening
+
+    def hammer(self, student_ids, options):
+        errors = []
+        start = threading.Barrier(options['threads'])
+
+        def cashier(seed):
+            rng = random.Random(seed)
+            try:
+                start.wait()
+                for _ in range(options['payments']):
+                    amount = Decimal(rng.randint(1, 200000)) / 100
+                    try:
+                        collect_payment(rng.choice(student_ids), amount, 'Cash', 'stress')
+                    except Exception as e:
+                        errors.append(repr(e))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=cashier, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started, errors
+
+    def reconcile(self, student_ids, opening):
+        problems = []
+        for invoice in StudentInvoice.objects.filter(student_id__in=student_ids):
+            allocated = invoice.allocations.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            if allocated != invoice.paid_amount:
+                problems.append(f'Invoice #{invoice.id}: paid {invoice.paid_amount} but allocations total {allocated}')
+            if invoice.paid_amount > invoice.amount:
+                problems.append(f'Invoice #{invoice.id}: paid {invoice.paid_amount} of {invoice.amount}')
+            if invoice.is_paid != (invoice.paid_amount >= invoice.amount):
+                problems.append(f'Invoice #{invoice.id}: is_paid is {invoice.is_paid} at {invoice.paid_amount} of {invoice.amount}')
+
+        for student in Student.objects.filter(id__in=student_ids):
+            paid = FeePayment.objects.filter(student=student).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            allocated = InvoiceAllocation.objects.filter(invoice__student=student).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+            if opening[student.id] + paid != allocated + student.advance_balance:
+                problems.append(
+                    f'Student #{student.id}: opening advance {opening[student.id]} + paid {paid} != '
+                    f'allocated {allocated} + advance {student.advance_balance}'
+                )
+            open_due = StudentInvoice.objects.filter(student=student, is_paid=False).exists()
+            if open_due and student.advance_balance > 0:
+                problems.append(f'Student #{student.id}: advance {student.advance_balance} left with dues open')
+
+        paid = FeePayment.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        booked = DailyCashbook.objects.aggregate(total=Sum('fee_collection'))['total'] or Decimal('0')
+        split = DailyFeeCollection.objects.aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        if not paid == booked == split:
+            problems.append(f'Cashbook: payments total {paid}, cashbook {booked}, collection rows {split}')
+        return problems
@@ -0,0 +1,59 @@
+from django.contrib import messages
+from django.contrib.auth.views import redirect_to_login
+from django.shortcuts import redirect
+
+from hadiya.access import count_denial, route_roles
+from hadiya.profiles import get_profile
+from hadiya.responses import json_response
+
+
+class ProfileMiddleware:
+    """
+    Sets request.profile to the user's Staff/Student/Accountant/Management
+    row (None for the HOD and anonymous users), cached by hadiya.profiles.
+    Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.profile = get_profile(request.user)
+        return self.get_response(request)
+
+
+class AccessMiddleware:
+    """
+    Checks every routed request against hadiya.access.ROLE_POLICY: anonymous
+    users go to the login page, users of another type get a 403 on AJAX
+    requests and are sent back to their dashboard otherwise. The route table
+    is built once, when the middleware is loaded.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.route_roles = route_roles()
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.route
+        roles = self.route_roles.get(route)
+        if roles is None:
+            return None
+
+        if not request.user.is_authenticated:
+            count_denial(route)
+            if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+                return json_response(request, {'error': 'Login required.'}, status=401)
+            return redirect_to_login(request.get_full_path())
+
+        if request.user.user_type in roles:
+            return None
+
+        count_denial(route)
+        if request.headers.get('x-requested-with') == 'XMLHttpRequest':
+            return json_response(request, {'error': 'Access denied.'}, status=403)
+        messages.error(request, 'Access denied.')
+        return redirect('home')
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import TruncMonth
+
+
+def populate_attendance_summary(apps, schema_editor):
+    Attendance = apps.get_model('hadiya', 'Attendance')
+    Attendance_Report = apps.get_model('hadiya', 'Attendance_Report')
+    AttendanceSummary = apps.get_model('hadiya', 'AttendanceSummary')
+
+    # Only the latest Attendance per (course, date) counts
+    latest = Attendance.objects.filter(
+        course=OuterRef('course'),
+        attendance_date=OuterRef('attendance_date'),
+    ).order_by('-updated_at', '-id').values('id')[:1]
+    valid_attendance = Attendance.objects.filter(id=Subquery(latest))
+
+    rows = Attendance_Report.objects.filter(attendance__in=valid_attendance).annotate(
+        month=TruncMonth('attendance__attendance_date')
+    ).values('student', 'attendance__course', 'month').annotate(
+        present=Count('id', filter=Q(is_present=True)),
+        absent=Count('id', filter=Q(is_present=False)),
+        informed_leave=Count('id', filter=Q(is_present=False, leave_status='Informed')),
+    ).order_by()
+
+    AttendanceSummary.objects.bulk_create(
+        (
+            AttendanceSummary(
+                student_id=row['student'],
+                course_id=row['attendance__course'],
+                month=row['month'],
+                present_count=row['present'],
+                absent_count=row['absent'],
+                informed_leave_count=row['informed_leave'],
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0012_attendance_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('present_count', models.IntegerField(default=0)),
+                ('absent_count', models.IntegerField(default=0)),
+                ('informed_leave_count', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hadiya.course')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_summaries', to='hadiya.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['course', 'month'], name='hadiya_atte_course__ddc45c_idx')],
+                'unique_together': {('student', 'course', 'month')},
+            },
+        ),
+        migrations.RunPython(populate_attendance_summary, migrations.RunPython.noop),
+    ]
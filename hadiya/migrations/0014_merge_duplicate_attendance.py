@@ -0,0 +1,75 @@
+from django.db import migrations
+from django.db.models import Count, Q
+from django.db.models.functions import TruncMonth
+
+
+def merge_duplicate_attendance(apps, schema_editor):
+    """
+    Collapse Attendance rows sharing a (course, attendance_date) into the most
+    recently updated one. Students only marked on an older sheet keep their
+    latest report, moved onto the surviving sheet.
+    """
+    Attendance = apps.get_model('hadiya', 'Attendance')
+    Attendance_Report = apps.get_model('hadiya', 'Attendance_Report')
+
+    duplicates = Attendance.objects.values('course', 'attendance_date').annotate(
+        sheets=Count('id')
+    ).filter(sheets__gt=1).order_by()
+
+    for duplicate in duplicates:
+        sheets = list(Attendance.objects.filter(
+            course=duplicate['course'],
+            attendance_date=duplicate['attendance_date']
+        ).order_by('-updated_at', '-id').values_list('id', flat=True))
+        keep, older = sheets[0], sheets[1:]
+
+        marked = set(Attendance_Report.objects.filter(attendance_id=keep).values_list('student_id', flat=True))
+        # Older sheets newest first, so the first report seen per student is the latest one
+        for attendance_id in older:
+            for report in Attendance_Report.objects.filter(attendance_id=attendance_id):
+                if report.student_id not in marked:
+                    marked.add(report.student_id)
+                    Attendance_Report.objects.filter(id=report.id).update(attendance_id=keep)
+
+        Attendance.objects.filter(id__in=older).delete()
+
+
+def rebuild_attendance_summary(apps, schema_editor):
+    Attendance_Report = apps.get_model('hadiya', 'Attendance_Report')
+    AttendanceSummary = apps.get_model('hadiya', 'AttendanceSummary')
+
+    rows = Attendance_Report.objects.annotate(
+        month=TruncMonth('attendance__attendance_date')
+    ).values('student', 'attendance__course', 'month').annotate(
+        present=Count('id', filter=Q(is_present=True)),
+        absent=Count('id', filter=Q(is_present=False)),
+        informed_leave=Count('id', filter=Q(is_present=False, leave_status='Informed')),
+    ).order_by()
+
+    AttendanceSummary.objects.all().delete()
+    AttendanceSummary.objects.bulk_create(
+        (
+            AttendanceSummary(
+                student_id=row['student'],
+                course_id=row['attendance__course'],
+                month=row['month'],
+                present_count=row['present'],
+                absent_count=row['absent'],
+                informed_leave_count=row['informed_leave'],
+            )
+            for row in rows
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0013_attendancesummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_attendance, migrations.RunPython.noop),
+        migrations.RunPython(rebuild_attendance_summary, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0014_merge_duplicate_attendance'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='attendance',
+            name='idempotency_key',
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['attendance_date'], name='hadiya_atte_attenda_da6fc2_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='attendance',
+            constraint=models.UniqueConstraint(fields=('course', 'attendance_date'), name='unique_course_attendance_date'),
+        ),
+    ]
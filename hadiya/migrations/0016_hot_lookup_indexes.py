@@ -0,0 +1,33 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0015_attendance_unique_course_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance_report',
+            index=models.Index(fields=['student', 'attendance', 'is_present'], name='hadiya_atte_student_12ca0f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='expense',
+            index=models.Index(fields=['date'], name='hadiya_expe_date_04dabd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feepayment',
+            index=models.Index(fields=['payment_date'], name='hadiya_feep_payment_a79ced_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student_result',
+            index=models.Index(fields=['subject', 'exam'], name='hadiya_stud_subject_c3b2a7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studentinvoice',
+            index=models.Index(fields=['student', 'is_paid', 'created_at'], name='hadiya_stud_student_795d03_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0017_pdf_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfjob',
+            name='cache_hit',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0019_import_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month billed', unique=True)),
+                ('invoices_created', models.IntegerField(default=0)),
+                ('run_seconds', models.FloatField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='feestructure',
+            name='billing_cycle',
+            field=models.CharField(choices=[('once', 'Once'), ('installments', 'Installments'), ('monthly', 'Monthly')], default='once', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='studentinvoice',
+            name='billing_period',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='studentinvoice',
+            index=models.Index(fields=['billing_period', 'fee_head'], name='hadiya_stud_billing_811c0d_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:36
+
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# hadiya.search.normalize as of this migration
+SEPARATORS = re.compile(r'[^\w@.+]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(SEPARATORS.sub(' ', text.lower()).split())
+
+
+def populate_search_text(apps, schema_editor):
+    Student = apps.get_model('hadiya', 'Student')
+    students = list(Student.objects.select_related('admin'))
+    for student in students:
+        user = student.admin
+        student.search_text = normalize(' '.join([
+            user.first_name, user.last_name, user.username, user.email, student.phone_number or ''
+        ]))[:255]
+    Student.objects.bulk_update(students, ['search_text'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0020_billing_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='student',
+            name='search_text',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(populate_search_text, migrations.RunPython.noop),
+    ]
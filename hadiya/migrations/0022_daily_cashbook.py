@@ -0,0 +1,85 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:39
+
+import django.db.models.deletion
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_cashbook(apps, schema_editor):
+    FeePayment = apps.get_model('hadiya', 'FeePayment')
+    InvoiceAllocation = apps.get_model('hadiya', 'InvoiceAllocation')
+    Income = apps.get_model('hadiya', 'Income')
+    Expense = apps.get_model('hadiya', 'Expense')
+    DailyFeeCollection = apps.get_model('hadiya', 'DailyFeeCollection')
+    DailyCashbook = apps.get_model('hadiya', 'DailyCashbook')
+
+    # Unallocated collection (to/from advance balances) under fee_head None
+    totals = {}
+    for row in FeePayment.objects.values('payment_date', 'payment_mode', 'student__course_id').annotate(
+        total=Sum('amount')
+    ).order_by():
+        totals[(row['payment_date'], row['payment_mode'], row['student__course_id'], None)] = row['total']
+    for row in InvoiceAllocation.objects.values(
+        'payment__payment_date', 'payment__payment_mode', 'payment__student__course_id', 'invoice__fee_head'
+    ).annotate(total=Sum('amount')).order_by():
+        day = (row['payment__payment_date'], row['payment__payment_mode'], row['payment__student__course_id'])
+        totals[day + (row['invoice__fee_head'],)] = totals.get(day + (row['invoice__fee_head'],), Decimal('0')) + row['total']
+        totals[day + (None,)] = totals.get(day + (None,), Decimal('0')) - row['total']
+    DailyFeeCollection.objects.bulk_create(
+        (
+            DailyFeeCollection(date=date, payment_mode=mode, course_id=course_id, fee_head_id=fee_head_id, amount=amount)
+            for (date, mode, course_id, fee_head_id), amount in totals.items()
+            if amount
+        ),
+        batch_size=1000,
+    )
+
+    days = {}
+    for row in FeePayment.objects.values('payment_date').annotate(total=Sum('amount'), count=Count('id')).order_by():
+        day = days.setdefault(row['payment_date'], DailyCashbook(date=row['payment_date']))
+        day.fee_collection = row['total']
+        day.payment_count = row['count']
+    for row in Income.objects.values('date').annotate(total=Sum('amount')).order_by():
+        days.setdefault(row['date'], DailyCashbook(date=row['date'])).other_income = row['total']
+    for row in Expense.objects.values('date').annotate(total=Sum('amount')).order_by():
+        days.setdefault(row['date'], DailyCashbook(date=row['date'])).expenses = row['total']
+    DailyCashbook.objects.bulk_create(days.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0021_student_search_text'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyCashbook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True)),
+                ('fee_collection', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('other_income', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expenses', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyFeeCollection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_mode', models.CharField(max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='hadiya.course')),
+                ('fee_head', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='hadiya.feehead')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'payment_mode'], name='hadiya_dail_date_57b38b_idx')],
+            },
+        ),
+        migrations.RunPython(populate_cashbook, migrations.RunPython.noop),
+    ]
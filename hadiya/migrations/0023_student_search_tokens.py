@@ -0,0 +1,54 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:58
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# hadiya.search.search_tokens as of this migration
+WORD_PARTS = re.compile(r'[@.+]+')
+TOKEN_LENGTH = 64
+
+
+def search_tokens(search_text):
+    tokens = set()
+    for word in search_text.split():
+        tokens.add(word[:TOKEN_LENGTH])
+        tokens.update(part[:TOKEN_LENGTH] for part in WORD_PARTS.split(word) if part)
+    return tokens
+
+
+def populate_search_tokens(apps, schema_editor):
+    Student = apps.get_model('hadiya', 'Student')
+    StudentSearchToken = apps.get_model('hadiya', 'StudentSearchToken')
+    StudentSearchToken.objects.bulk_create(
+        (
+            StudentSearchToken(student_id=student_id, token=token)
+            for student_id, search_text in Student.objects.values_list('id', 'search_text').iterator()
+            for token in search_tokens(search_text)
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0022_daily_cashbook'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='hadiya.student')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'student'], name='hadiya_stud_token_7e7844_idx')],
+                'unique_together': {('student', 'token')},
+            },
+        ),
+        migrations.RunPython(populate_search_tokens, migrations.RunPython.noop),
+    ]
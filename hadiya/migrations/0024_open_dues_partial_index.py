@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0023_student_search_tokens'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='studentinvoice',
+            name='hadiya_stud_student_795d03_idx',
+        ),
+        migrations.AddIndex(
+            model_name='studentinvoice',
+            index=models.Index(condition=models.Q(('is_paid', False)), fields=['student', 'created_at', 'id'], name='invoice_open_dues_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:14
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0024_open_dues_partial_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feestructure',
+            name='installments',
+            field=models.IntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:14
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def set_heartbeats(apps, schema_editor):
+    # Jobs running before the upgrade count from when they were started
+    ImportJob = apps.get_model('hadiya', 'ImportJob')
+    ImportJob.objects.filter(status='running').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0025_fee_structure_installments_min'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(set_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hadiya', '0026_import_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailyfeecollection',
+            name='fee_head',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='hadiya.feehead'),
+        ),
+    ]
@@ -1,8 +1,9 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.validators import MinValueValidator
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
-import datetime
+import uuid
 
 
 class CustomUser(AbstractUser):
@@ -130,6 +131,8 @@ class Student(models.Model):
     advance_balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
     
     phone_number = models.CharField(max_length=15, blank=True, null=True)
+    # Normalised name, username, email and phone for the student search
+    search_text = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -137,6 +140,18 @@ class Student(models.Model):
         return f"{self.admin.first_name} {self.admin.last_name} - {self.course_id.name}"
 
 
+class StudentSearchToken(models.Model):
+    """One word of a student's search_text, so the search can match word prefixes on an index"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        unique_together = ('student', 'token')
+        indexes = [
+            models.Index(fields=['token', 'student']),
+        ]
+
+
 # --- ACCOUNTS MODULE MODELS ---
 
 class FeeHead(models.Model):
@@ -152,10 +167,17 @@ class FeeHead(models.Model):
 
 class FeeStructure(models.Model):
     """Mapping FeeHeads to Courses with Amounts and Installments"""
+    BILLING_CYCLE_CHOICES = (
+        ('once', 'Once'), # Invoiced in full on admission / Generate Invoices
+        ('installments', 'Installments'), # amount / installments per billing run
+        ('monthly', 'Monthly'), # amount every billing run
+    )
+
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='course_fee_structures')
     fee_head = models.ForeignKey(FeeHead, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=12, decimal_places=2)
-    installments = models.IntegerField(default=1)
+    installments = models.IntegerField(default=1, validators=[MinValueValidator(1)])
+    billing_cycle = models.CharField(max_length=20, choices=BILLING_CYCLE_CHOICES, default='once')
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -177,10 +199,21 @@ class StudentInvoice(models.Model):
     paid_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     is_paid = models.BooleanField(default=False)
     payment_date = models.DateField(null=True, blank=True) # Last payment date
+    billing_period = models.DateField(null=True, blank=True) # Month of the BillingRun that raised it
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Open dues of a student, oldest first (fee collection). Partial, as
+            # is_paid=False is NOT is_paid in SQL, which no index column can match
+            models.Index(
+                fields=['student', 'created_at', 'id'], condition=models.Q(is_paid=False), name='invoice_open_dues_idx'
+            ),
+            models.Index(fields=['billing_period', 'fee_head']),
+        ]
+
     def __str__(self):
         return f"{self.student.admin.first_name} - {self.fee_head.name} - {self.amount}"
 
@@ -198,6 +231,11 @@ class FeePayment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['payment_date']),
+        ]
+
     def __str__(self):
         return f"{self.student.admin.first_name} - {self.amount}"
 
@@ -214,6 +252,18 @@ class InvoiceAllocation(models.Model):
         return f"Pay #{self.payment.id} -> Inv #{self.invoice.id}: {self.amount}"
 
 
+class BillingRun(models.Model):
+    """Ledger of recurring billing runs, one per month, so a month is never billed twice"""
+    period = models.DateField(unique=True, help_text='First day of the month billed')
+    invoices_created = models.IntegerField(default=0)
+    run_seconds = models.FloatField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.period:%b %Y} - {self.invoices_created} invoices"
+
+
 class ExpenseHead(models.Model):
     """Categories for Expenses e.g., Salary, Maintenance, Electricity"""
     name = models.CharField(max_length=100)
@@ -235,6 +285,11 @@ class Expense(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
     def __str__(self):
         return f"{self.head.name} - {self.amount}"
 
@@ -254,6 +309,41 @@ class Income(models.Model):
         return f"{self.source} - {self.amount}"
 
 
+class DailyFeeCollection(models.Model):
+    """Fees collected per day, payment mode, course and fee head, maintained by hadiya.cashbook"""
+    date = models.DateField()
+    payment_mode = models.CharField(max_length=50)
+    course = models.ForeignKey(Course, on_delete=models.SET_NULL, null=True, blank=True)
+    # None: the part of the collection added to (or taken from) advance balances.
+    # PROTECT, so a deleted head's fees never turn into advance rows.
+    fee_head = models.ForeignKey(FeeHead, on_delete=models.PROTECT, null=True, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date', 'payment_mode']),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.payment_mode} - {self.amount}"
+
+
+class DailyCashbook(models.Model):
+    """Money in and out per day: fees, other income and expenses, maintained by hadiya.cashbook"""
+    date = models.DateField(unique=True)
+    fee_collection = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment_count = models.IntegerField(default=0)
+    other_income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    expenses = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def net(self):
+        return self.fee_collection + self.other_income - self.expenses
+
+    def __str__(self):
+        return f"{self.date} - in {self.fee_collection + self.other_income} / out {self.expenses}"
+
+
 # ------------------------------
 
 
@@ -264,8 +354,14 @@ class Attendance(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
-    # class Meta:
-    #     unique_together = ('course', 'attendance_date', 'session_year_id')
+    class Meta:
+        # One roll call per course per day; saving the same day again updates it
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'attendance_date'], name='unique_course_attendance_date'),
+        ]
+        indexes = [
+            models.Index(fields=['attendance_date']),
+        ]
 
     def __str__(self):
         return f"{self.course.name} - {self.attendance_date}"
@@ -279,10 +375,36 @@ class Attendance_Report(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Per-student history and present/absent counts
+            models.Index(fields=['student', 'attendance', 'is_present']),
+        ]
+
     def __str__(self):
         return f"{self.student.admin.first_name} - {self.attendance.attendance_date} - {'Present' if self.is_present else 'Absent'}"
 
 
+class AttendanceSummary(models.Model):
+    """Monthly attendance counts per student and course, maintained from Attendance_Report"""
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='attendance_summaries')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    month = models.DateField(help_text='First day of the month')
+    present_count = models.IntegerField(default=0)
+    absent_count = models.IntegerField(default=0)
+    informed_leave_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('student', 'course', 'month')
+        indexes = [
+            models.Index(fields=['course', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.student.admin.first_name} - {self.month:%b %Y} - {self.present_count}/{self.present_count + self.absent_count}"
+
+
 class Student_Result(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
@@ -294,6 +416,10 @@ class Student_Result(models.Model):
     
     class Meta:
         unique_together = ('student', 'subject', 'exam')
+        indexes = [
+            # Class-wise marks of one subject in one exam
+            models.Index(fields=['subject', 'exam']),
+        ]
     
     def total_marks(self):
         return self.ce_marks + self.te_marks
@@ -411,9 +537,98 @@ class News(models.Model):
         return self.title
 
 
+class PdfJob(models.Model):
+    """A PDF rendered in the background by the run_pdf_worker command"""
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    )
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=50) # Key into hadiya.pdf_jobs.PDF_BUILDERS
+    params = models.JSONField(default=dict)
+    filename = models.CharField(max_length=200)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='pdf_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    file = models.FileField(upload_to='pdf_jobs/', blank=True, null=True) # Points into hadiya.pdf_cache
+    cache_hit = models.BooleanField(default=False)
+    error = models.TextField(blank=True)
+
+    # Timings: queue wait is started - created, render_seconds is the time
+    # spent loading data and running xhtml2pdf
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    render_seconds = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def wait_seconds(self):
+        if self.started_at:
+            return (self.started_at - self.created_at).total_seconds()
+        return None
+
+    def total_seconds(self):
+        if self.finished_at:
+            return (self.finished_at - self.created_at).total_seconds()
+        return None
+
+    def __str__(self):
+        return f"{self.kind} - {self.filename} - {self.status}"
+
+
+class ImportJob(models.Model):
+    """An Excel upload processed in the background by the run_import_worker command"""
+    KIND_CHOICES = (
+        ('student', 'Students'),
+        ('staff', 'Staff'),
+        ('subject', 'Subjects'),
+    )
+    STATUS_CHOICES = PdfJob.STATUS_CHOICES
+
+    token = models.UUIDField(default=uuid.uuid4, unique=True, editable=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES) # Key into hadiya.bulk_import.IMPORTERS
+    file = models.FileField(upload_to='import_jobs/')
+    filename = models.CharField(max_length=200)
+    requested_by = models.ForeignKey(CustomUser, on_delete=models.SET_NULL, null=True, blank=True, related_name='import_jobs')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+
+    # Progress: total_rows is known once the sheet is validated
+    total_rows = models.IntegerField(default=0)
+    created_rows = models.IntegerField(default=0)
+    failed_rows = models.IntegerField(default=0)
+    errors = models.JSONField(default=list) # [{ row, values, message }] for every rejected row
+    error = models.TextField(blank=True) # Why the whole job failed
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True) # Last sign of life from the worker running it
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def remaining_rows(self):
+        return max(self.total_rows - self.created_rows - self.failed_rows, 0)
+
+    def __str__(self):
+        return f"{self.kind} - {self.filename} - {self.status}"
+
+
+# Student.search_text is built from these user fields
+SEARCH_USER_FIELDS = {'first_name', 'last_name', 'email', 'username'}
+
+
 # Signals to auto-create profiles
 @receiver(post_save, sender=CustomUser)
-def create_user_profile(sender, instance, created, **kwargs):
+def create_user_profile(sender, instance, created, update_fields=None, **kwargs):
     if created:
         if instance.user_type == 2:  # Staff
             Staff.objects.create(
@@ -443,37 +658,124 @@ def create_user_profile(sender, instance, created, **kwargs):
             instance.accountant.save()
         elif instance.user_type == 5:
             instance.management.save()
+        elif instance.user_type == 3:
+            # Name or email may have changed: refresh the search text. A
+            # login saves only last_login.
+            if update_fields and not set(update_fields) & SEARCH_USER_FIELDS:
+                return
+            from hadiya.search import set_search_tokens, student_search_text
+            students = list(Student.objects.filter(admin=instance))
+            for student in students:
+                student.search_text = student_search_text(student, instance)
+                Student.objects.filter(id=student.id).update(search_text=student.search_text)
+            set_search_tokens(students)
+
+
+@receiver(pre_save, sender=Student)
+def update_student_search_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'search_text' not in update_fields and 'phone_number' not in update_fields:
+        return
+    from hadiya.search import student_search_text
+    instance.search_text = student_search_text(instance)
+
+
+@receiver(post_save, sender=Student)
+def update_student_search_tokens(sender, instance, update_fields=None, **kwargs):
+    if update_fields and 'search_text' not in update_fields and 'phone_number' not in update_fields:
+        return
+    from hadiya.search import set_search_tokens
+    set_search_tokens([instance])
 
 
 @receiver(post_save, sender=Student)
 def create_student_invoices(sender, instance, created, **kwargs):
     if created:
         # Fetch Fee Structures for the Course
+        from hadiya.billing import build_student_invoices
         try:
-            structures = FeeStructure.objects.filter(course=instance.course_id)
-            for structure in structures:
-                head_name = structure.fee_head.name.lower()
-                amount_to_charge = structure.amount
-                
-                # Conditional Checks
-                if 'hostel' in head_name:
-                    if not instance.uses_hostel:
-                        continue
-                        
-                if 'transport' in head_name or 'bus' in head_name:
-                    if not instance.uses_transport:
-                        continue
-                    # Bus Stop Override
-                    if instance.bus_stop and instance.bus_stop.monthly_fee > 0:
-                        amount_to_charge = instance.bus_stop.monthly_fee
-                        
-                # Create Invoice
-                StudentInvoice.objects.create(
-                    student=instance,
-                    fee_head=structure.fee_head,
-                    amount=amount_to_charge,
-                    due_date=datetime.date.today() + datetime.timedelta(days=30) # Default Due Date: 30 days
-                )
+            structures = FeeStructure.objects.filter(course=instance.course_id).select_related('fee_head')
+            StudentInvoice.objects.bulk_create(build_student_invoices(instance, structures))
         except Exception as e:
             print(f"Error generating auto-invoices: {e}")
 
+
+
+@receiver(pre_save, sender=Income)
+@receiver(pre_save, sender=Expense)
+def remember_cashbook_date(sender, instance, **kwargs):
+    # An edit that moves the entry to another day must recount the old day too
+    instance._previous_date = None
+    if instance.pk:
+        instance._previous_date = sender.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+
+
+@receiver(post_save, sender=FeePayment)
+@receiver(post_delete, sender=FeePayment)
+@receiver(post_save, sender=Income)
+@receiver(post_delete, sender=Income)
+@receiver(post_save, sender=Expense)
+@receiver(post_delete, sender=Expense)
+def update_cashbook(sender, instance, **kwargs):
+    """Recount the cashbook day of a payment, income or expense in the writing transaction"""
+    if getattr(instance, 'skip_cashbook', False):
+        return
+    from hadiya.cashbook import refresh_cashbook
+    date = instance.payment_date if sender is FeePayment else instance.date
+    refresh_cashbook(date)
+    previous = getattr(instance, '_previous_date', None)
+    if previous and previous != date:
+        refresh_cashbook(previous)
+
+
+@receiver(post_delete, sender=InvoiceAllocation)
+def update_cashbook_allocation(sender, instance, **kwargs):
+    """An invoice deleted with its allocations moves that money back to the advance row"""
+    from hadiya.cashbook import refresh_cashbook
+    date = FeePayment.objects.filter(id=instance.payment_id).values_list('payment_date', flat=True).first()
+    if date:
+        refresh_cashbook(date)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=Staff)
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Accountant)
+@receiver([post_save, post_delete], sender=Management)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    """The profile cached for request.profile is stale"""
+    from hadiya import profiles
+    profiles.invalidate(instance.pk if sender is CustomUser else instance.admin_id)
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+@receiver([post_save, post_delete], sender=Student)
+@receiver([post_save, post_delete], sender=Staff)
+@receiver([post_save, post_delete], sender=Course)
+@receiver([post_save, post_delete], sender=Subject)
+@receiver([post_save, post_delete], sender=Student_leave)
+@receiver([post_save, post_delete], sender=Staff_leave)
+@receiver([post_save, post_delete], sender=Student_Feedback)
+@receiver([post_save, post_delete], sender=Staff_Feedback)
+@receiver([post_save, post_delete], sender=Enquiry)
+@receiver([post_save, post_delete], sender=News)
+def invalidate_dashboard_stats(sender, instance, **kwargs):
+    """The cached HOD dashboard counts or recent lists may show this row"""
+    # Logins and fee payments save nothing the dashboard shows
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= {'last_login', 'advance_balance', 'updated_at'}:
+        return
+    from hadiya import dashboard_stats
+    dashboard_stats.invalidate()
+
+
+@receiver(post_save, sender=Student_Result)
+@receiver(post_delete, sender=Student_Result)
+def invalidate_result_pdfs(sender, instance, **kwargs):
+    """Cached progress cards and class sheets showing this result are stale"""
+    from hadiya import pdf_cache
+    course_id = Subject.objects.filter(id=instance.subject_id).values_list('course_id', flat=True).first()
+    pdf_cache.invalidate(
+        instance.exam_id,
+        student_ids=[instance.student_id],
+        course_ids=[course_id] if course_id else []
+    )
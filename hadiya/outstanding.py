@@ -0,0 +1,147 @@
+"""
+Outstanding fees: unpaid invoice balances totalled per course, fee head and
+ageing bucket by the database, the detail rows paged by invoice id (keyset,
+so a late page costs the same as the first) and the full list exported as
+CSV or XLSX a chunk of rows at a time.
+"""
+import csv
+import datetime
+import tempfile
+from decimal import Decimal
+
+import openpyxl
+from django.db.models import Case, CharField, Count, F, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+
+from hadiya.models import StudentInvoice
+
+PAGE_SIZE = 50
+
+# (key, label, most days past due or None); an invoice falls in the first bucket it fits
+AGEING_BUCKETS = (
+    ('not_due', 'Not yet due', -1),
+    ('0_30', '0-30 days', 30),
+    ('31_60', '31-60 days', 60),
+    ('61_90', '61-90 days', 90),
+    ('90_plus', '90+ days', None),
+)
+
+EXPORT_HEADERS = ['Invoice ID', 'Student', 'Email', 'Course', 'Fee Head', 'Due Date',
+                  'Days Overdue', 'Total Amount', 'Paid', 'Balance Due']
+
+
+def outstanding_invoices(as_of=None, course_id=None, fee_head_id=None, bucket=None):
+    """
+    Unpaid invoices with something left to pay, annotated with balance,
+    due (the due date, or the invoice date when there is none) and bucket,
+    the AGEING_BUCKETS key for as_of (default today).
+    """
+    as_of = as_of or datetime.date.today()
+    whens = [
+        When(due__gte=as_of - datetime.timedelta(days=days), then=Value(key))
+        for key, _, days in AGEING_BUCKETS
+        if days is not None
+    ]
+    invoices = StudentInvoice.objects.filter(is_paid=False, paid_amount__lt=F('amount')).annotate(
+        balance=F('amount') - F('paid_amount'),
+        due=Coalesce('due_date', TruncDate('created_at')),
+    ).annotate(
+        bucket=Case(*whens, default=Value(AGEING_BUCKETS[-1][0]), output_field=CharField())
+    )
+    if course_id:
+        invoices = invoices.filter(student__course_id=course_id)
+    if fee_head_id:
+        invoices = invoices.filter(fee_head_id=fee_head_id)
+    if bucket:
+        invoices = invoices.filter(bucket=bucket)
+    return invoices
+
+
+def outstanding_summary(invoices):
+    """Total, count and the totals per course, fee head and ageing bucket of outstanding_invoices()"""
+    def by(*fields):
+        return list(invoices.values(*fields).annotate(total=Sum('balance'), count=Count('id')).order_by(*fields))
+
+    overall = invoices.aggregate(total=Sum('balance'), count=Count('id'))
+    bucket_totals = {row['bucket']: row for row in by('bucket')}
+    return {
+        'total': overall['total'] or Decimal('0'),
+        'count': overall['count'],
+        'by_course': by('student__course_id', 'student__course_id__name'),
+        'by_fee_head': by('fee_head', 'fee_head__name'),
+        'by_bucket': [
+            {
+                'key': key,
+                'label': label,
+                'total': bucket_totals.get(key, {}).get('total') or Decimal('0'),
+                'count': bucket_totals.get(key, {}).get('count', 0),
+            }
+            for key, label, _ in AGEING_BUCKETS
+        ],
+    }
+
+
+def outstanding_page(invoices, after=None, page_size=PAGE_SIZE):
+    """
+    Detail rows of the invoices with id greater than after, in id order.
+    Returns (rows, next_after), next_after being None on the last page.
+    """
+    if after:
+        invoices = invoices.filter(id__gt=after)
+    rows = list(
+        invoices.select_related('student__admin', 'student__course_id', 'fee_head').order_by('id')[:page_size + 1]
+    )
+    if len(rows) > page_size:
+        return rows[:page_size], rows[page_size - 1].id
+    return rows, None
+
+
+def _export_rows(invoices, as_of, chunk_size=2000):
+    """The export rows of every invoice, read from the database chunk_size at a time"""
+    as_of = as_of or datetime.date.today()
+    for row in invoices.order_by('id').values_list(
+        'id', 'student__admin__first_name', 'student__admin__last_name', 'student__admin__email',
+        'student__course_id__name', 'fee_head__name', 'due', 'amount', 'paid_amount'
+    ).iterator(chunk_size=chunk_size):
+        (invoice_id, first_name, last_name, email, course, fee_head, due, amount, paid) = row
+        yield [
+            invoice_id, f"{first_name} {last_name}".strip(), email, course, fee_head, due,
+            max((as_of - due).days, 0) if due else '', amount, paid, amount - paid,
+        ]
+
+
+class _Echo:
+    """File-like object whose write() returns the line for csv.writer to hand back"""
+
+    def write(self, value):
+        return value
+
+
+def stream_outstanding_csv(invoices, as_of=None):
+    """CSV of the invoices, yielded line by line"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_HEADERS)
+    for row in _export_rows(invoices, as_of):
+        yield writer.writerow(row)
+
+
+def stream_outstanding_xlsx(invoices, as_of=None, chunk_size=64 * 1024):
+    """
+    XLSX of the invoices. A workbook is a ZIP that cannot be written
+    front to back, so the rows go through a write-only sheet into a
+    temporary file, which is then yielded chunk by chunk.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Outstanding Fees')
+    sheet.append(EXPORT_HEADERS)
+    for row in _export_rows(invoices, as_of):
+        sheet.append(row)
+
+    with tempfile.TemporaryFile() as output:
+        workbook.save(output)
+        output.seek(0)
+        while True:
+            chunk = output.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
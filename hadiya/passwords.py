@@ -0,0 +1,75 @@
+"""
+Password hashing for bulk user creation. Django's hasher is deliberately
+slow, so a sheet of new users is hashed across a pool of processes before
+the users are inserted. Children are spawned and set Django up once each,
+so an import opens one pool with hash_pool() and hashes every chunk in it.
+This module must be importable before Django is set up, like
+hadiya.pdf_worker.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import django
+from django.conf import settings
+
+# Passwords handed to a child at a time
+BATCH_SIZE = 16
+
+
+def init_worker():
+    django.setup()
+
+
+def hash_batch(passwords):
+    """Hashed form of each password, in order, in this process"""
+    from django.contrib.auth.hashers import make_password
+    return [make_password(password) for password in passwords]
+
+
+def hash_workers():
+    """Pool size from PASSWORD_HASH_WORKERS, every core if it is not set"""
+    return getattr(settings, 'PASSWORD_HASH_WORKERS', None) or os.cpu_count() or 1
+
+
+@contextmanager
+def hash_pool(workers=None, jobs=None):
+    """
+    Process pool for hash_passwords(), to reuse across the chunks of an
+    import; None if it would have a single worker. jobs, the number of
+    passwords to come, caps the pool size.
+    """
+    workers = workers or hash_workers()
+    if jobs is not None:
+        workers = min(workers, jobs)
+    if workers <= 1:
+        yield None
+        return
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=init_worker,
+    ) as pool:
+        yield pool
+
+
+def _hash_in(pool, passwords):
+    batches = [passwords[i:i + BATCH_SIZE] for i in range(0, len(passwords), BATCH_SIZE)]
+    return [hashed for batch in pool.map(hash_batch, batches) for hashed in batch]
+
+
+def hash_passwords(passwords, workers=None, pool=None):
+    """
+    Hashed form of each password, in order, hashed in pool, or across
+    workers processes in a pool of its own. A single worker, or a single
+    password, is hashed in this process.
+    """
+    passwords = list(passwords)
+    if len(passwords) <= 1:
+        return hash_batch(passwords)
+    if pool is not None:
+        return _hash_in(pool, passwords)
+    with hash_pool(workers, len(passwords)) as pool:
+        return hash_batch(passwords) if pool is None else _hash_in(pool, passwords)
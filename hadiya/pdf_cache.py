@@ -0,0 +1,116 @@
+"""
+Content-addressed cache of rendered PDFs under MEDIA_ROOT/pdf_cache.
+
+A PDF is stored under the SHA-256 of the HTML it was rendered from, so any
+change to the marks, the student, the exam or the template gives a new key.
+Files are grouped by exam and by student or class so the entries of a
+student/exam can be dropped as soon as a Student_Result changes, and the
+least recently used files are evicted once the cache outgrows
+PDF_CACHE_MAX_BYTES.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+
+CACHE_DIR = 'pdf_cache'
+
+
+def _root():
+    return os.path.join(settings.MEDIA_ROOT, CACHE_DIR)
+
+
+def _exam_tag(context):
+    exam = context['exam']
+    return f"exam-{exam.id}" if exam else 'exam-none'
+
+
+def _owner_tag(context):
+    if context.get('view_type') == 'class_wise':
+        return f"class-{context['course'].id}"
+    return f"student-{context['student'].id}"
+
+
+def cache_path(context, html):
+    """Path, relative to MEDIA_ROOT, of the PDF rendered from this HTML"""
+    digest = hashlib.sha256(html.encode('utf-8')).hexdigest()
+    return f"{CACHE_DIR}/{_exam_tag(context)}/{_owner_tag(context)}/{digest}.pdf"
+
+
+def get_cached(path):
+    """True if the PDF is cached; marks it as recently used"""
+    full_path = os.path.join(settings.MEDIA_ROOT, path)
+    try:
+        os.utime(full_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def store(path, pdf):
+    """Write a PDF into the cache atomically, then evict if over the size limit"""
+    full_path = os.path.join(settings.MEDIA_ROOT, path)
+    os.makedirs(_root(), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=_root(), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(pdf)
+    # The directory can be removed by invalidate() at any moment
+    for attempt in range(3):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        try:
+            os.replace(tmp_path, full_path)
+            break
+        except FileNotFoundError:
+            if attempt == 2:
+                raise
+    evict(getattr(settings, 'PDF_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+
+def evict(max_bytes):
+    """Delete the least recently used PDFs until the cache fits in max_bytes"""
+    entries = []
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(_root()):
+        for name in filenames:
+            if not name.endswith('.pdf'):
+                continue
+            full_path = os.path.join(dirpath, name)
+            try:
+                stat = os.stat(full_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, full_path))
+            total += stat.st_size
+
+    removed = 0
+    if total > max_bytes:
+        for mtime, size, full_path in sorted(entries):
+            try:
+                os.remove(full_path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+            if total <= max_bytes:
+                break
+    return removed
+
+
+def invalidate(exam_id, student_ids=(), course_ids=()):
+    """
+    Drop the cached PDFs that show results of these students for this exam:
+    their own progress cards and the class sheets of their courses.
+    """
+    exam_tag = f"exam-{exam_id}" if exam_id else 'exam-none'
+    owners = [f"student-{student_id}" for student_id in student_ids]
+    owners += [f"class-{course_id}" for course_id in course_ids]
+
+    for owner in owners:
+        shutil.rmtree(os.path.join(_root(), exam_tag, owner), ignore_errors=True)
+
+
+def clear():
+    """Empty the whole cache"""
+    shutil.rmtree(_root(), ignore_errors=True)
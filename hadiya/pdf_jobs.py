@@ -0,0 +1,314 @@
+"""
+Background PDF generation. Views enqueue a PdfJob and return its token; the
+run_pdf_worker command claims queued jobs and renders them with xhtml2pdf in
+a pool of worker processes, so a burst of downloads at result publication
+does not tie up the web workers. Rendered files go through hadiya.pdf_cache,
+so a PDF that is already cached is served without queueing at all.
+
+Whole-class progress cards are rendered in a pool straight from the request
+and streamed back as one merged PDF or a ZIP of cards.
+"""
+import datetime
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connections
+from django.template.loader import get_template
+from django.utils import timezone
+from pypdf import PdfWriter
+
+from hadiya import pdf_cache, pdf_worker
+from hadiya.models import PdfJob
+from hadiya.pdf_worker import html_to_pdf
+from hadiya.results import class_card_contexts, result_pdf_context, student_card_context
+
+
+def _result_card(params):
+    return 'Hod/result_pdf_template.html', result_pdf_context(**params)
+
+
+def _student_card(params):
+    return 'Hod/result_pdf_template.html', student_card_context(**params)
+
+
+# kind -> function(params) returning (template, context)
+PDF_BUILDERS = {
+    'result_card': _result_card,
+    'student_card': _student_card,
+}
+
+
+def _prepare(kind, params):
+    """Rendered HTML of a job and the cache path it is stored under"""
+    template_src, context = PDF_BUILDERS[kind](params)
+    html = get_template(template_src).render(context)
+    return html, pdf_cache.cache_path(context, html)
+
+
+def enqueue_pdf(kind, params, filename, user=None):
+    """
+    Queue a PDF and return its PdfJob. A job with the same kind and params
+    that the same user is still waiting for is reused, so repeated clicks
+    do not queue duplicates.
+
+    With PDF_JOBS_ASYNC off the PDF is rendered straight away in this
+    process, which keeps development servers working without a worker.
+    """
+    if kind not in PDF_BUILDERS:
+        raise ValueError(f"Unknown PDF kind: {kind}")
+
+    pending = PdfJob.objects.filter(
+        kind=kind, params=params, requested_by=user, status__in=['queued', 'running']
+    ).order_by('-created_at').first()
+    if pending is not None:
+        return pending
+
+    started = time.perf_counter()
+    try:
+        html, path = _prepare(kind, params)
+    except Exception:
+        # Let the worker record the error on the job
+        path = None
+    if path is not None and pdf_cache.get_cached(path):
+        now = timezone.now()
+        return PdfJob.objects.create(
+            kind=kind, params=params, filename=filename, requested_by=user,
+            status='done', file=path, cache_hit=True,
+            started_at=now, finished_at=now, render_seconds=time.perf_counter() - started
+        )
+
+    job = PdfJob.objects.create(kind=kind, params=params, filename=filename, requested_by=user)
+    if not getattr(settings, 'PDF_JOBS_ASYNC', True):
+        _render_now(job)
+    return job
+
+
+def requeue_job(job):
+    """Render a finished job again, e.g. after its cached file was evicted"""
+    job.status = 'queued'
+    job.started_at = None
+    job.save(update_fields=['status', 'started_at'])
+    if not getattr(settings, 'PDF_JOBS_ASYNC', True):
+        _render_now(job)
+
+
+def _render_now(job):
+    job.started_at = timezone.now()
+    job.status = 'running'
+    job.save(update_fields=['started_at', 'status'])
+    render_job(job.id)
+    job.refresh_from_db()
+
+
+def render_job(job_id):
+    """Render one claimed job and store the file or the error on it"""
+    job = PdfJob.objects.get(id=job_id)
+    started = time.perf_counter()
+    try:
+        html, path = _prepare(job.kind, job.params)
+        job.cache_hit = pdf_cache.get_cached(path)
+        if not job.cache_hit:
+            pdf = html_to_pdf(html)
+            if pdf is None:
+                raise ValueError("xhtml2pdf could not render the document")
+            pdf_cache.store(path, pdf)
+        job.file.name = path
+        job.status = 'done'
+    except Exception as e:
+        job.status = 'failed'
+        job.error = str(e)
+    job.render_seconds = time.perf_counter() - started
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'cache_hit', 'status', 'error', 'render_seconds', 'finished_at'])
+    return job_id
+
+
+def claim_jobs(limit):
+    """Mark up to limit queued jobs as running, oldest first, and return their ids"""
+    claimed = []
+    candidates = PdfJob.objects.filter(status='queued').order_by('created_at').values_list('id', flat=True)[:limit]
+    for job_id in list(candidates):
+        # Conditional update so two workers never take the same job
+        if PdfJob.objects.filter(id=job_id, status='queued').update(status='running', started_at=timezone.now()):
+            claimed.append(job_id)
+    return claimed
+
+
+def requeue_stale_jobs(older_than):
+    """Put jobs left running by a worker that died back on the queue"""
+    cutoff = timezone.now() - datetime.timedelta(seconds=older_than)
+    return PdfJob.objects.filter(status='running', started_at__lt=cutoff).update(status='queued', started_at=None)
+
+
+def _job_pool(workers):
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=pdf_worker.init_worker,
+    )
+
+
+def fail_job(job_id, error):
+    """Record a job whose worker raised instead of storing a result"""
+    PdfJob.objects.filter(id=job_id, status='running').update(
+        status='failed', error=error, finished_at=timezone.now()
+    )
+
+
+def run_worker(workers=None, poll_interval=1.0, once=False, log=print):
+    """
+    Feed queued jobs to a process pool until interrupted. With once=True
+    return as soon as the queue is empty. A job whose worker raises, or
+    dies and breaks the pool, is marked failed and the loop goes on, with a
+    new pool if the old one is broken.
+    """
+    workers = workers or getattr(settings, 'PDF_WORKERS', 2)
+
+    # Children must open their own database connections
+    connections.close_all()
+    pool = _job_pool(workers)
+    running = {} # future -> job id
+    try:
+        while True:
+            free = workers - len(running)
+            if free > 0:
+                for job_id in claim_jobs(free):
+                    running[pool.submit(pdf_worker.run_job, job_id)] = job_id
+
+            if not running:
+                if once:
+                    break
+                time.sleep(poll_interval)
+                continue
+
+            done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+            broken = False
+            for future in done:
+                job_id = running.pop(future)
+                try:
+                    future.result()
+                    job = PdfJob.objects.get(id=job_id)
+                    log(f"{job.filename}: {job.status} in {job.render_seconds:.2f}s "
+                        f"(waited {job.wait_seconds():.2f}s)")
+                except Exception as e:
+                    broken = broken or isinstance(e, BrokenProcessPool)
+                    log(f"Job {job_id} failed: {e!r}")
+                    fail_job(job_id, f"Worker error: {e!r}")
+
+            if broken:
+                # Every job still in the broken pool is lost with it
+                for job_id in running.values():
+                    fail_job(job_id, "Worker pool broke before the job finished")
+                running = {}
+                pool.shutdown(wait=False, cancel_futures=True)
+                pool = _job_pool(workers)
+    finally:
+        pool.shutdown(wait=True)
+
+
+def render_class_cards(course, exam=None, workers=None):
+    """
+    Yield (student, pdf) for the progress card of every student in the
+    course, in admission order, as soon as each one is ready. pdf is None for
+    a card xhtml2pdf could not render.
+
+    The cards are the same documents the single progress card gives, so they
+    share its cache entries; only the missing ones go to the process pool.
+    """
+    template = get_template('Hod/result_pdf_template.html')
+    cards = []
+    for student, context in class_card_contexts(course, exam):
+        html = template.render(context)
+        path = pdf_cache.cache_path(context, html)
+        cards.append((student, html, path, pdf_cache.get_cached(path)))
+
+    missing = [html for student, html, path, cached in cards if not cached]
+    pool = None
+    if len(missing) > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=min(workers or getattr(settings, 'PDF_WORKERS', 2), len(missing)),
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        rendered = pool.map(html_to_pdf, missing)
+    else:
+        rendered = map(html_to_pdf, missing)
+
+    try:
+        for student, html, path, cached in cards:
+            if cached:
+                with open(os.path.join(settings.MEDIA_ROOT, path), 'rb') as f:
+                    pdf = f.read()
+            else:
+                pdf = next(rendered)
+                if pdf is not None:
+                    pdf_cache.store(path, pdf)
+            yield student, pdf
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _card_name(student):
+    return f"{student.id}_{student.admin.first_name}_{student.admin.last_name}.pdf".replace(' ', '_')
+
+
+class _StreamBuffer:
+    """Write-only file for zipfile that hands its bytes on instead of keeping them"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_class_cards_zip(course, exam=None):
+    """ZIP of the class's progress cards, yielded card by card as they are rendered"""
+    buffer = _StreamBuffer()
+    failed = []
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for student, pdf in render_class_cards(course, exam):
+            if pdf is None:
+                failed.append(_card_name(student))
+                continue
+            archive.writestr(_card_name(student), pdf)
+            yield buffer.pop()
+        if failed:
+            archive.writestr('errors.txt', "Could not render:\n" + "\n".join(failed) + "\n")
+    yield buffer.pop()
+
+
+def stream_class_cards_pdf(course, exam=None, chunk_size=64 * 1024):
+    """
+    The class's progress cards merged into one PDF. A PDF cannot be written
+    before its cross-reference table is known, so the cards are appended as
+    they arrive and the document is streamed once it is complete.
+    """
+    writer = PdfWriter()
+    for student, pdf in render_class_cards(course, exam):
+        if pdf is not None:
+            writer.append(BytesIO(pdf))
+
+    output = BytesIO()
+    writer.write(output)
+    output.seek(0)
+    while True:
+        chunk = output.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,33 @@
+"""
+Entry points for the PDF worker processes. Children are spawned, so this
+module must be importable before Django is set up: models are only imported
+inside the functions, after init_worker() has run.
+"""
+from io import BytesIO
+
+import django
+from xhtml2pdf import pisa
+
+
+def init_worker():
+    django.setup()
+
+
+def html_to_pdf(html):
+    """Convert rendered HTML to PDF bytes, None if xhtml2pdf reports an error"""
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode("ISO-8859-1")), result)
+    if not pdf.err:
+        return result.getvalue()
+    return None
+
+
+def run_job(job_id):
+    from django.db import close_old_connections
+    from hadiya.pdf_jobs import render_job
+
+    close_old_connections()
+    try:
+        return render_job(job_id)
+    finally:
+        close_old_connections()
@@ -0,0 +1,57 @@
+"""
+The logged-in user's role profile (Staff, Student, Accountant or Management
+row) loaded once and kept in Django's cache under the user id and type, so
+views read request.profile instead of looking the profile up themselves.
+
+Only the profile is cached: request.user is loaded by the auth backend on
+every request as usual, so a password change, deactivation or new
+user_type takes effect on the user's next request in every worker. The
+cached profile is given that fresh user as its admin. Saving or deleting
+the profile drops the entry (see the signals in hadiya.models);
+PROFILE_CACHE_TIMEOUT bounds anything changed without signals or in
+another process.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+from hadiya.models import Accountant, Management, Staff, Student
+
+# user_type -> (profile model, relations loaded with it)
+PROFILE_MODELS = {
+    2: (Staff, ()),
+    3: (Student, ('course_id', 'bus_stop')),
+    4: (Accountant, ()),
+    5: (Management, ()),
+}
+
+
+def cache_key(user_id, user_type):
+    return f'profile:{user_id}:{user_type}'
+
+
+def load_profile(user):
+    """The role profile of a user, None for the HOD or a user without one"""
+    if user.user_type not in PROFILE_MODELS:
+        return None
+    key = cache_key(user.pk, user.user_type)
+    profile = cache.get(key)
+    if profile is None:
+        model, related = PROFILE_MODELS[user.user_type]
+        profile = model.objects.select_related(*related).filter(admin_id=user.pk).first()
+        if profile is None:
+            return None
+        cache.set(key, profile, getattr(settings, 'PROFILE_CACHE_TIMEOUT', 60))
+    # The user of this request, so request.user and request.profile.admin agree
+    profile.admin = user
+    return profile
+
+
+def get_profile(user):
+    """The role profile of a request's user, None if anonymous or without one"""
+    if not user.is_authenticated:
+        return None
+    return load_profile(user)
+
+
+def invalidate(user_id):
+    cache.delete_many([cache_key(user_id, user_type) for user_type in PROFILE_MODELS])
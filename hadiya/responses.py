@@ -0,0 +1,58 @@
+"""
+JSON responses for the AJAX views. The data is encoded once, with orjson
+when it is installed and Django's JSON encoder otherwise, so the browser
+receives plain JSON that jQuery parses on its own. values() querysets
+(also inside dicts and lists) are encoded row by row as they come from the
+database, and bodies of at least JSON_GZIP_MIN_LENGTH bytes are gzipped
+for clients that accept it.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, QuerySet):
+            return list(o)
+        return super().default(o)
+
+
+def _default(obj):
+    # What orjson does not encode itself, as DjangoJSONEncoder would
+    if isinstance(obj, QuerySet):
+        return list(obj)
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError
+
+
+def dumps(data):
+    """data as JSON bytes"""
+    if isinstance(data, QuerySet):
+        data = list(data)
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return _Encoder(separators=(',', ':')).encode(data).encode()
+
+
+def json_response(request, data, status=200):
+    """data as an application/json response, gzipped when large and the client accepts it"""
+    content = dumps(data)
+    response = HttpResponse(content, content_type='application/json', status=status)
+    if len(content) >= getattr(settings, 'JSON_GZIP_MIN_LENGTH', 4096):
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if 'gzip' in request.headers.get('accept-encoding', ''):
+            response.content = compress_string(content)
+            response.headers['Content-Encoding'] = 'gzip'
+    return response
@@ -0,0 +1,136 @@
+"""
+Result analytics for the HOD and Staff analysis pages: pass rates, averages,
+spread and grade histograms for every subject of an exam, computed together
+on NumPy arrays from a single query.
+"""
+import numpy as np
+
+from hadiya.models import Student_Result
+
+PASS_PERCENTAGE = 40
+
+# Lower bound of each grade, best first. Anything below the last is a D.
+GRADE_BOUNDARIES = (
+    ('A+', 90),
+    ('A', 80),
+    ('B+', 70),
+    ('B', 60),
+    ('C+', 50),
+    ('C', 40),
+)
+GRADE_LABELS = [label for label, _ in GRADE_BOUNDARIES] + ['D']
+
+PERCENTILES = (25, 50, 75, 90)
+
+
+def grade_for(percentage):
+    """Grade label for a percentage, same scale as the progress card"""
+    for label, lower in GRADE_BOUNDARIES:
+        if percentage >= lower:
+            return label
+    return 'D'
+
+
+def _load_scores(subjects, exam=None):
+    """
+    (subject index, total marks) arrays for every result of the subjects,
+    one query. exam=None takes the results of every exam, as the analysis
+    pages do when no examination is picked.
+    """
+    index = {subject.id: i for i, subject in enumerate(subjects)}
+    results = Student_Result.objects.filter(subject_id__in=index)
+    if exam is not None:
+        results = results.filter(exam=exam)
+
+    rows = list(results.order_by('id').values_list('subject_id', 'ce_marks', 'te_marks'))
+    subject_index = np.fromiter((index[row[0]] for row in rows), dtype=np.intp, count=len(rows))
+    totals = np.fromiter((row[1] + row[2] for row in rows), dtype=np.float64, count=len(rows))
+    return subject_index, totals
+
+
+def analyze_subjects(subjects, exam=None):
+    """
+    Statistics for each subject, in the order given.
+
+    Returns one dict per subject with the number of results, pass/fail
+    counts, pass percentage, average percentage, the mean, median, standard
+    deviation, percentiles, highest and lowest of the total marks and a
+    { grade: count } histogram.
+    """
+    subjects = list(subjects)
+    n = len(subjects)
+    subject_index, totals = _load_scores(subjects, exam)
+
+    max_marks = np.array([s.max_ce_marks + s.max_te_marks for s in subjects], dtype=np.float64)
+    row_max = max_marks[subject_index]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.where(row_max > 0, totals / row_max * 100, 0.0)
+
+    counts = np.bincount(subject_index, minlength=n)
+    passed = np.bincount(subject_index, weights=percentages >= PASS_PERCENTAGE, minlength=n).astype(int)
+    total_sums = np.bincount(subject_index, weights=totals, minlength=n)
+
+    # Grade 0 is A+ ... grade 6 is D, counted per subject in one pass
+    lower_bounds = np.array([lower for _, lower in GRADE_BOUNDARIES], dtype=np.float64)
+    grades = (percentages[:, None] < lower_bounds).sum(axis=1)
+    histogram = np.bincount(subject_index * len(GRADE_LABELS) + grades, minlength=n * len(GRADE_LABELS))
+    histogram = histogram.reshape(n, len(GRADE_LABELS))
+
+    # Contiguous per-subject slices for the order statistics
+    order = np.argsort(subject_index, kind='stable')
+    groups = np.split(totals[order], np.cumsum(counts)[:-1])
+
+    stats = []
+    for i, subject in enumerate(subjects):
+        count = int(counts[i])
+        group = groups[i]
+        row = {
+            "subject_id": subject.id,
+            "subject_name": subject.name,
+            "max_marks": float(max_marks[i]),
+            "count": count,
+            "passed": int(passed[i]),
+            "failed": count - int(passed[i]),
+            "pass_percentage": 0,
+            "avg_percentage": 0,
+            "mean": 0,
+            "median": 0,
+            "std": 0,
+            "highest": 0,
+            "lowest": 0,
+            "percentiles": {str(p): 0 for p in PERCENTILES},
+            "grades": dict(zip(GRADE_LABELS, histogram[i].tolist())),
+        }
+        if count:
+            row["pass_percentage"] = round(float(passed[i]) / count * 100, 2)
+            if max_marks[i] > 0:
+                row["avg_percentage"] = round(float(total_sums[i] / (count * max_marks[i]) * 100), 2)
+            row["mean"] = round(float(group.mean()), 2)
+            row["median"] = round(float(np.median(group)), 2)
+            row["std"] = round(float(group.std()), 2)
+            row["highest"] = float(group.max())
+            row["lowest"] = float(group.min())
+            row["percentiles"] = {
+                str(p): round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(group, PERCENTILES))
+            }
+        stats.append(row)
+    return stats
+
+
+def exam_summary(subjects, exam=None):
+    """
+    Per-subject statistics for a course plus the totals across all of its
+    subjects: results, pass percentage and the combined grade histogram.
+    """
+    stats = analyze_subjects(subjects, exam)
+    count = sum(row["count"] for row in stats)
+    passed = sum(row["passed"] for row in stats)
+    grades = {label: sum(row["grades"][label] for row in stats) for label in GRADE_LABELS}
+    return {
+        "subjects": stats,
+        "count": count,
+        "passed": passed,
+        "failed": count - passed,
+        "pass_percentage": round(passed / count * 100, 2) if count else 0,
+        "grades": grades,
+    }
@@ -0,0 +1,283 @@
+"""
+Result helpers shared by the HOD, Staff and Student views: loading the marks
+of a class into a student x subject grid with one query, turning it into the
+rows the result pages and progress cards show, and saving a marks sheet.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from hadiya import pdf_cache
+from hadiya.models import Course, Examination, Student, Student_Result, Subject
+
+
+def _empty_cell():
+    return {"ce_marks": 0, "te_marks": 0, "total_marks": 0}
+
+
+def result_matrix(students, subjects, exam=None):
+    """
+    Marks of every student in every subject for one exam, loaded with a
+    single query.
+
+    Returns {student_id: {subject_id: {ce_marks, te_marks, total_marks}}};
+    a student with no result for a subject gets zeros. exam=None selects the
+    results saved without an exam, as the result pages do.
+    """
+    student_ids = [student.id for student in students]
+    subject_ids = [subject.id for subject in subjects]
+
+    matrix = {
+        student_id: {subject_id: _empty_cell() for subject_id in subject_ids}
+        for student_id in student_ids
+    }
+
+    results = Student_Result.objects.filter(student_id__in=student_ids, subject_id__in=subject_ids)
+    if exam is None:
+        results = results.filter(exam__isnull=True)
+    else:
+        results = results.filter(exam=exam)
+
+    for student_id, subject_id, ce_marks, te_marks in results.values_list(
+        'student_id', 'subject_id', 'ce_marks', 'te_marks'
+    ).order_by('id'):
+        matrix[student_id][subject_id] = {
+            "ce_marks": ce_marks,
+            "te_marks": te_marks,
+            "total_marks": ce_marks + te_marks
+        }
+    return matrix
+
+
+def course_students(course):
+    """Students of a course with their user rows, in admission order"""
+    return list(Student.objects.filter(course_id=course).select_related('admin').order_by('id'))
+
+
+def get_subject_results(course, subject, exam=None):
+    """
+    Every student of the course with their marks in one subject, as
+    [(student, { ce_marks, te_marks, total_marks })].
+    """
+    students = course_students(course)
+    matrix = result_matrix(students, [subject], exam)
+    return [(student, matrix[student.id][subject.id]) for student in students]
+
+
+def get_student_results(student, course, exam=None):
+    """
+    One student's marks in every subject of the course with the maximum
+    marks and percentage per subject, plus the totals for the progress card.
+
+    Returns (rows, total_obtained, total_max).
+    """
+    subjects = list(Subject.objects.filter(course=course).order_by('id'))
+    marks = result_matrix([student], subjects, exam)[student.id]
+    return _student_rows(subjects, marks)
+
+
+def _student_rows(subjects, marks):
+    """Progress-card rows and totals from one student's row of the matrix"""
+    rows = []
+    total_obtained = 0
+    total_max = 0
+    for subject in subjects:
+        cell = marks[subject.id]
+        sub_max = subject.max_ce_marks + subject.max_te_marks
+        total_obtained += cell["total_marks"]
+        total_max += sub_max
+
+        rows.append({
+            "subject_name": subject.name,
+            "max_ce_marks": subject.max_ce_marks,
+            "max_te_marks": subject.max_te_marks,
+            "ce_marks": cell["ce_marks"],
+            "te_marks": cell["te_marks"],
+            "total_marks": cell["total_marks"],
+            "percentage": (cell["total_marks"] / sub_max * 100) if sub_max > 0 else 0
+        })
+    return rows, total_obtained, total_max
+
+
+def result_pdf_context(view_type, course_id, exam_id=None, subject_id=None, student_id=None):
+    """
+    Context for Hod/result_pdf_template.html: a class-wise sheet of one
+    subject or a student's progress card. student_id is the user id the
+    result pages post.
+    """
+    course = Course.objects.get(id=course_id)
+    exam = Examination.objects.get(id=exam_id) if exam_id else None
+
+    context = {
+        'view_type': view_type,
+        'course': course,
+        'exam': exam
+    }
+
+    if view_type == 'class_wise':
+        subject = Subject.objects.get(id=subject_id)
+        context['subject'] = subject
+        context['data'] = [
+            {"name": f"{student.admin.first_name} {student.admin.last_name}", **marks}
+            for student, marks in get_subject_results(course, subject, exam)
+        ]
+
+    elif view_type == 'student_wise':
+        student = Student.objects.select_related('admin').get(admin__id=student_id)
+        _fill_student_card(context, student, *get_student_results(student, course, exam))
+
+    return context
+
+
+def _fill_student_card(context, student, data, total_obtained, total_max):
+    context['student'] = student
+    context['data'] = data
+    context['total_obtained'] = total_obtained
+    context['total_max'] = total_max
+    context['overall_percentage'] = (total_obtained / total_max * 100) if total_max > 0 else 0
+    return context
+
+
+def class_card_contexts(course, exam=None):
+    """
+    Progress-card contexts for every student of the course, the same as
+    result_pdf_context() gives for one student, with all marks loaded in a
+    single query. Returns [(student, context)] in admission order.
+    """
+    students = course_students(course)
+    subjects = list(Subject.objects.filter(course=course).order_by('id'))
+    matrix = result_matrix(students, subjects, exam)
+
+    cards = []
+    for student in students:
+        context = {
+            'view_type': 'student_wise',
+            'course': course,
+            'exam': exam
+        }
+        _fill_student_card(context, student, *_student_rows(subjects, matrix[student.id]))
+        cards.append((student, context))
+    return cards
+
+
+def student_card_context(student_id, exam_id=None):
+    """
+    Context for the progress card a student downloads from their result
+    page, for one exam (exam_id=None: the results saved without an exam).
+    """
+    student = Student.objects.select_related('admin', 'course_id').get(id=student_id)
+    exam = Examination.objects.get(id=exam_id) if exam_id else None
+    context = {
+        'view_type': 'student_wise',
+        'course': student.course_id,
+        'exam': exam
+    }
+    return _fill_student_card(context, student, *get_student_results(student, student.course_id, exam))
+
+
+def _parse_marks(value, label, maximum):
+    """Return (marks, error) for one posted CE/TE value"""
+    try:
+        marks = float(value)
+    except (TypeError, ValueError):
+        return None, f"{label} marks must be a number"
+    if marks < 0:
+        return None, f"{label} marks cannot be negative"
+    if marks > maximum:
+        return None, f"{label} marks cannot exceed {maximum:g}"
+    return marks, None
+
+
+def validate_marks_sheet(subject, student_ids, ce_marks_list, te_marks_list):
+    """
+    Check a posted marks sheet before anything is written.
+
+    Returns (rows, errors): rows maps Student ids to (ce_marks, te_marks) and
+    errors is a list of { row, id, message } with 1-based row numbers, row
+    None for a problem with the sheet as a whole. Marks above the subject's
+    max_ce_marks/max_te_marks, unknown students and students outside the
+    subject's course are rejected.
+    """
+    if not (len(student_ids) == len(ce_marks_list) == len(te_marks_list)):
+        return {}, [{"row": None, "id": None, "message": "Marks sheet is incomplete, please reload the students"}]
+
+    students = {
+        admin_id: (student_id, course_id)
+        for admin_id, student_id, course_id in Student.objects.filter(
+            admin_id__in=[sid for sid in student_ids if str(sid).isdigit()]
+        ).values_list('admin_id', 'id', 'course_id')
+    }
+
+    rows = {}
+    errors = []
+    for row, (admin_id, ce_value, te_value) in enumerate(zip(student_ids, ce_marks_list, te_marks_list), start=1):
+        student_id, course_id = students.get(int(admin_id), (None, None)) if str(admin_id).isdigit() else (None, None)
+        ce_marks, ce_error = _parse_marks(ce_value, "CE", subject.max_ce_marks)
+        te_marks, te_error = _parse_marks(te_value, "TE", subject.max_te_marks)
+
+        if student_id is None:
+            messages = ["Student does not exist"]
+        elif course_id != subject.course_id:
+            messages = [f"Student is not in {subject.course.name}"]
+        elif student_id in rows:
+            messages = ["Student appears more than once in the sheet"]
+        else:
+            messages = [message for message in (ce_error, te_error) if message]
+
+        if messages:
+            errors.extend({"row": row, "id": admin_id, "message": message} for message in messages)
+        else:
+            rows[student_id] = (ce_marks, te_marks)
+
+    return rows, errors
+
+
+def save_marks_sheet(subject, exam, student_ids, ce_marks_list, te_marks_list):
+    """
+    Validate a marks sheet and save it in one transaction.
+
+    Nothing is written unless every row is valid. Returns (saved, errors)
+    where errors is the list built by validate_marks_sheet().
+    """
+    rows, errors = validate_marks_sheet(subject, student_ids, ce_marks_list, te_marks_list)
+    if errors:
+        return 0, errors
+
+    results = [
+        Student_Result(student_id=student_id, subject=subject, exam=exam, ce_marks=ce_marks, te_marks=te_marks)
+        for student_id, (ce_marks, te_marks) in rows.items()
+    ]
+
+    with transaction.atomic():
+        if exam is not None:
+            Student_Result.objects.bulk_create(
+                results,
+                update_conflicts=True,
+                unique_fields=['student', 'subject', 'exam'],
+                update_fields=['ce_marks', 'te_marks', 'updated_at'],
+            )
+        else:
+            # NULL exam never conflicts in the unique index, match the rows by hand
+            existing = {
+                result.student_id: result
+                for result in Student_Result.objects.filter(
+                    subject=subject, exam__isnull=True, student_id__in=rows.keys()
+                )
+            }
+            now = timezone.now()
+            to_update = []
+            for result in results:
+                current = existing.get(result.student_id)
+                if current is not None:
+                    current.ce_marks = result.ce_marks
+                    current.te_marks = result.te_marks
+                    current.updated_at = now
+                    to_update.append(current)
+            Student_Result.objects.bulk_create([r for r in results if r.student_id not in existing])
+            Student_Result.objects.bulk_update(to_update, ['ce_marks', 'te_marks', 'updated_at'])
+
+        # bulk writes send no signals, drop the cached PDFs of this sheet here
+        transaction.on_commit(lambda: pdf_cache.invalidate(
+            exam.id if exam else None, student_ids=list(rows), course_ids=[subject.course_id]
+        ))
+
+    return len(results), []
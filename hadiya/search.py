@@ -0,0 +1,108 @@
+"""
+Student search for autocomplete boxes. Every student carries search_text, a
+normalised copy of their name, username, email and phone, and one
+StudentSearchToken row per word of it, kept up to date by the Student and
+CustomUser signals. A query word matches the tokens it starts, which is a
+range scan of the token index, so the cost of a search follows the number
+of matches rather than the enrollment.
+"""
+import re
+import unicodedata
+
+from hadiya.models import Student, StudentSearchToken
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 50
+
+_SEPARATORS = re.compile(r'[^\w@.+]+')
+_WORD_PARTS = re.compile(r'[@.+]+')
+# Longest token kept; longer words are matched on their first TOKEN_LENGTH characters
+TOKEN_LENGTH = 64
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation/whitespace to single spaces"""
+    text = unicodedata.normalize('NFKD', str(text or ''))
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(_SEPARATORS.sub(' ', text.lower()).split())
+
+
+def student_search_text(student, user=None):
+    """search_text for a Student; user defaults to student.admin"""
+    user = user or student.admin
+    return normalize(' '.join([
+        user.first_name,
+        user.last_name,
+        user.username,
+        user.email,
+        student.phone_number or '',
+    ]))[:255]
+
+
+def search_tokens(search_text):
+    """
+    The tokens of a search_text: every word, and the parts of a word split
+    at @ . + so "asha.k@school.in" is found by "asha", "k" or "school" too.
+    """
+    tokens = set()
+    for word in search_text.split():
+        tokens.add(word[:TOKEN_LENGTH])
+        tokens.update(part[:TOKEN_LENGTH] for part in _WORD_PARTS.split(word) if part)
+    return tokens
+
+
+def set_search_tokens(students):
+    """Replace the StudentSearchToken rows of these (saved) students with those of their search_text"""
+    StudentSearchToken.objects.filter(student__in=students).delete()
+    StudentSearchToken.objects.bulk_create([
+        StudentSearchToken(student_id=student.pk, token=token)
+        for student in students
+        for token in search_tokens(student.search_text)
+    ])
+
+
+def _prefix_filter(word):
+    # token >= word AND token < word + U+FFFF: a prefix match any B-tree index
+    # serves, unlike LIKE 'word%' which SQLite cannot run on a plain index
+    word = word[:TOKEN_LENGTH]
+    return StudentSearchToken.objects.filter(token__gte=word, token__lt=word + '\uffff').values('student_id')
+
+
+def search_students(query, page=1, page_size=PAGE_SIZE):
+    """
+    One page of students with a word starting with every word of query, or
+    whose admission number (Student id) is query. Returns (rows, has_more),
+    rows being dicts ready for JSON.
+    """
+    words = normalize(query).split()
+    if not words:
+        return [], False
+    page = max(int(page), 1)
+    page_size = min(max(int(page_size), 1), MAX_PAGE_SIZE)
+
+    students = Student.objects.all()
+    for word in words:
+        students = students.filter(id__in=_prefix_filter(word))
+    if query.strip().isdigit():
+        students = students | Student.objects.filter(id=int(query.strip()))
+
+    offset = (page - 1) * page_size
+    rows = list(
+        students.order_by('search_text', 'id')
+        .values(
+            'id', 'admin_id', 'admin__first_name', 'admin__last_name',
+            'admin__email', 'phone_number', 'course_id__name'
+        )[offset:offset + page_size + 1]
+    )
+    has_more = len(rows) > page_size
+    return [
+        {
+            'id': row['admin_id'],
+            'admission_no': row['id'],
+            'name': f"{row['admin__first_name']} {row['admin__last_name']}".strip(),
+            'email': row['admin__email'],
+            'phone': row['phone_number'] or '',
+            'course': row['course_id__name'],
+        }
+        for row in rows[:page_size]
+    ], has_more
@@ -1,3 +1,1285 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import statistics
+import tempfile
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import openpyxl
+from pypdf import PdfReader
+from django.conf import settings
+from django.contrib.auth.hashers import check_password
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from hadiya import bulk_import, dashboard_stats, pdf_cache, pdf_jobs
+from hadiya.access import HOD, STUDENT, denial_counts, route_roles
+from hadiya.attendance import (
+    attendance_counts, get_attendance_analysis, get_attendance_report, period_bounds, rebuild_attendance_summary,
+    save_attendance_sheet, update_attendance_sheet,
+)
+from hadiya.billing import generate_invoices, run_billing
+from hadiya.cashbook import collection_summary, rebuild_cashbook
+from hadiya.fee_payments import collect_payment, parse_amount
+from hadiya.import_jobs import enqueue_import, requeue_stale_jobs
+from hadiya.kpis import compute_kpis, dashboard_kpis
+from hadiya.models import (
+    Attendance, Attendance_Report, AttendanceSummary, BillingRun, BusStop, Course, CustomUser, DailyCashbook,
+    DailyFeeCollection, Examination, Expense, ExpenseHead, FeeHead, FeePayment, FeeStructure, ImportJob, Income,
+    InvoiceAllocation, PdfJob, Student, Student_Result, StudentInvoice, StudentSearchToken, Subject,
+)
+from hadiya.outstanding import outstanding_invoices, outstanding_page, outstanding_summary, stream_outstanding_csv
+from hadiya.passwords import BATCH_SIZE, hash_passwords, hash_pool
+from hadiya.responses import json_response
+from hadiya.result_analytics import PASS_PERCENTAGE, analyze_subjects, exam_summary, grade_for
+from hadiya.results import get_subject_results, result_matrix, save_marks_sheet, student_card_context
+from hadiya.search import search_students
+
+
+def make_student(course, username, **kwargs):
+    user = CustomUser.objects.create_user(
+        username=username, email=f'{username}@example.com', password='x',
+        first_name=username.title(), user_type=3,
+    )
+    return Student.objects.create(admin=user, course_id=course, address='', gender='Male', **kwargs)
+
+
+class ResultAnalyticsTests(TestCase):
+    """analyze_subjects against the per-result loop the analysis pages used to run"""
+
+    # (ce, te) for each student in Maths (max 50 + 50) and English (max 20 + 80)
+    MATHS = [(45, 48), (30, 25), (20, 19), (10, 5), (40, 40), (25, 36)]
+    ENGLISH = [(18, 70), (5, 30), (10, 40), (2, 10), (15, 60), (12, 33)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.exam = Examination.objects.create(name='Term 1')
+        cls.other_exam = Examination.objects.create(name='Term 2')
+        cls.maths = Subject.objects.create(name='Maths', course=cls.course, max_ce_marks=50, max_te_marks=50)
+        cls.english = Subject.objects.create(name='English', course=cls.course, max_ce_marks=20, max_te_marks=80)
+        cls.empty = Subject.objects.create(name='Arabic', course=cls.course)
+        for i, (maths, english) in enumerate(zip(cls.MATHS, cls.ENGLISH)):
+            student = make_student(cls.course, f'student{i}')
+            Student_Result.objects.create(student=student, subject=cls.maths, exam=cls.exam, ce_marks=maths[0], te_marks=maths[1])
+            Student_Result.objects.create(student=student, subject=cls.english, exam=cls.exam, ce_marks=english[0], te_marks=english[1])
+            # Another exam, left out when analysing Term 1
+            Student_Result.objects.create(student=student, subject=cls.maths, exam=cls.other_exam, ce_marks=0, te_marks=0)
+
+    def expected(self, subject, marks):
+        """What the old loop computed for one subject"""
+        sub_max = subject.max_ce_marks + subject.max_te_marks
+        totals = [ce + te for ce, te in marks]
+        percentages = [total / sub_max * 100 for total in totals]
+        passed = sum(1 for perc in percentages if perc >= PASS_PERCENTAGE)
+        grades = {}
+        for perc in percentages:
+            grades[grade_for(perc)] = grades.get(grade_for(perc), 0) + 1
+        return {
+            'count': len(marks),
+            'passed': passed,
+            'failed': len(marks) - passed,
+            'pass_percentage': round(passed / len(marks) * 100, 2),
+            'avg_percentage': round(sum(totals) / (sub_max * len(marks)) * 100, 2),
+            'highest': max(totals),
+            'lowest': min(totals),
+            'grades': grades,
+        }
+
+    def test_matches_old_pass_and_grade_logic(self):
+        stats = analyze_subjects([self.maths, self.english], self.exam)
+
+        for row, subject, marks in ((stats[0], self.maths, self.MATHS), (stats[1], self.english, self.ENGLISH)):
+            expected = self.expected(subject, marks)
+            self.assertEqual(row['subject_id'], subject.id)
+            for key in ('count', 'passed', 'failed', 'pass_percentage', 'avg_percentage', 'highest', 'lowest'):
+                self.assertEqual(row[key], expected[key], f'{subject.name} {key}')
+            self.assertEqual({grade: n for grade, n in row['grades'].items() if n}, expected['grades'])
+
+    def test_order_statistics(self):
+        maths = analyze_subjects([self.maths], self.exam)[0]
+        totals = [ce + te for ce, te in self.MATHS]
+        self.assertEqual(maths['mean'], round(statistics.mean(totals), 2))
+        self.assertEqual(maths['median'], round(statistics.median(totals), 2))
+        self.assertEqual(maths['std'], round(statistics.pstdev(totals), 2))
+        self.assertEqual(maths['percentiles']['50'], maths['median'])
+
+    def test_grade_boundaries(self):
+        self.assertEqual(grade_for(90), 'A+')
+        self.assertEqual(grade_for(89.99), 'A')
+        self.assertEqual(grade_for(40), 'C')
+        self.assertEqual(grade_for(39.99), 'D')
+
+    def test_all_exams_and_empty_subject(self):
+        maths, empty = analyze_subjects([self.maths, self.empty])
+        self.assertEqual(maths['count'], 12)
+        self.assertEqual(maths['passed'], self.expected(self.maths, self.MATHS)['passed'])
+        self.assertEqual(empty['count'], 0)
+        self.assertEqual(empty['pass_percentage'], 0)
+        self.assertEqual(empty['mean'], 0)
+
+    def test_exam_summary_totals(self):
+        summary = exam_summary([self.maths, self.english, self.empty], self.exam)
+        self.assertEqual(summary['count'], 12)
+        self.assertEqual(summary['passed'], sum(row['passed'] for row in summary['subjects']))
+        self.assertEqual(sum(summary['grades'].values()), 12)
+
+
+class BulkImportTests(TestCase):
+    """Student sheet validation and the chunked import"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        fee_head = FeeHead.objects.create(name='Tuition')
+        FeeStructure.objects.create(course=cls.course, fee_head=fee_head, amount=1200)
+        make_student(cls.course, 'existing')
+
+    def row(self, username, **values):
+        return {'first_name': username.title(), 'username': username, 'email': f'{username}@example.com',
+                'course': 'plus one', **values}
+
+    def test_read_rows_matches_headers(self):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['First Name', 'Email', 'Session', 'Username', 'Course Name'])
+        workbook.active.append(['Asha', 'asha@example.com', '2024', 'asha', 'Plus One'])
+        workbook.active.append([None, None, None, None, None])
+        workbook.active.append(['Ravi', 'ravi@example.com', '2024', 1001.0, 'Plus One'])
+        sheet = io.BytesIO()
+        workbook.save(sheet)
+        sheet.seek(0)
+
+        rows = list(bulk_import.read_rows(sheet, bulk_import.STUDENT_COLUMNS))
+        self.assertEqual([row_number for row_number, _ in rows], [2, 4])
+        self.assertEqual(rows[0][1], {'first_name': 'Asha', 'email': 'asha@example.com', 'username': 'asha', 'course': 'Plus One'})
+        self.assertEqual(rows[1][1]['username'], '1001')
+
+    def test_validation_errors(self):
+        valid, errors = bulk_import.validate_student_rows([
+            (2, self.row('asha', password='secret')),
+            (3, self.row('existing')),
+            (4, self.row('ravi', email='asha@example.com')),
+            (5, self.row('meera', course='Plus Two')),
+            (6, self.row('john', first_name='')),
+            (7, self.row('sara', gender='unknown')),
+            (8, self.row('nila', gender='female', admission_type='hostel')),
+        ])
+
+        self.assertEqual([row_number for row_number, _ in valid], [2, 8])
+        self.assertEqual(valid[0][1]['course_id'], self.course.id)
+        self.assertEqual(valid[1][1]['gender'], 'Female')
+        self.assertEqual(valid[1][1]['admission_type'], 'Hostel')
+        self.assertEqual([(error['row'], error['message']) for error in errors], [
+            (3, 'Email existing@example.com already exists'),
+            (4, 'Email asha@example.com already exists'),
+            (5, "Course 'Plus Two' not found"),
+            (6, 'Missing required fields'),
+            (7, "Unknown gender 'unknown'"),
+        ])
+        # The error log never carries the password
+        self.assertTrue(all('password' not in error['values'] for error in errors))
+
+    def test_import_creates_students_and_invoices(self):
+        valid, _ = bulk_import.validate_student_rows([
+            (2, self.row('asha', password='secret', admission_type='Hostel')),
+            (3, self.row('ravi')),
+            (4, self.row('meera')),
+        ])
+        chunks = []
+        created, errors = bulk_import.import_students(
+            valid, chunk_size=2, workers=1, on_chunk=lambda count, chunk_errors: chunks.append(count))
+
+        self.assertEqual((created, errors, chunks), (3, [], [2, 1]))
+        asha = Student.objects.get(admin__username='asha')
+        self.assertTrue(asha.uses_hostel)
+        self.assertTrue(check_password('secret', asha.admin.password))
+        self.assertTrue(check_password(bulk_import.DEFAULT_PASSWORD, CustomUser.objects.get(username='ravi').password))
+        self.assertEqual(StudentInvoice.objects.filter(student__admin__username__in=['asha', 'ravi', 'meera']).count(), 3)
+        self.assertTrue(asha.search_tokens.filter(token='asha').exists())
+
+    def test_failing_chunk_is_rolled_back(self):
+        valid, _ = bulk_import.validate_student_rows([
+            (2, self.row('asha')),
+            (3, self.row('ravi')),
+            (4, self.row('meera')),
+        ])
+        # Taken after the sheet was validated: the first chunk's insert fails
+        make_student(self.course, 'ravi')
+
+        created, errors = bulk_import.import_students(valid, chunk_size=2, workers=1)
+
+        self.assertEqual(created, 1)
+        self.assertEqual([error['row'] for error in errors], [2, 3])
+        self.assertTrue(all(error['message'].startswith('Could not save') for error in errors))
+        # Nothing of the rejected chunk is left behind, the next chunk is saved
+        self.assertFalse(CustomUser.objects.filter(username='asha').exists())
+        self.assertEqual(CustomUser.objects.filter(username='ravi').count(), 1)
+        self.assertTrue(Student.objects.filter(admin__username='meera').exists())
+        self.assertEqual(StudentInvoice.objects.count(), Student.objects.count())
+
+
+class CollectPaymentTests(TestCase):
+    """Allocation of a payment to the open invoices and the cashbook it leaves"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.tuition = FeeHead.objects.create(name='Tuition')
+        cls.bus = FeeHead.objects.create(name='Bus')
+
+    def setUp(self):
+        self.student = make_student(self.course, 'asha')
+        self.old = self.invoice(self.tuition, '1000.00', days_ago=60)
+        self.new = self.invoice(self.bus, '500.00', days_ago=30)
+
+    def invoice(self, fee_head, amount, days_ago):
+        invoice = StudentInvoice.objects.create(student=self.student, fee_head=fee_head, amount=Decimal(amount))
+        StudentInvoice.objects.filter(id=invoice.id).update(
+            created_at=invoice.created_at - datetime.timedelta(days=days_ago))
+        return invoice
+
+    def pay(self, amount, payment_mode='Cash'):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = collect_payment(self.student.id, amount, payment_mode)
+        self.student.refresh_from_db()
+        self.old.refresh_from_db()
+        self.new.refresh_from_db()
+        return result
+
+    def assertReconciles(self):
+        """Every payment is allocated or held as advance, and the cashbook matches a full rebuild"""
+        paid = sum(FeePayment.objects.filter(student=self.student).values_list('amount', flat=True))
+        allocated = sum(InvoiceAllocation.objects.filter(payment__student=self.student).values_list('amount', flat=True))
+        self.assertEqual(paid, allocated + self.student.advance_balance)
+        for invoice in StudentInvoice.objects.filter(student=self.student):
+            self.assertEqual(invoice.paid_amount, sum(invoice.allocations.values_list('amount', flat=True)))
+            self.assertEqual(invoice.is_paid, invoice.paid_amount >= invoice.amount)
+
+        kept = (
+            list(DailyCashbook.objects.order_by('date').values_list('date', 'fee_collection', 'payment_count')),
+            sorted(DailyFeeCollection.objects.values_list('payment_mode', 'fee_head_id', 'amount'), key=str),
+        )
+        rebuild_cashbook()
+        rebuilt = (
+            list(DailyCashbook.objects.order_by('date').values_list('date', 'fee_collection', 'payment_count')),
+            sorted(DailyFeeCollection.objects.values_list('payment_mode', 'fee_head_id', 'amount'), key=str),
+        )
+        self.assertEqual(kept, rebuilt)
+
+    def test_oldest_invoice_first(self):
+        payment, allocations, advance_used = self.pay('1200')
+
+        self.assertEqual([(a.invoice_id, a.amount) for a in allocations], [(self.old.id, 1000), (self.new.id, 200)])
+        self.assertEqual(advance_used, 0)
+        self.assertTrue(self.old.is_paid)
+        self.assertEqual(self.old.payment_date, datetime.date.today())
+        self.assertFalse(self.new.is_paid)
+        self.assertEqual(self.new.paid_amount, Decimal('200.00'))
+        self.assertEqual(self.student.advance_balance, 0)
+        self.assertReconciles()
+
+    def test_overpayment_goes_to_advance_and_is_spent_first(self):
+        self.pay('1700.50')
+        self.assertTrue(self.new.is_paid)
+        self.assertEqual(self.student.advance_balance, Decimal('200.50'))
+
+        later = self.invoice(self.tuition, '300.00', days_ago=0)
+        payment, allocations, advance_used = self.pay('100', payment_mode='UPI')
+
+        self.assertEqual([(a.invoice_id, a.amount) for a in allocations], [(later.id, Decimal('300.00'))])
+        self.assertEqual(advance_used, Decimal('200.50'))
+        self.assertEqual(self.student.advance_balance, Decimal('0.50'))
+        self.assertReconciles()
+
+    def test_cashbook_counts_each_payment_once(self):
+        self.pay('300')
+        self.pay('300', payment_mode='UPI')
+
+        day = DailyCashbook.objects.get(date=datetime.date.today())
+        self.assertEqual((day.fee_collection, day.payment_count), (Decimal('600.00'), 2))
+        self.assertReconciles()
+
+    def test_invalid_amounts(self):
+        for amount in ('', 'abc', '0', '-5', 'NaN', 'Infinity'):
+            with self.assertRaises(ValueError, msg=amount):
+                collect_payment(self.student.id, amount)
+        self.assertFalse(FeePayment.objects.exists())
+        self.assertEqual(parse_amount(' 10.555 '), Decimal('10.56'))
+
+
+class OutstandingInvoicesTests(TestCase):
+    """Balances, ageing buckets and paging of the outstanding fees report"""
+
+    AS_OF = datetime.date(2025, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.other_course = Course.objects.create(name='Plus Two')
+        cls.tuition = FeeHead.objects.create(name='Tuition')
+        cls.bus = FeeHead.objects.create(name='Bus')
+        asha = make_student(cls.course, 'asha')
+        ravi = make_student(cls.other_course, 'ravi')
+
+        def invoice(student, fee_head, amount, days_overdue, paid_amount=0, is_paid=False):
+            return StudentInvoice.objects.create(
+                student=student, fee_head=fee_head, amount=Decimal(amount), paid_amount=Decimal(paid_amount),
+                is_paid=is_paid, due_date=cls.AS_OF - datetime.timedelta(days=days_overdue))
+
+        cls.not_due = invoice(asha, cls.tuition, '1000', -1)
+        cls.today = invoice(asha, cls.bus, '500', 0, paid_amount='200')
+        cls.month = invoice(asha, cls.tuition, '1000', 31)
+        cls.quarter = invoice(ravi, cls.tuition, '800', 90)
+        cls.old = invoice(ravi, cls.bus, '300', 91)
+        # Settled, and not flagged paid but with nothing left to pay
+        invoice(asha, cls.tuition, '400', 10, paid_amount='400', is_paid=True)
+        invoice(ravi, cls.bus, '100', 10, paid_amount='100')
+
+    def test_balance_and_bucket(self):
+        invoices = {invoice.id: invoice for invoice in outstanding_invoices(self.AS_OF)}
+
+        self.assertEqual(set(invoices), {self.not_due.id, self.today.id, self.month.id, self.quarter.id, self.old.id})
+        self.assertEqual(invoices[self.today.id].balance, Decimal('300'))
+        self.assertEqual({invoice_id: invoice.bucket for invoice_id, invoice in invoices.items()}, {
+            self.not_due.id: 'not_due',
+            self.today.id: '0_30',
+            self.month.id: '31_60',
+            self.quarter.id: '61_90',
+            self.old.id: '90_plus',
+        })
+
+    def test_filters(self):
+        def ids(invoices):
+            return sorted(invoice.id for invoice in invoices)
+
+        self.assertEqual(ids(outstanding_invoices(self.AS_OF, course_id=self.other_course.id)),
+                         [self.quarter.id, self.old.id])
+        self.assertEqual(ids(outstanding_invoices(self.AS_OF, fee_head_id=self.bus.id)), [self.today.id, self.old.id])
+        self.assertEqual(ids(outstanding_invoices(self.AS_OF, bucket='90_plus')), [self.old.id])
+
+    def test_summary(self):
+        summary = outstanding_summary(outstanding_invoices(self.AS_OF))
+
+        self.assertEqual((summary['total'], summary['count']), (Decimal('3400'), 5))
+        self.assertEqual([(row['fee_head__name'], row['total']) for row in summary['by_fee_head']],
+                         [('Tuition', Decimal('2800')), ('Bus', Decimal('600'))])
+        self.assertEqual([(row['student__course_id__name'], row['count']) for row in summary['by_course']],
+                         [('Plus One', 3), ('Plus Two', 2)])
+        self.assertEqual([(row['key'], row['total']) for row in summary['by_bucket']], [
+            ('not_due', Decimal('1000')), ('0_30', Decimal('300')), ('31_60', Decimal('1000')),
+            ('61_90', Decimal('800')), ('90_plus', Decimal('300')),
+        ])
+
+    def test_keyset_pages(self):
+        invoices = outstanding_invoices(self.AS_OF)
+        seen = []
+        after = None
+        while True:
+            rows, after = outstanding_page(invoices, after, page_size=2)
+            seen.append([row.id for row in rows])
+            if after is None:
+                break
+
+        self.assertEqual([len(page) for page in seen], [2, 2, 1])
+        self.assertEqual(sum(seen, []), sorted(invoice.id for invoice in invoices))
+
+    def test_csv_export(self):
+        lines = list(stream_outstanding_csv(outstanding_invoices(self.AS_OF), self.AS_OF))
+
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[0].startswith('Invoice ID,Student'))
+        # Not yet due counts as 0 days overdue
+        self.assertIn(f'{self.not_due.id},Asha,asha@example.com,Plus One,Tuition,2025-07-01,0,', lines[1])
+
+
+class ProfileMiddlewareTests(TestCase):
+    """request.profile from the cache, request.user loaded fresh on every request"""
+
+    def setUp(self):
+        cache.clear()
+        self.student = make_student(Course.objects.create(name='Plus One'), 'asha')
+        self.client.force_login(self.student.admin)
+
+    def test_profile_on_request(self):
+        response = self.client.get(reverse('student_home'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.profile, self.student)
+        self.assertIs(response.wsgi_request.profile.admin, response.wsgi_request.user)
+
+    def test_deactivated_user_is_refused_on_next_request(self):
+        self.client.get(reverse('student_home'))
+        # As another worker would: no signal reaches this process's cache
+        CustomUser.objects.filter(id=self.student.admin_id).update(is_active=False)
+
+        response = self.client.get(reverse('student_home'))
+
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('student_home')}", fetch_redirect_response=False)
+        self.assertIsNone(response.wsgi_request.profile)
+
+    def test_user_changes_are_not_cached(self):
+        self.client.get(reverse('student_home'))
+        CustomUser.objects.filter(id=self.student.admin_id).update(first_name='Renamed', user_type=2)
+
+        response = self.client.get(reverse('student_home'))
+
+        self.assertEqual(response.wsgi_request.user.first_name, 'Renamed')
+        # A Staff user with no Staff row has no profile, whatever was cached for the student
+        self.assertIsNone(response.wsgi_request.profile)
+
+
+class StudentSearchTests(TestCase):
+    """Prefix search on the token table and the signals that keep it current"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(course, 'asha', phone_number='9847012345')
+        cls.ashraf = make_student(course, 'ashraf')
+        cls.ravi = make_student(course, 'ravi')
+        CustomUser.objects.filter(id=cls.ravi.admin_id).update(last_name='Kumar')
+
+    def names(self, query):
+        return [row['name'] for row in search_students(query)[0]]
+
+    def test_prefix_words(self):
+        self.assertEqual(self.names('ash'), ['Asha', 'Ashraf'])
+        self.assertEqual(self.names('ASHA example'), ['Asha'])
+        self.assertEqual(self.names('98470'), ['Asha'])
+        self.assertEqual(self.names('sha'), [])
+        self.assertEqual(self.names('   '), [])
+
+    def test_admission_number(self):
+        self.assertIn(self.ravi.admin_id, [row['id'] for row in search_students(str(self.ravi.id))[0]])
+
+    def test_rename_updates_tokens(self):
+        user = self.ravi.admin
+        user.first_name = 'Rahul'
+        user.save()
+
+        self.assertEqual(self.names('rahul'), ['Rahul'])
+        self.assertEqual(self.names('ravi'), ['Rahul']) # Still the username
+
+    def test_login_and_payment_saves_leave_tokens_alone(self):
+        tokens = set(StudentSearchToken.objects.filter(student=self.asha).values_list('id', flat=True))
+        student = Student.objects.select_related('admin').get(id=self.asha.id)
+
+        with self.assertNumQueries(1):
+            student.admin.save(update_fields=['last_login'])
+        with self.assertNumQueries(1):
+            student.save(update_fields=['advance_balance', 'updated_at'])
+
+        self.assertEqual(set(StudentSearchToken.objects.filter(student=self.asha).values_list('id', flat=True)), tokens)
+
+
+class _InlinePool:
+    """Stands in for the worker process pool: runs each job at submit, crashing the ones named 'crash'"""
+
+    def __init__(self):
+        self.shut_down = False
+
+    def submit(self, fn, job_id):
+        future = Future()
+        job = PdfJob.objects.get(id=job_id)
+        if job.filename == 'crash.pdf':
+            future.set_exception(BrokenProcessPool('A child process terminated abruptly'))
+        else:
+            PdfJob.objects.filter(id=job_id).update(status='done', render_seconds=0.1, finished_at=job.started_at)
+            future.set_result(job_id)
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.shut_down = True
+
+
+class PdfJobTests(TestCase):
+    """The progress card of one exam and the PDF worker loop"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(name='Plus One')
+        cls.student = make_student(course, 'asha')
+        cls.maths = Subject.objects.create(name='Maths', course=course, max_ce_marks=20, max_te_marks=80)
+        cls.exam = Examination.objects.create(name='Term 1')
+        Student_Result.objects.create(student=cls.student, subject=cls.maths, exam=cls.exam, ce_marks=15, te_marks=60)
+        Student_Result.objects.create(student=cls.student, subject=cls.maths, exam=None, ce_marks=5, te_marks=20)
+
+    def test_student_card_for_one_exam(self):
+        card = student_card_context(self.student.id, self.exam.id)
+        self.assertEqual(card['exam'], self.exam)
+        self.assertEqual((card['total_obtained'], card['total_max']), (75, 100))
+
+        without_exam = student_card_context(self.student.id)
+        self.assertIsNone(without_exam['exam'])
+        self.assertEqual(without_exam['total_obtained'], 25)
+
+    def test_worker_survives_broken_pool(self):
+        crash = PdfJob.objects.create(kind='student_card', params={}, filename='crash.pdf')
+        first = PdfJob.objects.create(kind='student_card', params={}, filename='first.pdf')
+        later = PdfJob.objects.create(kind='student_card', params={}, filename='later.pdf')
+        pools = []
+        log = []
+
+        def new_pool(workers):
+            pools.append(_InlinePool())
+            return pools[-1]
+
+        # The test database must stay open, children are not spawned here
+        with mock.patch.object(pdf_jobs, '_job_pool', new_pool), mock.patch.object(pdf_jobs.connections, 'close_all'):
+            pdf_jobs.run_worker(workers=2, poll_interval=0, once=True, log=log.append)
+
+        statuses = dict(PdfJob.objects.values_list('id', 'status'))
+        self.assertEqual(statuses, {crash.id: 'failed', first.id: 'done', later.id: 'done'})
+        self.assertIn('BrokenProcessPool', PdfJob.objects.get(id=crash.id).error)
+        # The broken pool was replaced and every pool shut down
+        self.assertEqual(len(pools), 2)
+        self.assertTrue(all(pool.shut_down for pool in pools))
+        self.assertTrue(any(line.startswith(f'Job {crash.id} failed') for line in log))
+
+
+class BillingRunTests(TestCase):
+    """Monthly billing runs and the fee structures they bill"""
+
+    JUNE = datetime.date(2025, 6, 1)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.tuition = FeeHead.objects.create(name='Tuition')
+        cls.library = FeeHead.objects.create(name='Library')
+        cls.asha = make_student(cls.course, 'asha')
+
+    def invoices(self, fee_head):
+        return list(StudentInvoice.objects.filter(fee_head=fee_head).order_by('billing_period', 'id')
+                    .values_list('student_id', 'billing_period', 'amount'))
+
+    def test_month_is_billed_once(self):
+        FeeStructure.objects.create(course=self.course, fee_head=self.tuition, amount=500, billing_cycle='monthly')
+
+        run = run_billing(datetime.date(2025, 6, 17))
+        self.assertEqual((run.period, run.invoices_created), (self.JUNE, 1))
+        self.assertIsNone(run_billing(self.JUNE))
+
+        # Forced again, the month is billed only for the student it missed
+        ravi = make_student(self.course, 'ravi')
+        run = run_billing(self.JUNE, force=True)
+        self.assertEqual(run.invoices_created, 2)
+        self.assertEqual(self.invoices(self.tuition), [
+            (self.asha.id, self.JUNE, Decimal('500.00')), (ravi.id, self.JUNE, Decimal('500.00')),
+        ])
+        self.assertEqual(BillingRun.objects.count(), 1)
+
+    def test_installments_add_up_and_stop(self):
+        FeeStructure.objects.create(course=self.course, fee_head=self.tuition, amount=1000,
+                                    installments=3, billing_cycle='installments')
+
+        for month in (6, 7, 8, 9):
+            run_billing(datetime.date(2025, month, 1))
+
+        amounts = [amount for _, _, amount in self.invoices(self.tuition)]
+        self.assertEqual(amounts, [Decimal('333.33'), Decimal('333.33'), Decimal('333.34')])
+
+    def test_one_time_and_unknown_cycles_are_not_billed(self):
+        FeeStructure.objects.create(course=self.course, fee_head=self.tuition, amount=1000, billing_cycle='once')
+        weekly = FeeStructure.objects.create(course=self.course, fee_head=self.library, amount=50, billing_cycle='monthly')
+        FeeStructure.objects.filter(id=weekly.id).update(billing_cycle='weekly')
+
+        run = run_billing(self.JUNE)
+
+        self.assertEqual(run.invoices_created, 0)
+
+
+class FeeStructureViewTests(TestCase):
+    """The accountant's fee structure forms refuse what billing cannot handle"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.tuition = FeeHead.objects.create(name='Tuition')
+        cls.accountant = CustomUser.objects.create_user(
+            username='accounts', email='accounts@example.com', password='x', user_type=4)
+
+    def setUp(self):
+        self.client.force_login(self.accountant)
+
+    def add(self, **values):
+        data = {'course_id': self.course.id, 'fee_head_id': self.tuition.id, 'amount': '1200',
+                'installments': '3', 'billing_cycle': 'installments', **values}
+        return self.client.post(reverse('add_fee_structure'), data)
+
+    def test_add(self):
+        response = self.add()
+
+        self.assertRedirects(response, reverse('manage_fee_structure'), fetch_redirect_response=False)
+        structure = FeeStructure.objects.get()
+        self.assertEqual((structure.installments, structure.billing_cycle), (3, 'installments'))
+
+    def test_add_rejects_unknown_cycle_and_no_installments(self):
+        for values in ({'billing_cycle': 'weekly'}, {'installments': '0'}, {'installments': '-2'}, {'installments': ''}):
+            response = self.add(**values)
+            self.assertEqual(response.status_code, 200, values)
+        self.assertFalse(FeeStructure.objects.exists())
+
+    def test_edit_rejects_no_installments(self):
+        structure = FeeStructure.objects.create(course=self.course, fee_head=self.tuition, amount=1200,
+                                                installments=3, billing_cycle='installments')
+
+        response = self.client.post(reverse('edit_fee_structure', args=[structure.id]),
+                                    {'amount': '1200', 'installments': '0', 'billing_cycle': 'weekly'})
+
+        self.assertEqual(response.status_code, 200)
+        structure.refresh_from_db()
+        self.assertEqual((structure.installments, structure.billing_cycle), (3, 'installments'))
+
+
+class ImportJobTests(TestCase):
+    """Import jobs record progress and a heartbeat; only silent ones are requeued"""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, IMPORT_JOBS_ASYNC=False))
+
+    def sheet(self, *rows):
+        workbook = openpyxl.Workbook()
+        workbook.active.append(['First Name', 'Username', 'Email'])
+        for row in rows:
+            workbook.active.append(row)
+        content = io.BytesIO()
+        workbook.save(content)
+        return SimpleUploadedFile('staff.xlsx', content.getvalue())
+
+    def test_import_records_progress(self):
+        started = timezone.now()
+        job = enqueue_import('staff', self.sheet(
+            ['Asha', 'asha', 'asha@example.com'],
+            ['Ravi', 'ravi', ''],
+        ))
+
+        self.assertEqual(job.status, 'done')
+        self.assertEqual((job.total_rows, job.created_rows, job.failed_rows), (2, 1, 1))
+        self.assertEqual(job.errors[0]['message'], 'Missing required fields')
+        self.assertGreaterEqual(job.heartbeat_at, started)
+
+    def test_only_jobs_without_a_heartbeat_are_requeued(self):
+        now = timezone.now()
+        long_running = ImportJob.objects.create(
+            kind='staff', filename='big.xlsx', status='running', created_rows=4000,
+            started_at=now - datetime.timedelta(hours=3), heartbeat_at=now - datetime.timedelta(seconds=5))
+        dead = ImportJob.objects.create(
+            kind='staff', filename='dead.xlsx', status='running', created_rows=500,
+            started_at=now - datetime.timedelta(minutes=30), heartbeat_at=now - datetime.timedelta(minutes=20))
+
+        self.assertEqual(requeue_stale_jobs(600), 1)
+
+        long_running.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual((long_running.status, long_running.created_rows), ('running', 4000))
+        self.assertEqual((dead.status, dead.created_rows, dead.heartbeat_at), ('queued', 0, None))
+
+
+class CashbookTests(TestCase):
+    """The daily rollup splits fees by head, with advance money under fee head None"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(name='Plus One')
+        cls.tuition = FeeHead.objects.create(name='Tuition')
+        cls.unused = FeeHead.objects.create(name='Library')
+        cls.student = make_student(course, 'asha')
+        StudentInvoice.objects.create(student=cls.student, fee_head=cls.tuition, amount=Decimal('800'))
+        cls.accountant = CustomUser.objects.create_user(
+            username='accounts', email='accounts@example.com', password='x', user_type=4)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            collect_payment(self.student.id, '1000')
+
+    def by_fee_head(self):
+        return {row['fee_head__name']: row['total'] for row in collection_summary()['by_fee_head']}
+
+    def test_fees_and_advance_by_head(self):
+        summary = collection_summary()
+
+        self.assertEqual((summary['total'], summary['payment_count']), (Decimal('1000.00'), 1))
+        self.assertEqual(self.by_fee_head(), {'Tuition': Decimal('800.00'), None: Decimal('200.00')})
+
+    def test_collected_fee_head_cannot_be_deleted(self):
+        self.client.force_login(self.accountant)
+
+        self.client.post(reverse('delete_fee_head', args=[self.tuition.id]))
+        self.client.post(reverse('delete_fee_head', args=[self.unused.id]))
+
+        self.assertEqual(list(FeeHead.objects.values_list('name', flat=True)), ['Tuition'])
+        rebuild_cashbook()
+        self.assertEqual(self.by_fee_head(), {'Tuition': Decimal('800.00'), None: Decimal('200.00')})
+
+
+class MarksSheetTests(TestCase):
+    """A marks sheet is saved whole or not at all"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.maths = Subject.objects.create(name='Maths', course=cls.course, max_ce_marks=20, max_te_marks=80)
+        cls.exam = Examination.objects.create(name='Term 1')
+        cls.asha = make_student(cls.course, 'asha')
+        cls.ravi = make_student(cls.course, 'ravi')
+        cls.outsider = make_student(Course.objects.create(name='Plus Two'), 'meera')
+
+    def marks(self, exam=None):
+        return dict(Student_Result.objects.filter(subject=self.maths, exam=exam)
+                    .values_list('student_id', 'te_marks'))
+
+    def test_save_and_resave(self):
+        for exam in (self.exam, None):
+            ids = [self.asha.admin_id, self.ravi.admin_id]
+            self.assertEqual(save_marks_sheet(self.maths, exam, ids, ['15', '10'], ['60', '40']), (2, []))
+            self.assertEqual(save_marks_sheet(self.maths, exam, ids, ['15', '10'], ['70', '40']), (2, []))
+            self.assertEqual(self.marks(exam), {self.asha.id: 70, self.ravi.id: 40})
+
+    def test_one_bad_row_rejects_the_sheet(self):
+        sheets = [
+            (['21'], ['10'], 'CE marks cannot exceed 20'),
+            (['5'], ['-1'], 'TE marks cannot be negative'),
+            (['5'], ['abc'], 'TE marks must be a number'),
+        ]
+        for ce, te, message in sheets:
+            saved, errors = save_marks_sheet(
+                self.maths, self.exam, [self.ravi.admin_id, self.asha.admin_id], ['10'] + ce, ['40'] + te)
+            self.assertEqual(saved, 0)
+            self.assertEqual(errors, [{'row': 2, 'id': self.asha.admin_id, 'message': message}])
+        self.assertEqual(self.marks(self.exam), {})
+
+    def test_students_are_checked(self):
+        ids = [self.asha.admin_id, self.outsider.admin_id, 99999, self.asha.admin_id]
+        saved, errors = save_marks_sheet(self.maths, self.exam, ids, ['10'] * 4, ['40'] * 4)
+
+        self.assertEqual(saved, 0)
+        self.assertEqual([(error['row'], error['message']) for error in errors], [
+            (2, 'Student is not in Plus One'),
+            (3, 'Student does not exist'),
+            (4, 'Student appears more than once in the sheet'),
+        ])
+        self.assertEqual(self.marks(self.exam), {})
+
+    def test_incomplete_sheet(self):
+        saved, errors = save_marks_sheet(self.maths, self.exam, [self.asha.admin_id, self.ravi.admin_id], ['10'], ['40', '40'])
+        self.assertEqual((saved, errors[0]['row']), (0, None))
+
+
+class AccessMiddlewareTests(TestCase):
+    """Every module route is checked against ROLE_POLICY"""
+
+    AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.hod = CustomUser.objects.create_user(username='hod', email='hod@example.com', password='x', user_type=1)
+        cls.accountant = CustomUser.objects.create_user(
+            username='accounts', email='accounts@example.com', password='x', user_type=4)
+        cls.student = make_student(Course.objects.create(name='Plus One'), 'asha')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_route_table(self):
+        table = route_roles()
+        self.assertEqual(table['hod/students/'], {HOD})
+        self.assertEqual(table['student/view_result/'], {STUDENT})
+        self.assertIn(HOD, table['accountant/student_search/'])
+        self.assertNotIn('login/', table)
+
+    def test_anonymous(self):
+        response = self.client.get(reverse('view_students'))
+        self.assertRedirects(response, f"{reverse('login')}?next={reverse('view_students')}", fetch_redirect_response=False)
+
+        response = self.client.get(reverse('student_search'), **self.AJAX)
+        self.assertEqual(response.status_code, 401)
+        # Routes outside the policy are left to their views
+        self.assertEqual(self.client.get(reverse('login')).status_code, 200)
+
+    def test_allowed(self):
+        for user in (self.hod, self.accountant):
+            self.client.force_login(user)
+            response = self.client.get(reverse('student_search'), {'q': 'asha'}, **self.AJAX)
+            self.assertEqual(response.status_code, 200, user.username)
+        self.assertEqual(denial_counts(['accountant/student_search/']), {})
+
+    def test_other_role_is_denied_and_counted(self):
+        self.client.force_login(self.student.admin)
+
+        response = self.client.get(reverse('view_students'))
+        self.assertRedirects(response, reverse('home'), fetch_redirect_response=False)
+        response = self.client.get(reverse('student_search'), {'q': 'asha'}, **self.AJAX)
+        self.assertEqual((response.status_code, response.json()), (403, {'error': 'Access denied.'}))
+        self.client.get(reverse('student_search'), {'q': 'asha'}, **self.AJAX)
+
+        self.assertEqual(denial_counts(['hod/students/', 'accountant/student_search/', 'hod/']), {
+            'accountant/student_search/': 2, 'hod/students/': 1,
+        })
+
+
+class AttendanceSheetTests(TestCase):
+    """A roll call is saved in one transaction, once per course and date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(cls.course, 'asha')
+        cls.ravi = make_student(cls.course, 'ravi')
+
+    def rows(self, asha, ravi, leave_status=''):
+        return [
+            {'id': self.asha.admin_id, 'status': asha, 'leave_status': ''},
+            {'id': self.ravi.admin_id, 'status': ravi, 'leave_status': leave_status},
+        ]
+
+    def test_saving_a_day_again_updates_it(self):
+        first = save_attendance_sheet(self.course, '2025-06-02', self.rows(1, 1))
+        again = save_attendance_sheet(self.course, datetime.date(2025, 6, 2), self.rows(1, 0, 'Informed'))
+
+        self.assertEqual(first.id, again.id)
+        self.assertEqual(Attendance.objects.count(), 1)
+        self.assertEqual(
+            set(Attendance_Report.objects.values_list('student_id', 'is_present', 'leave_status')),
+            {(self.asha.id, True, ''), (self.ravi.id, False, 'Informed')},
+        )
+
+    def test_unknown_student_writes_nothing(self):
+        rows = self.rows(1, 1) + [{'id': 99999, 'status': 1, 'leave_status': ''}]
+
+        with self.assertRaises(Student.DoesNotExist):
+            save_attendance_sheet(self.course, '2025-06-02', rows)
+
+        self.assertFalse(Attendance.objects.exists())
+        self.assertFalse(Attendance_Report.objects.exists())
+
+
+class AttendanceSummaryTests(TestCase):
+    """The monthly rollup against counting the roll calls themselves"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(cls.course, 'asha')
+        cls.ravi = make_student(cls.course, 'ravi')
+        # Ravi is absent every third day, with an informed leave every sixth
+        for day in range(1, 21):
+            for month in (5, 6):
+                absent = day % 3 == 0
+                save_attendance_sheet(cls.course, datetime.date(2025, month, day), [
+                    {'id': cls.asha.admin_id, 'status': 1, 'leave_status': ''},
+                    {'id': cls.ravi.admin_id, 'status': int(not absent), 'leave_status': 'Informed' if day % 6 == 0 else ''},
+                ])
+
+    def summary(self):
+        return sorted(AttendanceSummary.objects.values_list(
+            'student_id', 'month', 'present_count', 'absent_count', 'informed_leave_count'))
+
+    def raw_counts(self, start, end):
+        counts = {}
+        for report in Attendance_Report.objects.filter(
+            attendance__attendance_date__gte=start, attendance__attendance_date__lte=end
+        ).select_related('attendance'):
+            row = counts.setdefault((report.student_id, self.course.id), {'present': 0, 'absent': 0, 'informed_leave': 0})
+            row['present' if report.is_present else 'absent'] += 1
+            row['informed_leave'] += not report.is_present and report.leave_status == 'Informed'
+        return counts
+
+    def test_kept_in_step_with_the_roll_calls(self):
+        kept = self.summary()
+        self.assertIn((self.ravi.id, datetime.date(2025, 6, 1), 14, 6, 3), kept)
+        rebuild_attendance_summary()
+        self.assertEqual(self.summary(), kept)
+
+    def test_counts_over_partial_months(self):
+        start, end = datetime.date(2025, 5, 10), datetime.date(2025, 6, 30)
+        self.assertEqual(attendance_counts([self.course], start, end), self.raw_counts(start, end))
+
+    def test_moving_a_roll_call_to_another_month(self):
+        attendance = Attendance.objects.get(course=self.course, attendance_date=datetime.date(2025, 5, 3))
+        rows = [
+            {'id': self.asha.admin_id, 'status': 1, 'leave_status': ''},
+            {'id': self.ravi.admin_id, 'status': 0, 'leave_status': ''},
+        ]
+        update_attendance_sheet(attendance, '2025-07-01', rows)
+
+        kept = self.summary()
+        rebuild_attendance_summary()
+        self.assertEqual(self.summary(), kept)
+        self.assertIn((self.ravi.id, datetime.date(2025, 7, 1), 0, 1, 0), kept)
+
+
+class AttendanceDateTests(TestCase):
+    """One Attendance per course and date"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(cls.course, 'asha')
+        cls.rows = [{'id': cls.asha.admin_id, 'status': 1, 'leave_status': ''}]
+        cls.monday = save_attendance_sheet(cls.course, '2025-06-02', cls.rows)
+        cls.tuesday = save_attendance_sheet(cls.course, '2025-06-03', cls.rows)
+
+    def test_database_refuses_a_second_roll_call(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Attendance.objects.create(course=self.course, attendance_date=datetime.date(2025, 6, 2))
+        # Another course may take the same day
+        Attendance.objects.create(course=Course.objects.create(name='Plus Two'), attendance_date=datetime.date(2025, 6, 2))
+
+    def test_moving_onto_a_taken_date_is_refused(self):
+        with self.assertRaisesMessage(ValueError, 'Attendance already taken for 2025-06-02'):
+            update_attendance_sheet(self.tuesday, '2025-06-02', self.rows)
+
+        self.tuesday.refresh_from_db()
+        self.assertEqual(self.tuesday.attendance_date, datetime.date(2025, 6, 3))
+
+
+class AttendanceReportTests(TestCase):
+    """Report periods and the per-student percentages of the HOD and Staff reports"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.empty = Course.objects.create(name='Plus Two')
+        cls.asha = make_student(cls.course, 'asha')
+        cls.ravi = make_student(cls.course, 'ravi')
+        # Four days in June, Ravi present on the first only
+        for day in (2, 3, 4, 5):
+            save_attendance_sheet(cls.course, datetime.date(2025, 6, day), [
+                {'id': cls.asha.admin_id, 'status': 1, 'leave_status': ''},
+                {'id': cls.ravi.admin_id, 'status': int(day == 2), 'leave_status': ''},
+            ])
+
+    def test_period_bounds(self):
+        self.assertEqual(period_bounds('day', '2025-06-04'), (datetime.date(2025, 6, 4),) * 2)
+        self.assertEqual(period_bounds('weekly', '2025-06-04'), (datetime.date(2025, 6, 2), datetime.date(2025, 6, 8)))
+        self.assertEqual(period_bounds('month', month='2', year='2024'), (datetime.date(2024, 2, 1), datetime.date(2024, 2, 29)))
+        self.assertEqual(period_bounds('till_today'), (None, datetime.date.today()))
+        self.assertEqual(period_bounds(None), (None, None))
+
+    def test_report(self):
+        report = get_attendance_report([self.course, self.empty], 'range', '2025-06-03', '2025-06-30')
+
+        self.assertEqual([course['course_name'] for course in report], ['Plus One', 'Plus Two'])
+        self.assertEqual(report[0]['data'], [
+            {'name': 'Asha ', 'total_days': 3, 'present': 3, 'absent': 0, 'percentage': 100.0},
+            {'name': 'Ravi ', 'total_days': 3, 'present': 0, 'absent': 3, 'percentage': 0.0},
+        ])
+        self.assertEqual(report[1]['data'], [])
+
+    def test_analysis(self):
+        labels = {'below': 'Low', 'above': 'Good'}
+        below = get_attendance_analysis([self.course], 'below', 75, labels)[0]['data']
+        above = get_attendance_analysis([self.course], 'above', 75, labels)[0]['data']
+
+        self.assertEqual([(row['name'], row['percentage'], row['status']) for row in below], [('Ravi ', 25.0, 'Low')])
+        self.assertEqual([(row['name'], row['percentage'], row['status']) for row in above], [('Asha ', 100.0, 'Good')])
+
+
+class PdfCacheTests(TestCase):
+    """Rendered PDFs cached by content, dropped when their results change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.student = make_student(cls.course, 'asha')
+        cls.maths = Subject.objects.create(name='Maths', course=cls.course)
+        cls.exam = Examination.objects.create(name='Term 1')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def card(self, exam, html='<p>card</p>'):
+        context = {'view_type': 'student_wise', 'student': self.student, 'course': self.course, 'exam': exam}
+        return pdf_cache.cache_path(context, html)
+
+    def test_path_by_exam_owner_and_content(self):
+        path = self.card(self.exam)
+        self.assertTrue(path.startswith(f'pdf_cache/exam-{self.exam.id}/student-{self.student.id}/'))
+        self.assertTrue(self.card(None).startswith('pdf_cache/exam-none/'))
+        self.assertNotEqual(self.card(self.exam, '<p>new marks</p>'), path)
+
+        self.assertFalse(pdf_cache.get_cached(path))
+        pdf_cache.store(path, b'%PDF-1.4')
+        self.assertTrue(pdf_cache.get_cached(path))
+
+    def test_saved_result_drops_only_its_exam(self):
+        term, no_exam = self.card(self.exam), self.card(None)
+        pdf_cache.store(term, b'%PDF-1.4')
+        pdf_cache.store(no_exam, b'%PDF-1.4')
+
+        Student_Result.objects.create(student=self.student, subject=self.maths, exam=self.exam, ce_marks=10, te_marks=50)
+
+        self.assertFalse(pdf_cache.get_cached(term))
+        self.assertTrue(pdf_cache.get_cached(no_exam))
+
+    def test_least_recently_used_are_evicted(self):
+        paths = [self.card(self.exam, f'<p>{i}</p>') for i in range(3)]
+        for i, path in enumerate(paths):
+            pdf_cache.store(path, b'x' * 100)
+            os.utime(os.path.join(settings.MEDIA_ROOT, path), (1000 + i, 1000 + i))
+        pdf_cache.get_cached(paths[0])
+
+        self.assertEqual(pdf_cache.evict(250), 1)
+        self.assertEqual([pdf_cache.get_cached(path) for path in paths], [True, False, True])
+
+
+class DashboardStatsTests(TestCase):
+    """The cached HOD dashboard figures are dropped by the signals of what they count"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(cls.course, 'asha')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_match_the_tables(self):
+        stats = dashboard_stats.compute_stats()
+        self.assertEqual((stats['students_count'], stats['courses_count'], stats['staff_count']), (1, 1, 0))
+        self.assertEqual(stats['recent_students'], [self.asha])
+
+    def test_cached_until_a_counted_row_changes(self):
+        dashboard_stats.dashboard_stats()
+        with self.assertNumQueries(0):
+            dashboard_stats.dashboard_stats()
+
+        # A login changes nothing the dashboard shows
+        self.asha.admin.save(update_fields=['last_login'])
+        self.assertEqual(dashboard_stats.dashboard_stats()['students_count'], 1)
+        self.assertEqual(dashboard_stats.cache_counters()['hits'], 2)
+
+        make_student(self.course, 'ravi')
+        self.assertEqual(dashboard_stats.dashboard_stats()['students_count'], 2)
+        self.assertEqual(dashboard_stats.cache_counters(), {'hits': 2, 'misses': 2, 'hit_rate': 50.0})
+
+
+class DashboardKpiTests(TestCase):
+    """Accountant and Management figures read from the rollups"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.today = datetime.date.today()
+        course = Course.objects.create(name='Plus One')
+        tuition = FeeHead.objects.create(name='Tuition')
+        cls.asha = make_student(course, 'asha')
+        cls.ravi = make_student(course, 'ravi')
+        StudentInvoice.objects.create(student=cls.asha, fee_head=tuition, amount=Decimal('1000'),
+                                      due_date=cls.today - datetime.timedelta(days=100))
+        Income.objects.create(source='Donation', amount=Decimal('300'), date=cls.today)
+        Expense.objects.create(head=ExpenseHead.objects.create(name='Power'), amount=Decimal('150'),
+                               date=cls.today, description='Bill')
+        for day in range(4):
+            save_attendance_sheet(course, cls.today.replace(day=1) + datetime.timedelta(days=day), [
+                {'id': cls.asha.admin_id, 'status': 1, 'leave_status': ''},
+                {'id': cls.ravi.admin_id, 'status': int(day == 0), 'leave_status': ''},
+            ])
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            collect_payment(self.asha.id, '400')
+
+    def test_figures(self):
+        kpis = compute_kpis(self.today)
+
+        collection = kpis['collection']
+        self.assertEqual((collection['fees_today'], collection['payments_today']), (Decimal('400.00'), 1))
+        self.assertEqual(collection['net_month'], Decimal('550.00'))
+        self.assertEqual(kpis['fee_heads'], [{'fee_head__name': 'Tuition', 'total': Decimal('400.00')}])
+        self.assertEqual(kpis['outstanding'], {
+            'total': Decimal('600.00'), 'count': 1, 'overdue': Decimal('600.00'), 'overdue_90': Decimal('600.00'),
+        })
+        self.assertEqual((kpis['attendance']['percentage'], kpis['attendance']['students_below']), (62.5, 1))
+
+    def test_reused_between_dashboard_loads(self):
+        dashboard_kpis()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboard_kpis()['collection']['payments_today'], 1)
+
+
+class GenerateInvoicesTests(TestCase):
+    """One-time fee heads invoiced set-based, once per student and head"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.other = Course.objects.create(name='Plus Two')
+        cls.asha = make_student(cls.course, 'asha', uses_hostel=True)
+        cls.ravi = make_student(cls.course, 'ravi', uses_transport=True,
+                                bus_stop=BusStop.objects.create(name='Town', monthly_fee=Decimal('650')))
+        cls.meera = make_student(cls.other, 'meera')
+        # Added after the students, so nothing is invoiced on admission
+        for name, amount in (('Tuition', 5000), ('Hostel', 2000), ('Bus', 800)):
+            FeeStructure.objects.create(course=cls.course, fee_head=FeeHead.objects.create(name=name), amount=amount)
+        FeeStructure.objects.create(course=cls.other, fee_head=FeeHead.objects.get(name='Tuition'), amount=4000)
+
+    def invoices(self):
+        return set(StudentInvoice.objects.values_list('student__admin__username', 'fee_head__name', 'amount'))
+
+    def test_heads_that_apply_to_each_student(self):
+        self.assertEqual(generate_invoices([self.course]), {self.course.id: 4})
+        self.assertEqual(self.invoices(), {
+            ('asha', 'Tuition', Decimal('5000.00')), ('asha', 'Hostel', Decimal('2000.00')),
+            ('ravi', 'Tuition', Decimal('5000.00')), ('ravi', 'Bus', Decimal('650.00')),
+        })
+
+    def test_generating_again_adds_nothing(self):
+        generate_invoices()
+        self.assertEqual(generate_invoices(), {self.course.id: 0, self.other.id: 0})
+        self.assertEqual(StudentInvoice.objects.count(), 5)
+
+
+class ResultMatrixTests(TestCase):
+    """Class results as a student x subject grid from one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.exam = Examination.objects.create(name='Term 1')
+        cls.maths = Subject.objects.create(name='Maths', course=cls.course)
+        cls.english = Subject.objects.create(name='English', course=cls.course)
+        cls.asha = make_student(cls.course, 'asha')
+        cls.ravi = make_student(cls.course, 'ravi')
+        Student_Result.objects.create(student=cls.asha, subject=cls.maths, exam=cls.exam, ce_marks=10, te_marks=50)
+        Student_Result.objects.create(student=cls.asha, subject=cls.maths, exam=None, ce_marks=1, te_marks=2)
+
+    def test_grid(self):
+        with self.assertNumQueries(1):
+            matrix = result_matrix([self.asha, self.ravi], [self.maths, self.english], self.exam)
+
+        self.assertEqual(matrix[self.asha.id][self.maths.id], {'ce_marks': 10, 'te_marks': 50, 'total_marks': 60})
+        self.assertEqual(matrix[self.asha.id][self.english.id], {'ce_marks': 0, 'te_marks': 0, 'total_marks': 0})
+        self.assertEqual(matrix[self.ravi.id][self.maths.id]['total_marks'], 0)
+        self.assertEqual(result_matrix([self.asha], [self.maths])[self.asha.id][self.maths.id]['total_marks'], 3)
+
+    def test_subject_results_in_admission_order(self):
+        rows = get_subject_results(self.course, self.maths, self.exam)
+        self.assertEqual([(student, cell['total_marks']) for student, cell in rows], [(self.asha, 60), (self.ravi, 0)])
+
+
+class JsonResponseTests(TestCase):
+    """AJAX JSON encoded once, querysets row by row, large bodies gzipped"""
+
+    @classmethod
+    def setUpTestData(cls):
+        Course.objects.bulk_create([Course(name=f'Course {i}') for i in range(3)])
+
+    def test_plain_json(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        response = json_response(request, {'courses': Course.objects.order_by('id').values('name'),
+                                           'fee': Decimal('10.50'), 'day': datetime.date(2025, 6, 1)})
+
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(json.loads(response.content), {
+            'courses': [{'name': 'Course 0'}, {'name': 'Course 1'}, {'name': 'Course 2'}],
+            'fee': '10.50', 'day': '2025-06-01',
+        })
+
+    @override_settings(JSON_GZIP_MIN_LENGTH=10)
+    def test_large_bodies_are_gzipped_when_accepted(self):
+        data = list(Course.objects.values('id', 'name'))
+        gzipped = json_response(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br'), data, status=201)
+        plain = json_response(RequestFactory().get('/'), data)
+
+        self.assertEqual((gzipped.status_code, gzipped['Content-Encoding']), (201, 'gzip'))
+        self.assertEqual(json.loads(gzip.decompress(gzipped.content)), data)
+        self.assertEqual(json.loads(plain.content), data)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+
+
+class HashPasswordsTests(TestCase):
+    """Passwords hashed in batches in a shared pool come back in order"""
+
+    def test_hashed_in_order_through_a_pool(self):
+        passwords = [f'secret{i}' for i in range(BATCH_SIZE * 2 + 3)]
+        # Threads stand in for the process pool; hash_batch is the same either way
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            hashed = hash_passwords(passwords, pool=pool)
+
+        self.assertEqual(len(hashed), len(passwords))
+        self.assertTrue(all(check_password(password, h) for password, h in zip(passwords, hashed)))
+
+    def test_single_worker_needs_no_pool(self):
+        with hash_pool(workers=4, jobs=1) as pool:
+            self.assertIsNone(pool)
+        with hash_pool(workers=1, jobs=500) as pool:
+            self.assertIsNone(pool)
+        hashed = hash_passwords(['a', 'b'], workers=1)
+        self.assertTrue(check_password('b', hashed[1]))
+
+
+class ClassCardsExportTests(TestCase):
+    """A class's progress cards as one ZIP or merged PDF, reusing the card cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.course = Course.objects.create(name='Plus One')
+        cls.asha = make_student(cls.course, 'asha')
+        maths = Subject.objects.create(name='Maths', course=cls.course)
+        Student_Result.objects.create(student=cls.asha, subject=maths, exam=None, ce_marks=40, te_marks=70)
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_zip_then_pdf_from_the_cache(self):
+        archive = zipfile.ZipFile(io.BytesIO(b''.join(pdf_jobs.stream_class_cards_zip(self.course))))
+        self.assertEqual(archive.namelist(), [f'{self.asha.id}_Asha_.pdf'])
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b'%PDF'))
+
+        # Rendered once: the merged PDF is built from the cached card
+        with mock.patch.object(pdf_jobs, 'html_to_pdf') as html_to_pdf:
+            merged = b''.join(pdf_jobs.stream_class_cards_pdf(self.course))
+        html_to_pdf.assert_not_called()
+        card = PdfReader(io.BytesIO(archive.read(archive.namelist()[0])))
+        self.assertEqual(len(PdfReader(io.BytesIO(merged)).pages), len(card.pages))
+
+    def test_failed_cards_are_listed(self):
+        with mock.patch.object(pdf_jobs, 'html_to_pdf', return_value=None):
+            archive = zipfile.ZipFile(io.BytesIO(b''.join(pdf_jobs.stream_class_cards_zip(self.course))))
+
+        self.assertEqual(archive.namelist(), ['errors.txt'])
+        self.assertIn(f'{self.asha.id}_Asha_.pdf', archive.read('errors.txt').decode())
+
+
+class IndexPlanTests(TestCase):
+    """The hot lookups are served by their composite indexes (plans as SQLite words them)"""
+
+    @classmethod
+    def setUpTestData(cls):
+        course = Course.objects.create(name='Plus One')
+        cls.student = make_student(course, 'asha')
+        cls.subject = Subject.objects.create(name='Maths', course=course)
+        cls.exam = Examination.objects.create(name='Term 1')
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on SQLite only')
+
+    def test_open_dues_of_a_student(self):
+        plan = StudentInvoice.objects.filter(student=self.student, is_paid=False).order_by('created_at', 'id').explain()
+        self.assertIn('invoice_open_dues_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_marks_of_a_subject_in_an_exam(self):
+        index_name = next(index.name for index in Student_Result._meta.indexes if index.fields == ['subject', 'exam'])
+        plan = Student_Result.objects.filter(subject=self.subject, exam=self.exam).explain()
+        self.assertIn(index_name, plan)
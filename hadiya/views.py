@@ -1,8 +1,12 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import CustomUser
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from .models import CustomUser, PdfJob
+from .pdf_jobs import requeue_job
+from .responses import json_response
 
 
 def login_page(request):
@@ -64,3 +68,50 @@ def home(request):
         return redirect_user_by_type(request.user)
     
     return render(request, 'landing.html')
+
+
+def _get_pdf_job(request, token):
+    """PdfJob by token, visible to the user who queued it and to the HOD"""
+    job = get_object_or_404(PdfJob, token=token)
+    if job.requested_by_id != request.user.id and request.user.user_type != 1:
+        raise Http404("PDF not found")
+    return job
+
+
+@login_required
+def pdf_job_wait(request, token):
+    """Progress page that polls a PDF job and opens the file when ready"""
+    job = _get_pdf_job(request, token)
+    return render(request, 'pdf_job_wait.html', {'job': job})
+
+
+@login_required
+def pdf_job_status(request, token):
+    """Status and timings of a PDF job (AJAX polling)"""
+    job = _get_pdf_job(request, token)
+    data = {
+        "job_id": str(job.token),
+        "status": job.status,
+        "filename": job.filename,
+        "error": job.error,
+        "wait_seconds": job.wait_seconds(),
+        "render_seconds": job.render_seconds,
+        "total_seconds": job.total_seconds(),
+        "download_url": reverse('pdf_job_download', args=[job.token]) if job.status == 'done' else None
+    }
+    return json_response(request, data)
+
+
+@login_required
+def pdf_job_download(request, token):
+    """Serve the finished PDF of a job"""
+    job = _get_pdf_job(request, token)
+    if job.status != 'done' or not job.file:
+        raise Http404("PDF is not ready")
+    try:
+        pdf = job.file.open('rb')
+    except FileNotFoundError:
+        # Evicted or invalidated since, render it again
+        requeue_job(job)
+        return redirect('pdf_job_wait', token=job.token)
+    return FileResponse(pdf, content_type='application/pdf', filename=job.filename)
@@ -1,7 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from hadiya.models import FeePayment, StudentInvoice, Expense, Income, FeeHead, FeeStructure, Course, Student
+from django.core.exceptions import ValidationError
+from django.db.models import ProtectedError, Sum
+from django.http import StreamingHttpResponse
+from hadiya.models import FeePayment, StudentInvoice, Expense, Income, FeeHead, FeeStructure, Course, Student, ExpenseHead, DailyCashbook
+from hadiya.attendance import period_bounds
+from hadiya.billing import generate_invoices
+from hadiya.cashbook import cash_flow, collection_summary
+from hadiya.fee_payments import collect_payment
+from hadiya.kpis import dashboard_kpis
+from hadiya.outstanding import (
+    AGEING_BUCKETS, outstanding_invoices, outstanding_page, outstanding_summary, stream_outstanding_csv,
+    stream_outstanding_xlsx,
+)
+from hadiya.responses import json_response
+from hadiya.search import search_students
+import datetime
 
 def accountant_required(view_func):
     """Decorator to ensure only Accountant can access views"""
@@ -17,6 +32,7 @@ def accountant_required(view_func):
 def accountant_dashboard(request):
     """Accountant Dashboard"""
     context = {
+        'kpis': dashboard_kpis(),
         'page_title': 'Accountant Dashboard'
     }
     return render(request, 'Accountant/home.html', context)
@@ -79,6 +95,8 @@ def delete_fee_head(request, fee_head_id):
         fee_head = FeeHead.objects.get(id=fee_head_id)
         fee_head.delete()
         messages.success(request, "Fee Head Deleted Successfully!")
+    except ProtectedError:
+        messages.error(request, "Fees have been collected under this Fee Head, it cannot be deleted")
     except Exception as e:
         messages.error(request, f"Error: {e}")
     return redirect('manage_fee_head')
@@ -107,6 +125,7 @@ def add_fee_structure(request):
         fee_head_id = request.POST.get('fee_head_id')
         amount = request.POST.get('amount')
         installments = request.POST.get('installments')
+        billing_cycle = request.POST.get('billing_cycle', 'once')
         
         try:
             course = Course.objects.get(id=course_id)
@@ -116,21 +135,28 @@ def add_fee_structure(request):
             if FeeStructure.objects.filter(course=course, fee_head=fee_head).exists():
                 messages.error(request, "Fee Structure already exists for this Course and Fee Head")
             else:
-                FeeStructure.objects.create(
+                structure = FeeStructure(
                     course=course,
                     fee_head=fee_head,
                     amount=amount,
-                    installments=installments
+                    installments=installments,
+                    billing_cycle=billing_cycle
                 )
+                # A cycle outside the choices or no installments would be billed wrongly every month
+                structure.full_clean()
+                structure.save()
                 messages.success(request, "Fee Structure Added Successfully!")
                 return redirect('manage_fee_structure')
                 
+        except ValidationError as e:
+            messages.error(request, f"Error: {' '.join(e.messages)}")
         except Exception as e:
             messages.error(request, f"Error: {e}")
             
     context = {
         'courses': courses,
         'fee_heads': fee_heads,
+        'billing_cycles': FeeStructure.BILLING_CYCLE_CHOICES,
         'page_title': 'Add Fee Structure'
     }
     return render(request, 'Accountant/add_fee_structure.html', context)
@@ -146,10 +172,15 @@ def edit_fee_structure(request, structure_id):
         try:
             structure.amount = request.POST.get('amount')
             structure.installments = request.POST.get('installments')
+            structure.billing_cycle = request.POST.get('billing_cycle', structure.billing_cycle)
             # Assuming we don't change Course/Head in edit, only amounts
+            structure.full_clean()
             structure.save()
             messages.success(request, "Fee Structure Updated Successfully!")
             return redirect('manage_fee_structure')
+        except ValidationError as e:
+            structure.refresh_from_db()
+            messages.error(request, f"Error: {' '.join(e.messages)}")
         except Exception as e:
             messages.error(request, f"Error: {e}")
             
@@ -157,6 +188,7 @@ def edit_fee_structure(request, structure_id):
         'structure': structure,
         'courses': courses,
         'fee_heads': fee_heads,
+        'billing_cycles': FeeStructure.BILLING_CYCLE_CHOICES,
         'page_title': 'Edit Fee Structure'
     }
     return render(request, 'Accountant/edit_fee_structure.html', context)
@@ -182,41 +214,16 @@ def generate_invoice(request):
     if request.method == 'POST':
         course_id = request.POST.get('course_id')
         try:
-            course = Course.objects.get(id=course_id)
-            students = Student.objects.filter(course_id=course)
-            fee_structures = FeeStructure.objects.filter(course=course)
-            
-            count = 0
-            for student in students:
-                for fee in fee_structures:
-                    # Logic for conditional fees
-                    head_name = fee.fee_head.name.lower()
-                    amount_to_charge = fee.amount
-                    
-                    if 'hostel' in head_name:
-                        if not student.uses_hostel:
-                            continue
-                            
-                    if 'transport' in head_name or 'bus' in head_name:
-                        if not student.uses_transport:
-                            continue
-                        # Use Bus Stop fee if higher/different? 
-                        # User requirement: "bus stop... monthly fee". 
-                        # We override fee structure amount with bus stop fee if available.
-                        if student.bus_stop and student.bus_stop.monthly_fee > 0:
-                            amount_to_charge = student.bus_stop.monthly_fee
-                    
-                    # Create Invoice if not exists (One-time check for simplicity in this MVP)
-                    # For a real system, we'd need 'Term' or 'Month' tracking.
-                    if not StudentInvoice.objects.filter(student=student, fee_head=fee.fee_head).exists():
-                         StudentInvoice.objects.create(
-                             student=student,
-                             fee_head=fee.fee_head,
-                             amount=amount_to_charge
-                         )
-                         count += 1
+            if course_id == 'all':
+                created = generate_invoices()
+                label = "all courses"
+            else:
+                course = Course.objects.get(id=course_id)
+                created = generate_invoices([course])
+                label = course.name
             
-            messages.success(request, f"Generated {count} Invoices for {course.name}")
+            count = sum(created.values())
+            messages.success(request, f"Generated {count} Invoices for {label}")
         except Exception as e:
             messages.error(request, f"Error: {e}")
             
@@ -230,10 +237,13 @@ def generate_invoice(request):
 def print_invoice(request, payment_id):
     """Print Payment Receipt"""
     payment = get_object_or_404(FeePayment, id=payment_id)
-    allocations = payment.allocations.all()
+    allocations = payment.allocations.select_related('invoice__fee_head')
+    # Allocations beyond the amount paid were settled from the advance balance
+    advance_used = sum(alloc.amount for alloc in allocations) - payment.amount
     return render(request, 'Accountant/print_invoice.html', {
         'payment': payment,
-        'allocations': allocations
+        'allocations': allocations,
+        'advance_used': advance_used if advance_used > 0 else 0
     })
     
 
@@ -324,10 +334,6 @@ def add_income(request):
 @accountant_required
 def fee_collection(request):
     """Search Student and Pay Fees (Advanced)"""
-    from hadiya.models import InvoiceAllocation
-    import datetime
-    
-    students = Student.objects.all()
     invoices = None
     student_obj = None
     
@@ -335,63 +341,26 @@ def fee_collection(request):
     student_id = request.POST.get('student_id') or request.GET.get('student_id')
     if student_id:
         try:
-            student_obj = Student.objects.get(admin__id=student_id)
-            invoices = StudentInvoice.objects.filter(student=student_obj).order_by('created_at') # Oldest first for auto-allocation
+            student_obj = Student.objects.select_related('admin', 'course_id').get(admin__id=student_id)
+            invoices = StudentInvoice.objects.filter(student=student_obj).select_related('fee_head').order_by('created_at') # Oldest first for auto-allocation
         except Student.DoesNotExist:
             messages.error(request, "Student Not Found")
             
     if request.method == 'POST' and 'pay_fee' in request.POST:
         try:
-            amount_paid = float(request.POST.get('amount_paid'))
             payment_mode = request.POST.get('payment_mode', 'Cash')
             remark = request.POST.get('remark', '')
             
-            # 1. Create Transaction
-            payment = FeePayment.objects.create(
-                student=student_obj,
-                amount=amount_paid,
-                payment_mode=payment_mode,
-                remark=remark
+            # Oldest dues first, advance balance spent before the new payment
+            payment, allocations, advance_used = collect_payment(
+                student_obj.id, request.POST.get('amount_paid'), payment_mode, remark
             )
             
-            # 2. Allocation Logic (Auto - Oldest Dues First)
-            # Future: Add Manual Allocation Mode handling here
-            
-            remaining_payment = amount_paid
-            
-            # Fetch unpaid invoices
-            unpaid_invoices = StudentInvoice.objects.filter(student=student_obj, is_paid=False).order_by('created_at')
-            
-            for invoice in unpaid_invoices:
-                if remaining_payment <= 0:
-                    break
-                    
-                due_amount = float(invoice.amount) - float(invoice.paid_amount)
-                
-                # Determine how much to pay for this invoice
-                allocation_amount = min(remaining_payment, due_amount)
-                
-                # Update Invoice
-                invoice.paid_amount = float(invoice.paid_amount) + allocation_amount
-                if invoice.paid_amount >= float(invoice.amount):
-                    invoice.is_paid = True
-                    invoice.payment_date = datetime.date.today()
-                invoice.save()
-                
-                # Create Allocation Record
-                InvoiceAllocation.objects.create(
-                    payment=payment,
-                    invoice=invoice,
-                    amount=allocation_amount
-                )
-                
-                remaining_payment -= allocation_amount
-            
-                # 3. Handle Surplus -> Advance Balance
-            if remaining_payment > 0:
-                student_obj.advance_balance = float(student_obj.advance_balance) + remaining_payment
-                student_obj.save()
-                messages.success(request, f"Payment Successful! {remaining_payment} added to Advance Balance.")
+            if advance_used > 0:
+                messages.info(request, f"{advance_used} paid from Advance Balance.")
+            advance_added = payment.amount + advance_used - sum(a.amount for a in allocations)
+            if advance_added > 0:
+                messages.success(request, f"Payment Successful! {advance_added} added to Advance Balance.")
             else:
                 messages.success(request, "Payment Successful!")
                 
@@ -402,7 +371,6 @@ def fee_collection(request):
             messages.error(request, f"Error: {e}")
 
     context = {
-        'students': students,
         'invoices': invoices,
         'selected_student': student_obj,
         'page_title': 'Collect Fees'
@@ -410,45 +378,74 @@ def fee_collection(request):
     return render(request, 'Accountant/fee_collection.html', context)
 
 
+@accountant_required
+def student_search(request):
+    """Student autocomplete: ?q= name, email, phone or admission no, &page="""
+    try:
+        students, has_more = search_students(request.GET.get('q', ''), request.GET.get('page', 1))
+    except ValueError:
+        students, has_more = [], False
+    data = {'results': students, 'has_more': has_more}
+    return json_response(request, data)
+
+
 # --- Reports ---
 
 @accountant_required
 def daily_collection_report(request):
-    """Daily Fee Collection Report"""
-    import datetime
-    date_str = request.GET.get('date', datetime.date.today().strftime('%Y-%m-%d'))
-    
+    """Fee Collection Report for a day, a month or a date range"""
+    period = request.GET.get('period', 'day')
+    today = datetime.date.today()
+    date_str = request.GET.get('date', today.strftime('%Y-%m-%d'))
+    month_str = request.GET.get('month', today.strftime('%Y-%m'))
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+
+    payments = []
+    summary = None
     try:
-        selected_date = datetime.datetime.strptime(date_str, '%Y-%m-%d').date()
-        payments = FeePayment.objects.filter(payment_date=selected_date)
-        total_collection = sum(p.amount for p in payments)
+        if period == 'month':
+            year, month = month_str.split('-')
+            start, end = period_bounds('month', month=month, year=year)
+        elif period == 'range':
+            start, end = period_bounds('range', start_date, end_date)
+        else:
+            period = 'day'
+            start, end = period_bounds('day', date_str)
+            # Individual transactions are listed for a single day only
+            payments = FeePayment.objects.filter(payment_date=start).select_related(
+                'student__admin', 'invoice__fee_head'
+            ).order_by('id')
+        summary = collection_summary(start, end)
     except ValueError:
-        payments = []
-        total_collection = 0
         messages.error(request, "Invalid Date Format")
-        
+
     context = {
+        'period': period,
         'payments': payments,
+        'summary': summary,
         'selected_date': date_str,
-        'total_collection': total_collection,
-        'page_title': 'Daily Collection Report'
+        'selected_month': month_str,
+        'start_date': start_date,
+        'end_date': end_date,
+        'total_collection': summary['total'] if summary else 0,
+        'page_title': 'Collection Report'
     }
     return render(request, 'Accountant/daily_collection_report.html', context)
 
 @accountant_required
 def expense_reports(request):
     """Expense Reports"""
-    import datetime
-    from django.db.models import Sum
-    
     start_date = request.GET.get('start_date')
     end_date = request.GET.get('end_date')
     expenses = []
     total_expense = 0
     
     if start_date and end_date:
-        expenses = Expense.objects.filter(date__range=[start_date, end_date])
-        total_expense = expenses.aggregate(Sum('amount'))['amount__sum'] or 0
+        expenses = Expense.objects.filter(date__range=[start_date, end_date]).select_related('head', 'added_by')
+        total_expense = DailyCashbook.objects.filter(date__range=[start_date, end_date]).aggregate(
+            total=Sum('expenses')
+        )['total'] or 0
         
     context = {
         'expenses': expenses,
@@ -459,23 +456,95 @@ def expense_reports(request):
     }
     return render(request, 'Accountant/expense_reports.html', context)
 
+@accountant_required
+def cash_flow_report(request):
+    """Cash Flow: fees, other income and expenses per day or month with running balance"""
+    today = datetime.date.today()
+    start_date = request.GET.get('start_date', today.replace(day=1).strftime('%Y-%m-%d'))
+    end_date = request.GET.get('end_date', today.strftime('%Y-%m-%d'))
+    group_by = request.GET.get('group_by', 'day')
+
+    opening_balance, rows = 0, []
+    totals = {'fee_collection': 0, 'other_income': 0, 'expenses': 0, 'net': 0}
+    closing_balance = 0
+    try:
+        start, end = period_bounds('range', start_date, end_date)
+        opening_balance, rows = cash_flow(start, end, by_month=(group_by == 'month'))
+        for key in totals:
+            totals[key] = sum(row[key] for row in rows)
+        closing_balance = rows[-1]['balance'] if rows else opening_balance
+    except ValueError:
+        messages.error(request, "Invalid Date Format")
+
+    context = {
+        'rows': rows,
+        'totals': totals,
+        'opening_balance': opening_balance,
+        'closing_balance': closing_balance,
+        'start_date': start_date,
+        'end_date': end_date,
+        'group_by': group_by,
+        'page_title': 'Cash Flow Report'
+    }
+    return render(request, 'Accountant/cash_flow_report.html', context)
+
 @accountant_required
 def outstanding_fees_report(request):
-    """Outstanding Fees Report"""
-    from django.db.models import F, Sum
-    
-    # Filter invoices where paid_amount < amount
-    # We can also filter by Course if needed (add filter form)
-    
-    pending_invoices = StudentInvoice.objects.filter(is_paid=False).annotate(
-        balance=F('amount') - F('paid_amount')
-    ).select_related('student', 'fee_head')
-    
-    total_outstanding = sum(inv.balance for inv in pending_invoices)
-    
+    """Outstanding Fees Report: totals by course, fee head and ageing, detail paged by invoice"""
+    course_id = request.GET.get('course_id', '')
+    fee_head_id = request.GET.get('fee_head_id', '')
+    bucket = request.GET.get('bucket', '')
+    if not course_id.isdigit():
+        course_id = ''
+    if not fee_head_id.isdigit():
+        fee_head_id = ''
+    try:
+        after = int(request.GET.get('after') or 0)
+    except ValueError:
+        after = 0
+
+    invoices = outstanding_invoices(course_id=course_id, fee_head_id=fee_head_id, bucket=bucket)
+    summary = outstanding_summary(invoices)
+    pending_invoices, next_after = outstanding_page(invoices, after=after)
+
+    filters = request.GET.copy()
+    filters.pop('after', None)
     context = {
         'pending_invoices': pending_invoices,
-        'total_outstanding': total_outstanding,
+        'summary': summary,
+        'total_outstanding': summary['total'],
+        'next_after': next_after,
+        'after': after,
+        'filter_query': filters.urlencode(),
+        'courses': Course.objects.all(),
+        'fee_heads': FeeHead.objects.all(),
+        'buckets': AGEING_BUCKETS,
+        'selected_course': course_id,
+        'selected_fee_head': fee_head_id,
+        'selected_bucket': bucket,
         'page_title': 'Outstanding Fees Report'
     }
     return render(request, 'Accountant/outstanding_fees_report.html', context)
+
+@accountant_required
+def export_outstanding_fees(request):
+    """Stream the full outstanding fees list (with the report's filters) as CSV or XLSX"""
+    course_id = request.GET.get('course_id', '')
+    fee_head_id = request.GET.get('fee_head_id', '')
+    invoices = outstanding_invoices(
+        course_id=course_id if course_id.isdigit() else None,
+        fee_head_id=fee_head_id if fee_head_id.isdigit() else None,
+        bucket=request.GET.get('bucket')
+    )
+    filename = f"Outstanding Fees {datetime.date.today():%Y-%m-%d}"
+    if request.GET.get('format') == 'xlsx':
+        response = StreamingHttpResponse(
+            stream_outstanding_xlsx(invoices),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+        filename += ".xlsx"
+    else:
+        response = StreamingHttpResponse(stream_outstanding_csv(invoices), content_type='text/csv')
+        filename += ".csv"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
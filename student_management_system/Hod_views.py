@@ -9,19 +9,28 @@ from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 from django.views.decorators.csrf import csrf_exempt
-from django.http import JsonResponse, HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import json
 import openpyxl
-from io import BytesIO
-from django.template.loader import get_template
-from xhtml2pdf import pisa
 
 from hadiya.models import (
     CustomUser, Staff, Course, Subject, Student, Attendance, Attendance_Report,
     Student_Result, Student_leave, Student_Feedback, Staff_Feedback,
     Student_Notification, Staff_Notification, SubjectType, Examination,
-    Staff_leave, Enquiry, News
+    Staff_leave, Enquiry, News, ImportJob
 )
+from hadiya.access import denial_counts, route_roles
+from hadiya.attendance import (
+    attendance_dates, attendance_sheet_rows, course_student_rows, get_attendance_report, get_attendance_analysis,
+    save_attendance_sheet, update_attendance_sheet,
+)
+from hadiya.bulk_import import error_report
+from hadiya.dashboard_stats import cache_counters, dashboard_stats
+from hadiya.import_jobs import enqueue_import
+from hadiya.responses import json_response
+from hadiya.results import get_student_results, get_subject_results, save_marks_sheet
+from hadiya.result_analytics import GRADE_LABELS, analyze_subjects, exam_summary
+from hadiya.pdf_jobs import enqueue_pdf, stream_class_cards_pdf, stream_class_cards_zip
 
 
 def hod_required(view_func):
@@ -40,42 +49,24 @@ def dashboard(request):
     """
     HOD Dashboard with statistics and overview
     """
-    # Get counts
-    students_count = Student.objects.count()
-    staff_count = Staff.objects.count()
-    courses_count = Course.objects.count()
-    subjects_count = Subject.objects.count()
-    
-    # Get recent data
-    recent_students = Student.objects.select_related('admin', 'course_id').order_by('-created_at')[:5]
-    recent_enquiries = Enquiry.objects.select_related('course').order_by('-created_at')[:5]
-    recent_news = News.objects.order_by('-created_at')[:3]
-    
-    # Get pending leave requests
-    pending_student_leaves = Student_leave.objects.filter(status=0).count()
-    pending_staff_leaves = Staff_leave.objects.filter(status=0).count()
-    
-    # Get unread feedbacks
-    unread_student_feedbacks = Student_Feedback.objects.filter(feedback_reply__isnull=True).count()
-    unread_staff_feedbacks = Staff_Feedback.objects.filter(feedback_reply__isnull=True).count()
-    
-    context = {
-        'students_count': students_count,
-        'staff_count': staff_count,
-        'courses_count': courses_count,
-        'subjects_count': subjects_count,
-        'recent_students': recent_students,
-        'recent_enquiries': recent_enquiries,
-        'recent_news': recent_news,
-        'pending_student_leaves': pending_student_leaves,
-        'pending_staff_leaves': pending_staff_leaves,
-        'unread_student_feedbacks': unread_student_feedbacks,
-        'unread_staff_feedbacks': unread_staff_feedbacks,
-    }
+    # Counts and recent lists, cached until one of their models changes
+    context = dict(dashboard_stats())
     
     return render(request, 'Hod/home_new.html', context)
 
 
+@hod_required
+def dashboard_cache_stats(request):
+    """Hits and misses of the cached dashboard statistics"""
+    return json_response(request, cache_counters())
+
+
+@hod_required
+def access_denials(request):
+    """Requests refused by the role policy, per route"""
+    return json_response(request, denial_counts(route_roles()))
+
+
 @hod_required
 def add_student(request):
     """Add new student"""
@@ -92,89 +83,8 @@ def add_student(request):
                 return redirect('add_student')
             
             try:
-                wb = openpyxl.load_workbook(excel_file)
-                worksheet = wb.active
-                
-                success_count = 0
-                error_count = 0
-                errors = []
-                
-                # Iterate rows skipping header
-                for i, row in enumerate(worksheet.iter_rows(min_row=2, values_only=True)):
-                    try:
-                        # Expected columns: First Name, Last Name, Username, Email, Password, Gender, Address, Course Name, Session Start, Session End, Admission Type
-                        first_name = row[0]
-                        last_name = row[1]
-                        username = row[2]
-                        email = row[3]
-                        password = str(row[4]) if row[4] else '123456'
-                        gender = row[5]
-                        address = row[6]
-                        course_name = row[7]
-                        session_start = str(row[8])
-                        session_end = str(row[9])
-                        admission_type = row[10]
-                        
-                        # Validate mandatory fields
-                        if not all([first_name, username, email, course_name]):
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Missing required fields")
-                            continue
-                            
-                        # Check existance
-                        if CustomUser.objects.filter(email=email).exists():
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Email {email} already exists")
-                            continue
-                        if CustomUser.objects.filter(username=username).exists():
-                             error_count += 1
-                             errors.append(f"Row {i+2}: Username {username} already exists")
-                             continue
-                             
-                        # Get FKs
-                        try:
-                            course = Course.objects.get(name__iexact=course_name)
-                        except Course.DoesNotExist:
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Course '{course_name}' not found")
-                            continue
-                            
-
-                        
-                        # Create User
-                        user = CustomUser.objects.create_user(
-                            username=username,
-                            email=email,
-                            password=password,
-                            first_name=first_name,
-                            last_name=last_name,
-                            user_type=3
-                        )
-                        user.save()
-                        
-                        # Create Student
-                        Student.objects.create(
-                            admin=user,
-                            address=address if address else '',
-                            gender=gender if gender else 'Male',
-                            course_id=course,
-                            # session_year_id=session,
-                            admission_type=admission_type if admission_type else 'Day Scholar',
-                            uses_hostel=(admission_type == 'Hostel')
-                        )
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Row {i+2}: {str(e)}")
-                
-                if success_count > 0:
-                    messages.success(request, f'{success_count} Students uploaded successfully!')
-                
-                if error_count > 0:
-                    messages.warning(request, f'{error_count} rows failed. Check errors below.')
-                    for err in errors[:5]: # Show first 5 errors
-                        messages.error(request, err)
+                job = enqueue_import('student', excel_file, user=request.user)
+                return redirect('import_job_detail', token=job.token)
                         
             except Exception as e:
                 messages.error(request, f'Error processing file: {str(e)}')
@@ -235,10 +145,48 @@ def add_student(request):
     context = {
         'courses': courses,
         'courses': courses,
+        'import_jobs': ImportJob.objects.filter(kind='student').order_by('-created_at')[:5],
     }
     return render(request, 'Hod/add_student.html', context)
 
 
+@hod_required
+def import_job_detail(request, token):
+    """Progress page of a background Excel upload"""
+    job = get_object_or_404(ImportJob, token=token)
+    context = {
+        'job': job,
+        'back_url': f'add_{job.kind}',
+    }
+    return render(request, 'Hod/import_job.html', context)
+
+
+@hod_required
+def import_job_status(request, token):
+    """Rows done, failed and remaining of a background upload, polled by its progress page"""
+    job = get_object_or_404(ImportJob, token=token)
+    data = {
+        "status": job.status,
+        "total_rows": job.total_rows,
+        "created_rows": job.created_rows,
+        "failed_rows": job.failed_rows,
+        "remaining_rows": job.remaining_rows(),
+        "error": job.error,
+        "errors": [{"row": err["row"], "message": err["message"]} for err in job.errors[:5]],
+    }
+    return json_response(request, data)
+
+
+@hod_required
+def download_import_errors(request, token):
+    """Download every row a background upload rejected, with the reason, as Excel"""
+    job = get_object_or_404(ImportJob, token=token)
+    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    response['Content-Disposition'] = f'attachment; filename={job.kind}_upload_errors.xlsx'
+    error_report(job.kind, job.errors).save(response)
+    return response
+
+
 @hod_required
 def view_students(request):
     """View all students"""
@@ -350,71 +298,8 @@ def add_staff(request):
                 return redirect('add_staff')
                 
             try:
-                wb = openpyxl.load_workbook(excel_file)
-                worksheet = wb.active
-                
-                success_count = 0
-                error_count = 0
-                errors = []
-                
-                # Iterate rows skipping header
-                for i, row in enumerate(worksheet.iter_rows(min_row=2, values_only=True)):
-                    try:
-                        # Expected columns: First Name, Last Name, Username, Email, Password, Gender, Address
-                        first_name = row[0]
-                        last_name = row[1]
-                        username = row[2]
-                        email = row[3]
-                        password = str(row[4]) if row[4] else '123456'
-                        gender = row[5]
-                        address = row[6]
-                        
-                        # Validate mandatory fields
-                        if not all([first_name, username, email]):
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Missing required fields")
-                            continue
-                            
-                        # Check existance
-                        if CustomUser.objects.filter(email=email).exists():
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Email {email} already exists")
-                            continue
-                        if CustomUser.objects.filter(username=username).exists():
-                             error_count += 1
-                             errors.append(f"Row {i+2}: Username {username} already exists")
-                             continue
-                        
-                        # Create User
-                        user = CustomUser.objects.create_user(
-                            username=username,
-                            email=email,
-                            password=password,
-                            first_name=first_name,
-                            last_name=last_name,
-                            user_type=2 # Staff
-                        )
-                        user.save()
-                        
-                        # Staff profile created by signal, just update it
-                        staff = user.staff
-                        staff.address = address if address else ''
-                        staff.gender = gender if gender else 'Male'
-                        staff.save()
-                        
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Row {i+2}: {str(e)}")
-                
-                if success_count > 0:
-                    messages.success(request, f'{success_count} Staff members uploaded successfully!')
-                
-                if error_count > 0:
-                    messages.warning(request, f'{error_count} rows failed. Check errors below.')
-                    for err in errors[:5]:
-                        messages.error(request, err)
+                job = enqueue_import('staff', excel_file, user=request.user)
+                return redirect('import_job_detail', token=job.token)
                         
             except Exception as e:
                 messages.error(request, f'Error processing file: {str(e)}')
@@ -467,7 +352,10 @@ def add_staff(request):
             except Exception as e:
                 messages.error(request, f'Error adding staff: {str(e)}')
     
-    return render(request, 'Hod/add_staff.html')
+    context = {
+        'import_jobs': ImportJob.objects.filter(kind='staff').order_by('-created_at')[:5],
+    }
+    return render(request, 'Hod/add_staff.html', context)
 
 
 @hod_required
@@ -612,67 +500,8 @@ def add_subject(request):
                 return redirect('add_subject')
                 
             try:
-                wb = openpyxl.load_workbook(excel_file)
-                worksheet = wb.active
-                
-                success_count = 0
-                error_count = 0
-                errors = []
-                
-                # Iterate rows skipping header
-                for i, row in enumerate(worksheet.iter_rows(min_row=2, values_only=True)):
-                    try:
-                        # Expected columns: Subject Name, Course Name, Staff Email (Optional)
-                        subject_name = row[0]
-                        course_name = row[1]
-                        staff_email = row[2] if len(row) > 2 else None
-                        
-                        if not subject_name or not course_name:
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Missing Name or Course")
-                            continue
-                            
-                        # Get Course
-                        try:
-                            course = Course.objects.get(name__iexact=course_name)
-                        except Course.DoesNotExist:
-                            error_count += 1
-                            errors.append(f"Row {i+2}: Course '{course_name}' not found")
-                            continue
-                            
-                        # Get Staff (Optional)
-                        staff = None
-                        if staff_email:
-                            try:
-                                staff = Staff.objects.get(admin__email__iexact=staff_email)
-                            except Staff.DoesNotExist:
-                                # We can choose to fail or just ignore the staff assignment
-                                # Let's warn but proceed with None, or fail? 
-                                # User requirement doesn't specify data strictness. 
-                                # Best to error if provided but invalid to avoid data issues.
-                                error_count += 1
-                                errors.append(f"Row {i+2}: Staff email '{staff_email}' not found")
-                                continue
-                        
-                        # Create Subject
-                        Subject.objects.create(
-                            name=subject_name,
-                            course=course,
-                            staff=staff
-                        )
-                        success_count += 1
-                        
-                    except Exception as e:
-                        error_count += 1
-                        errors.append(f"Row {i+2}: {str(e)}")
-                
-                if success_count > 0:
-                    messages.success(request, f'{success_count} Subjects uploaded successfully!')
-                
-                if error_count > 0:
-                    messages.warning(request, f'{error_count} rows failed. Check errors below.')
-                    for err in errors[:5]:
-                        messages.error(request, err)
+                job = enqueue_import('subject', excel_file, user=request.user)
+                return redirect('import_job_detail', token=job.token)
                         
             except Exception as e:
                 messages.error(request, f'Error processing file: {str(e)}')
@@ -709,7 +538,8 @@ def add_subject(request):
     context = {
         'courses': courses,
         'staffs': staffs,
-        'subject_types': subject_types
+        'subject_types': subject_types,
+        'import_jobs': ImportJob.objects.filter(kind='subject').order_by('-created_at')[:5],
     }
     return render(request, 'Hod/add_subject.html', context)
 
@@ -805,17 +635,7 @@ def admin_get_attendance_dates(request):
     try:
         course = Course.objects.get(id=course_id)
         
-        attendance_objects = Attendance.objects.filter(course=course)
-        
-        list_data = []
-        for attendance in attendance_objects:
-            data_small = {
-                "id": attendance.id,
-                "attendance_date": str(attendance.attendance_date),
-            }
-            list_data.append(data_small)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, attendance_dates(course))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -831,19 +651,7 @@ def admin_get_attendance_student(request):
     
     try:
         attendance = Attendance.objects.get(id=attendance_id)
-        attendance_data = Attendance_Report.objects.filter(attendance=attendance)
-        
-        list_data = []
-        for student_data in attendance_data:
-            data_small = {
-                "id": student_data.student.admin.id,
-                "name": student_data.student.admin.first_name + " " + student_data.student.admin.last_name,
-                "status": 1 if student_data.is_present else 0,
-                "leave_status": student_data.leave_status if student_data.leave_status else ''
-            }
-            list_data.append(data_small)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, attendance_sheet_rows(attendance))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -901,79 +709,9 @@ def admin_get_attendance_report_data(request):
         else:
             courses = Course.objects.all()
             
-        final_data = [] # List of { course_name: "", data: [] }
-        
-        for course in courses:
-            # Base query for Attendance
-            attendance_query = Attendance.objects.filter(course=course)
-            
-            if filter_type == "day":
-                attendance_query = attendance_query.filter(attendance_date=start_date)
-            elif filter_type == "weekly":
-                date_obj = datetime.datetime.strptime(start_date, "%Y-%m-%d").date()
-                week_start = date_obj - datetime.timedelta(days=date_obj.weekday()) 
-                week_end = week_start + datetime.timedelta(days=6)
-                attendance_query = attendance_query.filter(attendance_date__range=[week_start, week_end])
-            elif filter_type == "month":
-                attendance_query = attendance_query.filter(attendance_date__month=month, attendance_date__year=year)
-            elif filter_type == "year":
-                attendance_query = attendance_query.filter(attendance_date__year=year)
-            elif filter_type == "range":
-                attendance_query = attendance_query.filter(attendance_date__range=[start_date, end_date])
-            elif filter_type == "till_today":
-                today = datetime.date.today()
-                attendance_query = attendance_query.filter(attendance_date__lte=today)
-                
-            # LOGIC TO HANDLE DUPLICATES
-            all_attendance = attendance_query.values('id', 'attendance_date', 'updated_at')
-            
-            latest_attendance_map = {}
-            for att in all_attendance:
-                d = str(att['attendance_date']) 
-                if d not in latest_attendance_map:
-                    latest_attendance_map[d] = att
-                else:
-                    if att['updated_at'] > latest_attendance_map[d]['updated_at']:
-                        latest_attendance_map[d] = att
-                        
-            valid_attendance_ids = [item['id'] for item in latest_attendance_map.values()]
-            total_days = len(valid_attendance_ids)
-            
-            students = Student.objects.filter(course_id=course)
-            
-            course_student_data = []
-            if students.exists():
-                for student in students:
-                    present_count = Attendance_Report.objects.filter(
-                        student=student, 
-                        attendance__id__in=valid_attendance_ids, 
-                        is_present=True
-                    ).count()
-                    
-                    absent_count = Attendance_Report.objects.filter(
-                        student=student, 
-                        attendance__id__in=valid_attendance_ids, 
-                        is_present=False
-                    ).count()
-                    
-                    percentage = (present_count / total_days * 100) if total_days > 0 else 0
-                    
-                    data = {
-                        "name": f"{student.admin.first_name} {student.admin.last_name}",
-                        "total_days": total_days,
-                        "present": present_count,
-                        "absent": absent_count,
-                        "percentage": round(percentage, 2)
-                    }
-                    course_student_data.append(data)
+        final_data = get_attendance_report(courses, filter_type, start_date, end_date, month, year)
             
-            # Append even if empty to show the header? Or strict checking. Let's append if course exists.
-            final_data.append({
-                "course_name": course.name,
-                "data": course_student_data
-            })
-            
-        return JsonResponse(json.dumps(final_data), content_type="application/json", safe=False)
+        return json_response(request, final_data)
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -997,43 +735,24 @@ def admin_get_student_attendance_data(request):
         if start_date and end_date:
             reports = reports.filter(attendance__attendance_date__range=[start_date, end_date])
             
-        # Select related for performance access
-        reports = reports.select_related('attendance').order_by('-attendance__attendance_date')
+        # One Attendance per course and date. A student who changed course can
+        # still have two reports for a day; the latest one comes first.
+        reports = reports.order_by('-attendance__attendance_date', '-attendance__updated_at').values_list(
+            'attendance__attendance_date', 'is_present', 'leave_status'
+        )
         
-        # LOGIC TO HANDLE DUPLICATES: Show only the latest record for each date
-        processed_dates = set()
         list_data = []
-        
-        # Since we ordered by date desc, we might still have duplicates with same date.
-        # We need to sort by date desc AND updated_at desc to ensure first encountered is latest.
-        # But Django can't sort by related updated_at easily without annotation if not in model ordering.
-        # Let's fetch and process in python.
-        
-        all_reports = []
-        for r in reports:
-            all_reports.append({
-                'date': str(r.attendance.attendance_date),
-                'updated_at': r.attendance.updated_at, 
-                'obj': r
-            })
-            
-        # Sort by date desc, then updated_at desc
-        all_reports.sort(key=lambda x: (x['date'], x['updated_at']), reverse=True)
-        
-        for item in all_reports:
-            date_str = item['date']
-            if date_str not in processed_dates:
-                processed_dates.add(date_str)
-                report = item['obj']
-                
-                data = {
-                    "date": date_str,
-                    "status": "Present" if report.is_present else "Absent",
-                    "leave_status": report.leave_status if report.leave_status else "-"
-                }
-                list_data.append(data)
+        for attendance_date, is_present, leave_status in reports:
+            if list_data and list_data[-1]["date"] == str(attendance_date):
+                continue
+            data = {
+                "date": str(attendance_date),
+                "status": "Present" if is_present else "Absent",
+                "leave_status": leave_status if leave_status else "-"
+            }
+            list_data.append(data)
             
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, list_data)
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1057,78 +776,13 @@ def admin_analyze_attendance(request):
         else:
             courses = Course.objects.all()
             
-        final_data = []
-        
-        for course in courses:
-            students = Student.objects.filter(course_id=course)
-            
-            # Base Attendance Query
-            attendance_query = Attendance.objects.filter(course=course)
-            if start_date and end_date:
-                attendance_query = attendance_query.filter(attendance_date__range=[start_date, end_date])
-                
-            # Deduplication Logic (Same as Report Data)
-            all_attendance = attendance_query.values('id', 'attendance_date', 'updated_at')
-            latest_attendance_map = {}
-            for att in all_attendance:
-                d = str(att['attendance_date'])
-                if d not in latest_attendance_map:
-                    latest_attendance_map[d] = att
-                else:
-                    if att['updated_at'] > latest_attendance_map[d]['updated_at']:
-                        latest_attendance_map[d] = att
-            
-            valid_attendance_ids = [item['id'] for item in latest_attendance_map.values()]
-            total_days = len(valid_attendance_ids)
-            
-            course_list_data = []
-            if total_days > 0 and students.exists():
-                for student in students:
-                    present_count = Attendance_Report.objects.filter(
-                        student=student, 
-                        attendance__id__in=valid_attendance_ids, 
-                        is_present=True
-                    ).count()
-                    
-                    percentage = (present_count / total_days * 100)
-                    percentage = round(percentage, 2)
-                    
-                    # Filtering based on Criteria
-                    include_record = False
-                    status = ""
-                    
-                    if analysis_type == 'below':
-                        if percentage < threshold:
-                            include_record = True
-                            status = "Correction Required"
-                    elif analysis_type == 'above':
-                        if percentage >= threshold:
-                            include_record = True
-                            status = "Eligible for Award"
-                    
-                    if include_record:
-                        data = {
-                            "name": f"{student.admin.first_name} {student.admin.last_name}",
-                            "total_days": total_days,
-                            "present": present_count,
-                            "percentage": percentage,
-                            "status": status
-                        }
-                        course_list_data.append(data)
-                        
-                # Sorting
-                if analysis_type == 'below':
-                    course_list_data.sort(key=lambda x: x['percentage'])
-                else:
-                    course_list_data.sort(key=lambda x: x['percentage'], reverse=True)
-            
-            # Append if data exists or even if empty if desired (keeping empty for now to match structure)
-            final_data.append({
-                "course_name": course.name,
-                "data": course_list_data
-            })
+        final_data = get_attendance_analysis(
+            courses, analysis_type, threshold,
+            {'below': "Correction Required", 'above': "Eligible for Award"},
+            start_date, end_date
+        )
             
-        return JsonResponse(json.dumps(final_data), content_type="application/json", safe=False)
+        return json_response(request, final_data)
         
     except Exception as e:
         return HttpResponse(str(e))
@@ -1154,13 +808,7 @@ def admin_get_subjects(request):
     course_id = request.POST.get("course_id")
     try:
         course = Course.objects.get(id=course_id)
-        subjects = Subject.objects.filter(course=course)
-        list_data = []
-        for subject in subjects:
-            data = {"id": subject.id, "name": subject.name}
-            list_data.append(data)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, Subject.objects.filter(course=course).values('id', 'name'))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1178,7 +826,6 @@ def admin_get_students_for_result(request):
     try:
         course = Course.objects.get(id=course_id)
         subject = Subject.objects.get(id=subject_id)
-        students = Student.objects.filter(course_id=course)
         
         if exam_id:
             exam = Examination.objects.get(id=exam_id)
@@ -1186,25 +833,16 @@ def admin_get_students_for_result(request):
             exam = None
 
         list_data = []
-        for student in students:
-            # Check if result already exists
-            try:
-                result = Student_Result.objects.get(student=student, subject=subject, exam=exam)
-                ce_marks = result.ce_marks
-                te_marks = result.te_marks
-            except Student_Result.DoesNotExist:
-                ce_marks = 0
-                te_marks = 0
-            
+        for student, marks in get_subject_results(course, subject, exam):
             data = {
                 "id": student.admin.id, # Use User ID for identification
                 "name": f"{student.admin.first_name} {student.admin.last_name}",
-                "ce_marks": ce_marks,
-                "te_marks": te_marks
+                "ce_marks": marks["ce_marks"],
+                "te_marks": marks["te_marks"]
             }
             list_data.append(data)
             
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, list_data)
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1266,25 +904,14 @@ def admin_save_student_result(request):
         else:
              exam = None
         
-        for i in range(len(student_ids)):
-            student_admin_id = student_ids[i]
-            ce_marks = float(ce_marks_list[i])
-            te_marks = float(te_marks_list[i])
-            
-            student = Student.objects.get(admin__id=student_admin_id)
-            
-            # Create or Update
-            result, created = Student_Result.objects.update_or_create(
-                student=student,
-                subject=subject,
-                exam=exam,
-                defaults={
-                    'ce_marks': ce_marks,
-                    'te_marks': te_marks
-                }
-            )
-            
-        return HttpResponse("True")
+        # Validate the whole sheet, then save every row in one transaction
+        saved, errors = save_marks_sheet(subject, exam, student_ids, ce_marks_list, te_marks_list)
+        data = {
+            "status": "False" if errors else "True",
+            "saved": saved,
+            "errors": errors
+        }
+        return json_response(request, data)
     except Exception as e:
         return HttpResponse("False")
 
@@ -1310,17 +937,7 @@ def admin_get_students(request):
     course_id = request.POST.get("course_id")
     try:
         course = Course.objects.get(id=course_id)
-        students = Student.objects.filter(course_id=course)
-        
-        list_data = []
-        for student in students:
-            data = {
-                "id": student.admin.id, 
-                "name": f"{student.admin.first_name} {student.admin.last_name}"
-            }
-            list_data.append(data)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, course_student_rows(course))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1347,73 +964,32 @@ def admin_get_result_data(request):
         if view_type == 'class_wise':
             subject_id = request.POST.get("subject_id")
             subject = Subject.objects.get(id=subject_id)
-            students = Student.objects.filter(course_id=course)
-
-            for student in students:
-                try:
-                    result = Student_Result.objects.get(student=student, subject=subject, exam=exam)
-                    ce = result.ce_marks
-                    te = result.te_marks
-                    total = ce + te
-                except Student_Result.DoesNotExist:
-                    ce = 0
-                    te = 0
-                    total = 0
-                
+
+            for student, marks in get_subject_results(course, subject, exam):
                 data = {
                     "name": f"{student.admin.first_name} {student.admin.last_name}",
-                    "ce_marks": ce,
-                    "te_marks": te,
-                    "total_marks": total
+                    **marks
                 }
                 list_data.append(data)
 
         elif view_type == 'student_wise':
             student_id = request.POST.get("student_id")
             student = Student.objects.get(admin__id=student_id)
-            subjects = Subject.objects.filter(course=course)
-
-            for subject in subjects:
-                try:
-                    result = Student_Result.objects.get(student=student, subject=subject, exam=exam)
-                    ce = result.ce_marks
-                    te = result.te_marks
-                    total = ce + te
-                except Student_Result.DoesNotExist:
-                    ce = 0
-                    te = 0
-                    total = 0
-                
-                data = {
-                    "subject_name": subject.name,
-                    "max_ce_marks": subject.max_ce_marks,
-                    "max_te_marks": subject.max_te_marks,
-                    "ce_marks": ce,
-                    "te_marks": te,
-                    "total_marks": total
-                }
+            rows = get_student_results(student, course, exam)[0]
+
+            for row in rows:
+                data = {key: value for key, value in row.items() if key != "percentage"}
                 list_data.append(data)
         
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, list_data)
 
     except Exception as e:
         return HttpResponse(str(e))
 
 
-def render_to_pdf(template_src, context_dict={}):
-    """Helper to render HTML to PDF"""
-    template = get_template(template_src)
-    html  = template.render(context_dict)
-    result = BytesIO()
-    pdf = pisa.pisaDocument(BytesIO(html.encode("ISO-8859-1")), result)
-    if not pdf.err:
-        return HttpResponse(result.getvalue(), content_type='application/pdf')
-    return None
-
-
 @csrf_exempt
 def generate_result_pdf(request):
-    """Generate PDF for Results"""
+    """Queue the result PDF and send the browser to its progress page"""
     if request.method != "POST":
          return HttpResponse("Method Not Allowed")
     
@@ -1423,92 +999,51 @@ def generate_result_pdf(request):
     
     try:
         course = Course.objects.get(id=course_id)
-        if exam_id:
-             exam = Examination.objects.get(id=exam_id)
-        else:
-             exam = None
-             
-        context = {
+        params = {
             'view_type': view_type,
-            'course': course,
-            'exam': exam
+            'course_id': course.id,
+            'exam_id': int(exam_id) if exam_id else None
         }
-        
-        data = []
         if view_type == 'class_wise':
-            subject_id = request.POST.get("pdf_subject_id")
-            subject = Subject.objects.get(id=subject_id)
-            students = Student.objects.filter(course_id=course)
-            
-            context['subject'] = subject
-            
-            for student in students:
-                try:
-                    result = Student_Result.objects.get(student=student, subject=subject, exam=exam)
-                    ce = result.ce_marks
-                    te = result.te_marks
-                    total = ce + te
-                except Student_Result.DoesNotExist:
-                    ce = 0
-                    te = 0
-                    total = 0
-                
-                data.append({
-                    "name": f"{student.admin.first_name} {student.admin.last_name}",
-                    "ce_marks": ce,
-                    "te_marks": te,
-                    "total_marks": total
-                })
-            context['data'] = data
-
-        elif view_type == 'student_wise':
-            student_id = request.POST.get("pdf_student_id")
-            student = Student.objects.get(admin__id=student_id)
-            subjects = Subject.objects.filter(course=course)
-            
-            context['student'] = student
-            
-            total_obtained = 0
-            total_max = 0
-            
-            for subject in subjects:
-                try:
-                    result = Student_Result.objects.get(student=student, subject=subject, exam=exam)
-                    ce = result.ce_marks
-                    te = result.te_marks
-                    total = ce + te
-                except Student_Result.DoesNotExist:
-                    ce = 0
-                    te = 0
-                    total = 0
-                
-                sub_max = subject.max_ce_marks + subject.max_te_marks
-                total_obtained += total
-                total_max += sub_max
-                
-                # Percentage for grade
-                perc = (total / sub_max * 100) if sub_max > 0 else 0
-                
-                data.append({
-                    "subject_name": subject.name,
-                    "max_ce_marks": subject.max_ce_marks,
-                    "max_te_marks": subject.max_te_marks,
-                    "ce_marks": ce,
-                    "te_marks": te,
-                    "total_marks": total,
-                    "percentage": perc
-                })
-            context['data'] = data
-            context['total_obtained'] = total_obtained
-            context['total_max'] = total_max
-            context['overall_percentage'] = (total_obtained / total_max * 100) if total_max > 0 else 0
+            subject = Subject.objects.get(id=request.POST.get("pdf_subject_id"))
+            params['subject_id'] = subject.id
+            filename = f"{course.name} - {subject.name}.pdf"
+        else:
+            student = Student.objects.select_related('admin').get(admin__id=request.POST.get("pdf_student_id"))
+            params['student_id'] = student.admin.id
+            filename = f"{student.admin.first_name} {student.admin.last_name}.pdf"
             
-        return render_to_pdf('Hod/result_pdf_template.html', context)
+        job = enqueue_pdf('result_card', params, filename, user=request.user)
+        return redirect('pdf_job_wait', token=job.token)
         
     except Exception as e:
         return HttpResponse(f"Error Generating PDF: {str(e)}")
 
 
+@hod_required
+def admin_export_class_results(request):
+    """Stream the progress cards of a whole class as one PDF or a ZIP"""
+    course_id = request.GET.get("course_id")
+    exam_id = request.GET.get("exam_id")
+    export_format = request.GET.get("format", "pdf")
+
+    try:
+        course = Course.objects.get(id=course_id)
+        exam = Examination.objects.get(id=exam_id) if exam_id else None
+    except (Course.DoesNotExist, Examination.DoesNotExist, ValueError):
+        return HttpResponse("Invalid course or examination")
+
+    filename = f"{course.name} - {exam.name if exam else 'Results'} - Progress Cards".replace('"', '')
+    if export_format == 'zip':
+        response = StreamingHttpResponse(stream_class_cards_zip(course, exam), content_type='application/zip')
+        filename += ".zip"
+    else:
+        response = StreamingHttpResponse(stream_class_cards_pdf(course, exam), content_type='application/pdf')
+        filename += ".pdf"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @hod_required
 def admin_view_student_leave(request):
     """View Pending Student Leave Requests"""
@@ -1542,57 +1077,25 @@ def admin_analyze_result(request):
                 if subject_type_id:
                      subjects = subjects.filter(subject_type__id=subject_type_id)
                 
-                subject_labels = []
-                pass_percentages = []
-                avg_marks = []
-                
                 if exam_id:
                      exam = Examination.objects.get(id=exam_id)
                 else:
                      exam = None
 
-                for subject in subjects:
-                    if exam:
-                        results = Student_Result.objects.filter(subject=subject, exam=exam)
-                    else:
-                        results = Student_Result.objects.filter(subject=subject)
-                        
-                    total_students = results.count()
-                    
-                    if total_students >= 0: # Show even if 0 to maintain chart structure if needed, or filter? Let's keep it.
-                        passed = 0
-                        total_score = 0
-                        max_score_sum = 0
-                        
-                        if total_students > 0:
-                            for res in results:
-                                 total = res.ce_marks + res.te_marks
-                                 sub_max = subject.max_ce_marks + subject.max_te_marks
-                                 if sub_max > 0 and (total/sub_max)*100 >= 40:
-                                     passed += 1
-                                 
-                                 total_score += total
-                                 max_score_sum += sub_max
-                            
-                            pass_perc = (passed / total_students) * 100
-                            avg_perc = (total_score / max_score_sum * 100) if max_score_sum > 0 else 0
-                        else:
-                            pass_perc = 0
-                            avg_perc = 0
-                        
-                        subject_labels.append(subject.name)
-                        pass_percentages.append(round(pass_perc, 2))
-                        avg_marks.append(round(avg_perc, 2))
+                stats = analyze_subjects(subjects, exam)
+                subject_labels = [row["subject_name"] for row in stats]
+                pass_percentages = [row["pass_percentage"] for row in stats]
+                avg_marks = [row["avg_percentage"] for row in stats]
                     
                 data = {
                     "labels": subject_labels,
                     "pass_percentages": pass_percentages,
                     "avg_marks": avg_marks
                 }
-                return JsonResponse(json.dumps(data), content_type="application/json", safe=False)
+                return json_response(request, data)
                 
             except Exception as e:
-                return JsonResponse({'error': str(e)}, status=500)
+                return json_response(request, {'error': str(e)}, status=500)
                 
     courses = Course.objects.all()
     exams = Examination.objects.all()
@@ -1605,6 +1108,36 @@ def admin_analyze_result(request):
     return render(request, "Hod/analyze_result.html", context)
 
 
+@csrf_exempt
+def admin_exam_summary(request):
+    """Exam summary for a course: statistics per subject and overall (AJAX)"""
+    if request.method != "POST":
+         return HttpResponse("Method Not Allowed")
+
+    course_id = request.POST.get("course_id")
+    exam_id = request.POST.get("exam_id")
+    subject_type_id = request.POST.get("subject_type_id")
+
+    try:
+        course = Course.objects.get(id=course_id)
+        subjects = Subject.objects.filter(course=course).order_by('id')
+        if subject_type_id:
+             subjects = subjects.filter(subject_type__id=subject_type_id)
+
+        if exam_id:
+             exam = Examination.objects.get(id=exam_id)
+        else:
+             exam = None
+
+        data = exam_summary(subjects, exam)
+        data["course_name"] = course.name
+        data["exam_name"] = exam.name if exam else "All Examinations"
+        data["grade_labels"] = GRADE_LABELS
+        return json_response(request, data)
+    except Exception as e:
+        return HttpResponse(str(e))
+
+
 @csrf_exempt
 def admin_approve_student_leave(request, leave_id):
     """Approve Student Leave"""
@@ -1653,17 +1186,7 @@ def admin_get_students_attendance(request):
     
     try:
         course = Course.objects.get(id=course_id)
-        students = Student.objects.filter(course_id=course)
-        
-        list_data = []
-        for student in students:
-            data_small = {
-                "id": student.admin.id, 
-                "name": student.admin.first_name + " " + student.admin.last_name
-            }
-            list_data.append(data_small)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, course_student_rows(course))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1680,29 +1203,9 @@ def admin_save_attendance_data(request):
     try:
         course = Course.objects.get(id=course_id)
         
-        # Save Attendance Record
-        attendance = Attendance(
-            course=course,
-            attendance_date=attendance_date
-        )
-        attendance.save()
-        
-        # Save Student Attendance Reports
+        # Save Attendance Record and Student Attendance Reports
         json_student_ids = json.loads(student_ids)
-        for stud_dict in json_student_ids:
-            student_id = stud_dict['id']
-            status = stud_dict['status'] 
-            leave_status = stud_dict.get('leave_status', '')
-            
-            student = Student.objects.get(admin_id=student_id)
-            
-            attendance_report = Attendance_Report(
-                student=student,
-                attendance=attendance,
-                is_present=bool(status),
-                leave_status=leave_status
-            )
-            attendance_report.save()
+        save_attendance_sheet(course, attendance_date, json_student_ids)
             
         return HttpResponse("OK")
     except Exception as e:
@@ -1728,17 +1231,7 @@ def admin_get_attendance_dates(request):
     try:
         course = Course.objects.get(id=course_id)
         
-        attendance_objects = Attendance.objects.filter(course=course)
-        
-        list_data = []
-        for attendance in attendance_objects:
-            data_small = {
-                "id": attendance.id,
-                "attendance_date": str(attendance.attendance_date),
-            }
-            list_data.append(data_small)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, attendance_dates(course))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1753,19 +1246,7 @@ def admin_get_attendance_student(request):
     
     try:
         attendance = Attendance.objects.get(id=attendance_id)
-        attendance_data = Attendance_Report.objects.filter(attendance=attendance)
-        
-        list_data = []
-        for student_data in attendance_data:
-            data_small = {
-                "id": student_data.student.admin.id,
-                "name": student_data.student.admin.first_name + " " + student_data.student.admin.last_name,
-                "status": 1 if student_data.is_present else 0,
-                "leave_status": student_data.leave_status if student_data.leave_status else ''
-            }
-            list_data.append(data_small)
-            
-        return JsonResponse(json.dumps(list_data), content_type="application/json", safe=False)
+        return json_response(request, attendance_sheet_rows(attendance))
     except Exception as e:
         return HttpResponse(str(e))
 
@@ -1781,21 +1262,9 @@ def admin_save_updateattendance_data(request):
     
     try:
         attendance = Attendance.objects.get(id=attendance_id)
-        attendance.attendance_date = attendance_date
-        attendance.save()
         
         json_student_ids = json.loads(student_ids)
-        for stud_dict in json_student_ids:
-            student_id = stud_dict['id']
-            status = stud_dict['status']
-            leave_status = stud_dict.get('leave_status', '')
-            
-            student = Student.objects.get(admin_id=student_id)
-            
-            attendance_report = Attendance_Report.objects.get(student=student, attendance=attendance)
-            attendance_report.is_present = bool(status)
-            attendance_report.leave_status = leave_status
-            attendance_report.save()
+        update_attendance_sheet(attendance, attendance_date, json_student_ids)
             
         return HttpResponse("OK")
     except Exception as e:
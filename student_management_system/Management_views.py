@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from hadiya.kpis import dashboard_kpis
 
 def management_required(view_func):
     """Decorator to ensure only Management can access views"""
@@ -16,6 +17,7 @@ def management_required(view_func):
 def management_dashboard(request):
     """Management Dashboard"""
     context = {
+        'kpis': dashboard_kpis(),
         'page_title': 'Management Dashboard'
     }
     return render(request, 'Management/home.html', context)
@@ -1,31 +1,33 @@
 from django.shortcuts import render, redirect
 from django.contrib import messages
-from hadiya.models import CustomUser, Student, Course, Subject, Attendance, Attendance_Report, Student_Feedback, Student_leave, Student_Result
+from hadiya.models import CustomUser, Student, Course, Subject, Attendance, Attendance_Report, AttendanceSummary, Student_Feedback, Student_leave, Student_Result, Examination
+from hadiya.result_analytics import grade_for
+from django.db.models import Sum
 from django.contrib.auth.decorators import login_required
-from student_management_system.Hod_views import render_to_pdf
+from hadiya.pdf_jobs import enqueue_pdf
 import datetime
 import json
 
 def student_home(request):
     """Student Dashboard"""
-    student_obj = Student.objects.get(admin=request.user.id)
-    attendance_total = Attendance_Report.objects.filter(student=student_obj).count()
-    attendance_present = Attendance_Report.objects.filter(student=student_obj, is_present=True).count()
-    attendance_absent = Attendance_Report.objects.filter(student=student_obj, is_present=False).count()
+    student_obj = request.profile
+    
+    # Monthly rollup instead of counting raw Attendance_Report rows
+    attendance_counts = AttendanceSummary.objects.filter(student=student_obj).aggregate(
+        present=Sum('present_count'),
+        absent=Sum('absent_count')
+    )
+    attendance_present = attendance_counts['present'] or 0
+    attendance_absent = attendance_counts['absent'] or 0
+    attendance_total = attendance_present + attendance_absent
     
     course = student_obj.course_id # Corrected field name from course to course_id based on models.py
     subjects = Subject.objects.filter(course=course).count()
     
+    # Logic for subject wise attendance is limited by model design, as discussed.
     subject_name = []
     data_present = []
     data_absent = []
-    subject_data = Subject.objects.filter(course=course)
-    
-    for subject in subject_data:
-        attendance = Attendance.objects.filter(course=course)
-        attendance_present_count = Attendance_Report.objects.filter(attendance__in=attendance, is_present=True, student=student_obj, attendance__course=course).count()
-        # Logic for subject wise attendance is limited by model design, as discussed.
-        pass
 
     context={
         "attendance_total": attendance_total,
@@ -40,7 +42,7 @@ def student_home(request):
 
 def student_view_attendance(request):
     """View Attendance History"""
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     course = student.course_id
     subjects = Subject.objects.filter(course=course)
     
@@ -62,7 +64,7 @@ def student_view_attendance_post(request):
     month = request.POST.get('month')
     year = request.POST.get('year')
 
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     subjects = Subject.objects.filter(course=student.course_id)
     subject = None
     if subject_id:
@@ -100,7 +102,7 @@ def student_view_attendance_post(request):
 
 def student_apply_leave(request):
     """Apply for Leave"""
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     leave_data = Student_leave.objects.filter(student=student).order_by('-id')
     context = {
         "leave_data": leave_data
@@ -115,7 +117,7 @@ def student_apply_leave_save(request):
     leave_date = request.POST.get('leave_date')
     leave_msg = request.POST.get('leave_msg')
     
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     
     leave_report = Student_leave(student=student, leave_date=leave_date, leave_message=leave_msg, status=0)
     leave_report.save()
@@ -124,7 +126,7 @@ def student_apply_leave_save(request):
 
 def student_feedback(request):
     """Send Feedback"""
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     feedback_data = Student_Feedback.objects.filter(student=student).order_by('-id')
     context = {
         "feedback_data": feedback_data
@@ -138,7 +140,7 @@ def student_feedback_save(request):
     
     feedback_msg = request.POST.get('feedback_msg')
     
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     feedback = Student_Feedback(student=student, feedback=feedback_msg, feedback_reply="")
     feedback.save()
     messages.success(request, "Feedback Sent Successfully")
@@ -147,7 +149,7 @@ def student_feedback_save(request):
 
 def student_view_result(request):
     """View Student Results"""
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     student_result = Student_Result.objects.filter(student=student)
     
     # Calculate Totals and Grading
@@ -165,14 +167,7 @@ def student_view_result(request):
         total_max += sub_max
         
         perc = (total / sub_max * 100) if sub_max > 0 else 0
-        grade = ''
-        if perc >= 90: grade = 'A+'
-        elif perc >= 80: grade = 'A'
-        elif perc >= 70: grade = 'B+'
-        elif perc >= 60: grade = 'B'
-        elif perc >= 50: grade = 'C+'
-        elif perc >= 40: grade = 'C'
-        else: grade = 'D'
+        grade = grade_for(perc)
 
         processed_results.append({
             'subject': result.subject,
@@ -189,60 +184,25 @@ def student_view_result(request):
         "student_result": processed_results,
         "total_obtained": total_obtained, 
         "total_max": total_max,
-        "overall_percentage": overall_percentage
+        "overall_percentage": overall_percentage,
+        # One progress card per exam the student has marks in
+        "exams": Examination.objects.filter(student_result__student=student).distinct().order_by('id'),
+        "has_results_without_exam": student_result.filter(exam__isnull=True).exists()
     }
     return render(request, "Student/view_result.html", context)
 
 
 def student_download_result_pdf(request):
-    """Download Student Progress Card PDF"""
-    student = Student.objects.get(admin=request.user.id)
-    student_result = Student_Result.objects.filter(student=student)
-    course = student.course_id
-    subjects = Subject.objects.filter(course=course)
-    
-    context = {
-        'view_type': 'student_wise',
-        'student': student,
-        'course': course
-    }
-    
-    total_obtained = 0
-    total_max = 0
-    data = []
-    
-    for subject in subjects:
-        try:
-            result = Student_Result.objects.get(student=student, subject=subject)
-            ce = result.ce_marks
-            te = result.te_marks
-            total = ce + te
-        except Student_Result.DoesNotExist:
-            ce = 0
-            te = 0
-            total = 0
-        
-        sub_max = subject.max_ce_marks + subject.max_te_marks
-        total_obtained += total
-        total_max += sub_max
-        
-        perc = (total / sub_max * 100) if sub_max > 0 else 0
-        
-        data.append({
-            "subject_name": subject.name,
-            "max_ce_marks": subject.max_ce_marks,
-            "max_te_marks": subject.max_te_marks,
-            "ce_marks": ce,
-            "te_marks": te,
-            "total_marks": total,
-            "percentage": perc
-        })
-    
-    context['data'] = data
-    context['total_max'] = total_max
-    context['overall_percentage'] = (total_obtained / total_max * 100) if total_max > 0 else 0
-            
-    return render_to_pdf('Hod/result_pdf_template.html', context)
+    """Queue the student's Progress Card PDF and show its progress page"""
+    student = request.profile
+    exam_id = request.GET.get('exam_id', '')
+    exam = Examination.objects.filter(id=exam_id).first() if exam_id.isdigit() else None
+    filename = f"{student.admin.first_name} {student.admin.last_name} - Progress Card"
+    if exam:
+        filename += f" - {exam.name}"
+    params = {'student_id': student.id, 'exam_id': exam.id if exam else None}
+    job = enqueue_pdf('student_card', params, filename + ".pdf", user=request.user)
+    return redirect('pdf_job_wait', token=job.token)
     
     
 # --- Fee Management (Student Side) ---
@@ -251,7 +211,7 @@ def student_view_fees(request):
     """View My Fees and Payments"""
     from hadiya.models import StudentInvoice, FeePayment
     
-    student = Student.objects.get(admin=request.user.id)
+    student = request.profile
     invoices = StudentInvoice.objects.filter(student=student).order_by('-created_at')
     payments = FeePayment.objects.filter(student=student).order_by('-created_at')
     
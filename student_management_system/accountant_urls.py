@@ -19,6 +19,7 @@ urlpatterns = [
     # Fee Collection
     path('generate_invoice/', Accountant_views.generate_invoice, name='generate_invoice'),
     path('fee_collection/', Accountant_views.fee_collection, name='fee_collection'),
+    path('student_search/', Accountant_views.student_search, name='student_search'),
     path('print_invoice/<int:payment_id>/', Accountant_views.print_invoice, name='print_invoice'),
     
     # Expenses
@@ -33,5 +34,7 @@ urlpatterns = [
     # Reports
     path('daily_collection_report/', Accountant_views.daily_collection_report, name='daily_collection_report'),
     path('expense_reports/', Accountant_views.expense_reports, name='expense_reports'),
+    path('cash_flow_report/', Accountant_views.cash_flow_report, name='cash_flow_report'),
     path('outstanding_fees_report/', Accountant_views.outstanding_fees_report, name='outstanding_fees_report'),
+    path('outstanding_fees_report/export/', Accountant_views.export_outstanding_fees, name='export_outstanding_fees'),
 ]
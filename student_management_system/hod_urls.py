@@ -4,6 +4,8 @@ from student_management_system import Hod_views
 urlpatterns = [
     # Dashboard
     path('', Hod_views.dashboard, name='hod_dashboard'),
+    path('dashboard/cache_stats/', Hod_views.dashboard_cache_stats, name='dashboard_cache_stats'),
+    path('access_denials/', Hod_views.access_denials, name='access_denials'),
     
     # Student Management
     path('students/', Hod_views.view_students, name='view_students'),
@@ -52,6 +54,9 @@ urlpatterns = [
     path('admin_get_student_attendance_data/', Hod_views.admin_get_student_attendance_data, name='admin_get_student_attendance_data'),
     path('admin_analyze_attendance/', Hod_views.admin_analyze_attendance, name='admin_analyze_attendance'),
     path('download_sample_file/<str:file_type>/', Hod_views.download_sample_file, name='download_sample_file'),
+    path('imports/<uuid:token>/', Hod_views.import_job_detail, name='import_job_detail'),
+    path('imports/<uuid:token>/status/', Hod_views.import_job_status, name='import_job_status'),
+    path('imports/<uuid:token>/errors/', Hod_views.download_import_errors, name='download_import_errors'),
     
     # Result Management
     path('results/add/', Hod_views.add_result, name='add_result'),
@@ -69,7 +74,9 @@ urlpatterns = [
     path('admin_save_student_result/', Hod_views.admin_save_student_result, name='admin_save_student_result'),
     path('admin_get_result_data/', Hod_views.admin_get_result_data, name='admin_get_result_data'),
     path('generate_result_pdf/', Hod_views.generate_result_pdf, name='generate_result_pdf'),
+    path('results/export_class/', Hod_views.admin_export_class_results, name='admin_export_class_results'),
     path('results/analyze/', Hod_views.admin_analyze_result, name='admin_analyze_result'),
+    path('results/exam_summary/', Hod_views.admin_exam_summary, name='admin_exam_summary'),
     
     # Leave Management
     path('student/leave/', Hod_views.admin_view_student_leave, name='admin_view_student_leave'),
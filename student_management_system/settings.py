@@ -49,6 +49,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'hadiya.middleware.ProfileMiddleware',
+    'hadiya.middleware.AccessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -80,6 +82,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock when a transaction starts, so concurrent
+            # fee collections wait for each other instead of failing with
+            # "database is locked" (SQLite ignores select_for_update)
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -126,6 +135,37 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Background PDF jobs (result cards). Run `python manage.py run_pdf_worker`
+# next to the web server; with PDF_JOBS_ASYNC = False PDFs render in-request.
+PDF_JOBS_ASYNC = True
+PDF_WORKERS = 2
+# Rendered PDFs are cached under MEDIA_ROOT/pdf_cache up to this size
+PDF_CACHE_MAX_BYTES = 500 * 1024 * 1024
+# Processes hashing passwords in bulk imports, None for every core
+PASSWORD_HASH_WORKERS = None
+# Excel uploads run as background jobs. Run `python manage.py run_import_worker`
+# next to the web server; with IMPORT_JOBS_ASYNC = False they import in-request.
+IMPORT_JOBS_ASYNC = True
+
+# Cached dashboard statistics. Local memory is per process: with several
+# web workers use a shared cache so they see the same invalidations, e.g.
+# 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+# 'LOCATION': 'redis://127.0.0.1:6379',
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'school-erp',
+    }
+}
+# Seconds the HOD dashboard statistics are kept if no signal clears them first
+DASHBOARD_STATS_TIMEOUT = 3600
+# Seconds the Accountant/Management dashboard figures are reused
+KPI_CACHE_TIMEOUT = 300
+# Seconds a user's Staff/Student/... profile is reused across requests
+PROFILE_CACHE_TIMEOUT = 60
+# AJAX JSON bodies of at least this many bytes are gzipped
+JSON_GZIP_MIN_LENGTH = 4096
+
 # Custom User Model
 AUTH_USER_MODEL = 'hadiya.CustomUser'
 
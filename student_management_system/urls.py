@@ -25,6 +25,9 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('login/', views.login_page, name='login'),
     path('logout/', views.logout_user, name='logout'),
+    path('pdf/<uuid:token>/', views.pdf_job_wait, name='pdf_job_wait'),
+    path('pdf/<uuid:token>/status/', views.pdf_job_status, name='pdf_job_status'),
+    path('pdf/<uuid:token>/download/', views.pdf_job_download, name='pdf_job_download'),
     
     # Module URLs
     # Module URLs